@@ -1,18 +1,27 @@
+import asyncio
 import logging
 import os
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
 
 from fastapi import FastAPI
 from fastapi_problem.handler import add_exception_handler
+from infini_gram_processor.index_mappings import AvailableInfiniGramIndexId
 from infini_gram_processor.infini_gram_engine_exception import InfiniGramEngineException
+from infini_gram_processor.processor_registry import processor_registry
 from infinigram_api_shared.otel.otel_setup import set_up_tracing
 from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
 from opentelemetry.instrumentation.logging import LoggingInstrumentor
 from src import glog
 from src.attribution import attribution_router
+from src.attribution.attribution_queue_monitor import attribution_queue_monitor
 from src.config import get_config
-from src.health import health_router
+from src.count import count_router
+from src.documents import documents_router
+from src.health import health_router, readiness
 from src.infini_gram_exception_handler import infini_gram_engine_exception_handler
 from src.infinigram import infinigram_router
+from src.infinigram.index_warmup import warm_up_indexes_before_ready
 
 LoggingInstrumentor().instrument()
 
@@ -23,7 +32,32 @@ level = os.environ.get("LOG_LEVEL", default=logging.INFO)
 logging.basicConfig(level=level, handlers=handlers)
 
 
-app = FastAPI(title="infini-gram API", version="0.0.1")
+@asynccontextmanager
+async def lifespan(app: FastAPI) -> AsyncIterator[None]:
+    config = get_config()
+
+    if config.is_warmup_enabled:
+        # /health reports unavailable until the warm-up finishes
+        readiness.clear()
+        # Keep a reference to the task so it isn't garbage collected
+        app.state.warmup_task = asyncio.create_task(
+            warm_up_indexes_before_ready(config)
+        )
+    elif config.preload_indexes:
+        # Building the processors is blocking, so keep it off the event loop
+        await asyncio.to_thread(processor_registry.load, AvailableInfiniGramIndexId)
+
+    # Admission control and the autoscaling gauges read queue stats that this keeps up to date
+    queue_monitor_task = asyncio.create_task(
+        attribution_queue_monitor.run(config.queue_stats_refresh_seconds)
+    )
+
+    yield
+
+    queue_monitor_task.cancel()
+
+
+app = FastAPI(title="infini-gram API", version="0.0.1", lifespan=lifespan)
 add_exception_handler(
     app,
     handlers={InfiniGramEngineException: infini_gram_engine_exception_handler},  # type: ignore
@@ -32,6 +66,8 @@ add_exception_handler(
 app.include_router(health_router)
 app.include_router(router=infinigram_router)
 app.include_router(router=attribution_router)
+app.include_router(router=count_router)
+app.include_router(router=documents_router)
 
 config = get_config()
 
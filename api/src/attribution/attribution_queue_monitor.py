@@ -0,0 +1,117 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from typing import Awaitable, Iterable, cast
+
+from infini_gram_processor.index_mappings import AvailableInfiniGramIndexId
+from infinigram_api_shared.saq.queue_utils import AttributionPriority
+from opentelemetry import metrics
+from opentelemetry.metrics import CallbackOptions, Observation
+from saq import Queue
+from saq.queue.redis import RedisQueue
+from saq.utils import now, seconds
+
+from src.attribution.attribution_queue_service import get_queue
+from src.config import get_config
+
+meter = metrics.get_meter(get_config().application_name)
+logger = logging.getLogger("uvicorn.error")
+
+
+@dataclass
+class QueueStats:
+    depth: int
+    oldest_job_age_seconds: float
+
+
+async def get_queue_stats(queue: Queue) -> QueueStats:
+    depth = await queue.count("queued")
+
+    oldest_job_age_seconds = 0.0
+    # SAQ doesn't expose job ages, but its Redis queue pushes onto the right of a list and dequeues from the left
+    if depth > 0 and isinstance(queue, RedisQueue):
+        # redis-py types lindex as possibly sync, but it's always awaitable on the asyncio client
+        oldest_job_id = await cast(
+            Awaitable[bytes | None], queue.redis.lindex(queue.namespace("queued"), 0)
+        )
+        oldest_job_bytes = (
+            await queue.redis.get(oldest_job_id) if oldest_job_id is not None else None
+        )
+        oldest_job = (
+            queue.deserialize(oldest_job_bytes)
+            if oldest_job_bytes is not None
+            else None
+        )
+        if oldest_job is not None:
+            oldest_job_age_seconds = seconds(now() - oldest_job.queued)
+
+    return QueueStats(depth=depth, oldest_job_age_seconds=oldest_job_age_seconds)
+
+
+class AttributionQueueMonitor:
+    """
+    Keeps recent depth and age stats for every attribution queue.
+
+    Admission control reads these on every request, so they're refreshed in the background instead of asking Redis each time.
+    """
+
+    def __init__(self) -> None:
+        self._stats: dict[
+            tuple[AvailableInfiniGramIndexId, AttributionPriority], QueueStats
+        ] = {}
+
+    def get_stats(
+        self, index: AvailableInfiniGramIndexId, priority: AttributionPriority
+    ) -> QueueStats | None:
+        return self._stats.get((index, priority))
+
+    async def refresh(self) -> None:
+        for index in AvailableInfiniGramIndexId:
+            for priority in AttributionPriority:
+                self._stats[(index, priority)] = await get_queue_stats(
+                    get_queue(index, priority)
+                )
+
+    async def run(self, refresh_interval_seconds: float) -> None:
+        while True:
+            try:
+                await self.refresh()
+            except Exception:
+                logger.warning(
+                    "Failed to refresh attribution queue stats", exc_info=True
+                )
+
+            await asyncio.sleep(refresh_interval_seconds)
+
+    def observe_depth(self, options: CallbackOptions) -> Iterable[Observation]:
+        return [
+            Observation(
+                stats.depth,
+                attributes={"index": index.value, "priority": priority.value},
+            )
+            for (index, priority), stats in self._stats.items()
+        ]
+
+    def observe_oldest_job_age(self, options: CallbackOptions) -> Iterable[Observation]:
+        return [
+            Observation(
+                stats.oldest_job_age_seconds,
+                attributes={"index": index.value, "priority": priority.value},
+            )
+            for (index, priority), stats in self._stats.items()
+        ]
+
+
+attribution_queue_monitor = AttributionQueueMonitor()
+
+meter.create_observable_gauge(
+    "attribution_queue.depth",
+    callbacks=[attribution_queue_monitor.observe_depth],
+    description="Attribution jobs waiting in the queue for a worker",
+)
+meter.create_observable_gauge(
+    "attribution_queue.oldest_job_age",
+    callbacks=[attribution_queue_monitor.observe_oldest_job_age],
+    unit="s",
+    description="How long the oldest job in the attribution queue has been waiting",
+)
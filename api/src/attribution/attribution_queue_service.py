@@ -1,8 +1,22 @@
-from typing import Any
+import json
+import logging
+import time
+from typing import Any, AsyncIterator
 
 from infini_gram_processor.index_mappings import AvailableInfiniGramIndexId
+from infinigram_api_shared.saq.attribution_deadlines import (
+    extend_attribution_job_deadline,
+)
+from infinigram_api_shared.saq.attribution_events import (
+    ATTRIBUTION_EVENT_DATA_FIELD,
+    ATTRIBUTION_EVENT_NAME_FIELD,
+    AttributionEvent,
+    get_attribution_event_stream_key,
+)
 from infinigram_api_shared.saq.queue_constants import TASK_NAME_KEY, TASK_TAG_KEY
 from infinigram_api_shared.saq.queue_utils import (
+    AttributionPriority,
+    get_attribute_batch_job_name_for_index,
     get_attribute_job_name_for_index,
     get_queue_for_index,
 )
@@ -10,26 +24,43 @@ from opentelemetry import trace
 from opentelemetry.semconv.trace import SpanAttributes
 from opentelemetry.trace import SpanKind
 from opentelemetry.trace.propagation.tracecontext import TraceContextTextMapPropagator
-from saq import Queue
+from saq import Job, Queue, Status
+from saq.queue.redis import RedisQueue
 
-from src.attribution.attribution_request import AttributionRequest
+from src.attribution.attribution_request import (
+    AttributionBatchRequest,
+    AttributionOptions,
+    AttributionRequest,
+)
 from src.config import get_config
 
 
-def get_queue(index_id: AvailableInfiniGramIndexId) -> Queue:
+def get_queue(
+    index_id: AvailableInfiniGramIndexId,
+    priority: AttributionPriority = AttributionPriority.INTERACTIVE,
+) -> Queue:
     config = get_config()
     return get_queue_for_index(
         queue_url=config.attribution_queue_url,
         base_queue_name=config.attribution_queue_name,
         index_id=index_id,
+        priority=priority,
     )
 
 
 tracer = trace.get_tracer(get_config().application_name)
+logger = logging.getLogger("uvicorn.error")
+
+# Documents events come one per span, so this lets a whole job's worth come back in one read
+_EVENT_READ_COUNT = 256
 
 
 async def publish_attribution_job(
-    index: AvailableInfiniGramIndexId, request: AttributionRequest, job_key: str
+    index: AvailableInfiniGramIndexId,
+    request: AttributionRequest,
+    job_key: str,
+    priority: AttributionPriority,
+    timeout_seconds: float,
 ) -> Any:
     with tracer.start_as_current_span(
         "attribution_queue_service/publish_attribution_job",
@@ -40,35 +71,237 @@ async def publish_attribution_job(
             TASK_TAG_KEY: "apply_async",
             SpanAttributes.MESSAGING_SYSTEM: "saq",
             "index": index.value,
+            "priority": priority.value,
         },
     ):
         otel_context: dict[str, Any] = {}
         TraceContextTextMapPropagator().inject(otel_context)
 
-        return await get_queue(index).apply(
+        return await _apply_shared_job(
+            get_queue(index, priority),
             get_attribute_job_name_for_index(index),
-            timeout=90,
-            key=job_key,
-            index=index.value,
+            job_key=job_key,
+            timeout_seconds=timeout_seconds,
             input=request.response,
-            delimiters=request.delimiters,
-            allow_spans_with_partial_words=request.allow_spans_with_partial_words,
-            minimum_span_length=request.minimum_span_length,
-            maximum_frequency=request.maximum_frequency,
-            maximum_span_density=request.maximum_span_density,
-            span_ranking_method=request.span_ranking_method,
-            maximum_context_length=request.maximum_context_length,
-            maximum_context_length_long=request.maximum_context_length_long,
-            maximum_context_length_snippet=request.maximum_context_length_snippet,
-            maximum_documents_per_span=request.maximum_documents_per_span,
-            otel_context=otel_context,
+            **_get_attribution_job_kwargs(
+                index, request, otel_context, timeout_seconds=timeout_seconds
+            ),
+        )
+
+
+async def publish_attribution_batch_job(
+    index: AvailableInfiniGramIndexId,
+    request: AttributionBatchRequest,
+    job_key: str,
+    priority: AttributionPriority,
+    timeout_seconds: float,
+) -> Any:
+    with tracer.start_as_current_span(
+        "attribution_queue_service/publish_attribution_batch_job",
+        kind=SpanKind.PRODUCER,
+        attributes={
+            TASK_NAME_KEY: "attribute_batch",
+            SpanAttributes.MESSAGING_MESSAGE_ID: job_key,
+            TASK_TAG_KEY: "apply_async",
+            SpanAttributes.MESSAGING_SYSTEM: "saq",
+            "index": index.value,
+            "priority": priority.value,
+            "input_count": len(request.responses),
+        },
+    ):
+        otel_context: dict[str, Any] = {}
+        TraceContextTextMapPropagator().inject(otel_context)
+
+        return await _apply_shared_job(
+            get_queue(index, priority),
+            get_attribute_batch_job_name_for_index(index),
+            job_key=job_key,
+            timeout_seconds=timeout_seconds,
+            inputs=request.responses,
+            **_get_attribution_job_kwargs(
+                index, request, otel_context, timeout_seconds=timeout_seconds
+            ),
+        )
+
+
+def _get_job_run_timeout_seconds() -> float:
+    # Callers that join a job later may wait longer than the one that enqueued it,
+    # so SAQ gets the longest timeout any caller can have and the job's deadline decides when it stops
+    return get_config().attribution_job_timeout_seconds
+
+
+async def _extend_job_deadline(queue: Queue, job_key: str, deadline: float) -> None:
+    """
+    Pushes the job's deadline out to ours in case we're joining a job another caller enqueued with a shorter timeout.
+    """
+    if not isinstance(queue, RedisQueue):
+        return
+
+    try:
+        await extend_attribution_job_deadline(
+            queue.redis, queue.name, job_key, deadline=deadline
+        )
+    except Exception:
+        # The worker falls back to the deadline of whoever enqueued the job
+        logger.warning(
+            "Failed to extend attribution job deadline",
+            extra={"job_key": job_key},
+            exc_info=True,
+        )
+
+
+async def _apply_shared_job(
+    queue: Queue,
+    job_name: str,
+    job_key: str,
+    timeout_seconds: float,
+    **job_kwargs: Any,
+) -> Any:
+    """
+    Enqueues a job, or joins the one already in flight under job_key, and waits up to timeout_seconds for its result.
+    """
+    await _extend_job_deadline(queue, job_key, deadline=job_kwargs["deadline"])
+
+    results = await queue.map(
+        job_name,
+        iter_kwargs=[
+            {"key": job_key, "timeout": _get_job_run_timeout_seconds(), **job_kwargs}
+        ],
+        timeout=timeout_seconds,
+    )
+    return results[0]
+
+
+async def enqueue_streaming_attribution_job(
+    index: AvailableInfiniGramIndexId,
+    request: AttributionRequest,
+    job_key: str,
+    priority: AttributionPriority,
+    timeout_seconds: float,
+) -> Job:
+    """
+    Enqueues a job that publishes its partial results as it goes, or returns the job already running under job_key.
+    """
+    with tracer.start_as_current_span(
+        "attribution_queue_service/enqueue_streaming_attribution_job",
+        kind=SpanKind.PRODUCER,
+        attributes={
+            TASK_NAME_KEY: "attribute",
+            SpanAttributes.MESSAGING_MESSAGE_ID: job_key,
+            TASK_TAG_KEY: "enqueue",
+            SpanAttributes.MESSAGING_SYSTEM: "saq",
+            "index": index.value,
+            "priority": priority.value,
+        },
+    ):
+        otel_context: dict[str, Any] = {}
+        TraceContextTextMapPropagator().inject(otel_context)
+
+        queue = get_queue(index, priority)
+        job_kwargs = _get_attribution_job_kwargs(
+            index, request, otel_context, timeout_seconds=timeout_seconds
         )
+        await _extend_job_deadline(queue, job_key, deadline=job_kwargs["deadline"])
+
+        # The job can finish and be swept between a failed enqueue and looking it up, so we give enqueuing a second try
+        for _ in range(2):
+            job = await queue.enqueue(
+                get_attribute_job_name_for_index(index),
+                timeout=_get_job_run_timeout_seconds(),
+                key=job_key,
+                stream_events=True,
+                input=request.response,
+                **job_kwargs,
+            )
+            if job is None:
+                # SAQ doesn't enqueue a job whose key is already in flight, so we join that job instead
+                job = await queue.job(job_key)
+
+            if job is not None:
+                return job
+
+        raise Exception(f"Failed to enqueue streaming attribution job {job_key}")
+
+
+async def read_attribution_events(
+    job: Job, timeout_seconds: float
+) -> AsyncIterator[tuple[AttributionEvent, bytes]]:
+    """
+    Yields the events a streaming job publishes until it's done or failed.
+
+    Raises TimeoutError if the job doesn't finish within timeout_seconds.
+    """
+    # A job we joined may have already finished, and its events may have expired before its result did
+    if job.status == Status.COMPLETE:
+        yield AttributionEvent.DONE, job.result.encode("utf-8")
+        return
+    if job.status in (Status.FAILED, Status.ABORTED):
+        yield AttributionEvent.ERROR, json.dumps({"reason": job.status.value}).encode()
+        return
+
+    if not isinstance(job.queue, RedisQueue):
+        raise Exception("Attribution events can only be streamed through Redis queues")
+
+    redis = job.queue.redis
+    stream_key = get_attribution_event_stream_key(job.key, job.queued)
+    deadline = time.monotonic() + timeout_seconds
+    # Reading from the start of the stream picks up anything published before we joined
+    last_event_id: bytes | str = "0"
+
+    while True:
+        remaining_seconds = deadline - time.monotonic()
+        if remaining_seconds <= 0:
+            raise TimeoutError()
+
+        streams = await redis.xread(
+            {stream_key: last_event_id},
+            block=max(int(remaining_seconds * 1000), 1),
+            count=_EVENT_READ_COUNT,
+        )
+
+        for _, entries in streams:
+            for event_id, fields in entries:
+                last_event_id = event_id
+                event = AttributionEvent(
+                    fields[ATTRIBUTION_EVENT_NAME_FIELD.encode()].decode()
+                )
+                yield event, fields[ATTRIBUTION_EVENT_DATA_FIELD.encode()]
+
+                if event in (AttributionEvent.DONE, AttributionEvent.ERROR):
+                    return
+
+
+def _get_attribution_job_kwargs(
+    index: AvailableInfiniGramIndexId,
+    request: AttributionOptions,
+    otel_context: dict[str, Any],
+    timeout_seconds: float,
+) -> dict[str, Any]:
+    return {
+        "index": index.value,
+        "delimiters": request.delimiters,
+        "allow_spans_with_partial_words": request.allow_spans_with_partial_words,
+        "minimum_span_length": request.minimum_span_length,
+        "maximum_frequency": request.maximum_frequency,
+        "maximum_span_density": request.maximum_span_density,
+        "span_ranking_method": request.span_ranking_method,
+        "maximum_context_length": request.maximum_context_length,
+        "maximum_context_length_long": request.maximum_context_length_long,
+        "maximum_context_length_snippet": request.maximum_context_length_snippet,
+        "maximum_documents_per_span": request.maximum_documents_per_span,
+        "metadata_fields": request.metadata_fields,
+        "include": request.include,
+        "otel_context": otel_context,
+        # An absolute deadline lets the worker drop the job if it only gets to it after we've stopped waiting
+        "deadline": time.time() + timeout_seconds,
+    }
 
 
 async def abort_attribution_job(
-    job_key: str, index: AvailableInfiniGramIndexId
+    job_key: str, index: AvailableInfiniGramIndexId, priority: AttributionPriority
 ) -> None:
-    job_to_abort = await get_queue(index).job(job_key)
+    queue = get_queue(index, priority)
+    job_to_abort = await queue.job(job_key)
 
     if job_to_abort is not None:
-        await get_queue(index).abort(job_to_abort, "Client timeout")
+        await queue.abort(job_to_abort, "Client timeout")
@@ -1,6 +1,6 @@
-from typing import List
+from typing import List, Optional
 
-from infini_gram_processor.models import SpanRankingMethod
+from infini_gram_processor.models import AttributionDocumentField, SpanRankingMethod
 from pydantic import ConfigDict, Field
 
 from src.camel_case_model import CamelCaseModel
@@ -8,10 +8,13 @@ from src.camel_case_model import CamelCaseModel
 EXAMPLE_ATTRIBUTION_RESPONSE = "Hailing a taxi in Rome is fairly easy. Expect to pay around EUR 10-15 (approx. $11.29 - $15.58) to most tourist spots. Tipping isn't common in Italy, but round up the taxi fare or leave a small tip in the event of exceptional service. car rental is an alternative, but traffic in Rome can be daunting for newbies. If you decide to rent a car, make sure you're comfortable navigating busy medieval streets."
 
 
-class AttributionRequest(CamelCaseModel):
+# Every response in a batch shares one job, so this keeps a single batch from holding a worker for too long
+MAXIMUM_ATTRIBUTION_BATCH_SIZE = 100
+
+
+class AttributionOptions(CamelCaseModel):
     model_config = ConfigDict(frozen=True)
 
-    response: str = Field(examples=[EXAMPLE_ATTRIBUTION_RESPONSE])
     delimiters: List[str] = Field(
         examples=[["\n", "."]],
         default=[],
@@ -38,7 +41,7 @@ class AttributionRequest(CamelCaseModel):
     )
     span_ranking_method: SpanRankingMethod = Field(
         default=SpanRankingMethod.LENGTH,
-        description="Ranking method when capping number of spans with maximum_span_density, options are 'length' and 'unigram_logprob_sum'",
+        description="Ranking method when capping number of spans with maximum_span_density, options are 'length', 'unigram_logprob_sum', 'count_weighted_length' (length discounted by how common the span is), and 'overlap_suppressed' (longest spans that don't overlap each other)",
     )
     maximum_documents_per_span: int = Field(
         gt=0,
@@ -60,3 +63,33 @@ class AttributionRequest(CamelCaseModel):
         default=40,
         description="The maximum number of tokens of the context (on each side) for the snippet in document cards",
     )
+    metadata_fields: Optional[List[str]] = Field(
+        examples=[["metadata.source", "metadata.url"]],
+        default=None,
+        description="Dotted paths of the document metadata fields to return. Returns all of each document's metadata when omitted",
+    )
+    include: Optional[List[AttributionDocumentField]] = Field(
+        examples=[["text_snippet", "text_long"]],
+        default=None,
+        description="The optional document fields to return, options are 'token_ids', 'text', 'text_long', and 'text_snippet'. Fields that aren't listed are left out of each document. Returns all of them when omitted",
+    )
+
+
+class AttributionRequest(AttributionOptions):
+    response: str = Field(examples=[EXAMPLE_ATTRIBUTION_RESPONSE])
+
+
+class AttributionBatchRequest(AttributionOptions):
+    responses: List[str] = Field(
+        examples=[[EXAMPLE_ATTRIBUTION_RESPONSE]],
+        min_length=1,
+        max_length=MAXIMUM_ATTRIBUTION_BATCH_SIZE,
+        description="The responses to attribute. Every response is attributed with the same options",
+    )
+
+    def get_item_requests(self) -> List[AttributionRequest]:
+        options = self.model_dump(exclude={"responses"})
+        return [
+            AttributionRequest(response=response, **options)
+            for response in self.responses
+        ]
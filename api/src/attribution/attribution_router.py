@@ -1,21 +1,31 @@
 from typing import Annotated
 
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, Header, Response
+from fastapi.responses import StreamingResponse
 from fastapi_problem.handler import generate_swagger_response
 from infini_gram_processor.index_mappings import AvailableInfiniGramIndexId
+from infinigram_api_shared.saq.queue_utils import AttributionPriority
 
-from src.attribution.attribution_request import AttributionRequest
+from src.attribution.attribution_request import (
+    AttributionBatchRequest,
+    AttributionRequest,
+)
 from src.attribution.attribution_service import (
+    AttributionBatchResponse,
     AttributionResponse,
     AttributionService,
     AttributionTimeoutError,
 )
+from src.config import ConfigDependency
 
 attribution_router = APIRouter()
 
 
 @attribution_router.post(
     path="/{index}/attribution",
+    response_model=AttributionResponse,
+    # Documents only have the fields the request included, so fields the worker left out stay out
+    response_model_exclude_unset=True,
     responses={
         AttributionTimeoutError.status: generate_swagger_response(
             AttributionTimeoutError  # type: ignore
@@ -26,7 +36,120 @@ async def get_document_attributions(
     index: AvailableInfiniGramIndexId,
     body: AttributionRequest,
     attribution_service: Annotated[AttributionService, Depends()],
-) -> AttributionResponse:
-    result = await attribution_service.get_attribution_for_response(index, body)
+    config: ConfigDependency,
+    priority: Annotated[
+        AttributionPriority,
+        Header(
+            alias="X-Attribution-Priority",
+            description="Batch and evaluation clients should send bulk so they don't compete with interactive requests",
+        ),
+    ] = AttributionPriority.INTERACTIVE,
+    timeout_seconds: Annotated[
+        float | None,
+        Header(
+            alias="X-Request-Timeout",
+            gt=0,
+            description="How many seconds the client will wait for a response. Requests that can't finish in time are rejected early",
+        ),
+    ] = None,
+) -> AttributionResponse | Response:
+    if config.attribution_response_passthrough:
+        # The cached/worker JSON is already in our response format, so we skip parsing and re-serializing it
+        result_json = await attribution_service.get_attribution_json_for_response(
+            index, body, priority=priority, timeout_seconds=timeout_seconds
+        )
+        return Response(content=result_json, media_type="application/json")
+
+    result = await attribution_service.get_attribution_for_response(
+        index, body, priority=priority, timeout_seconds=timeout_seconds
+    )
 
     return result
+
+
+@attribution_router.post(
+    path="/{index}/attribution/batch",
+    response_model=AttributionBatchResponse,
+    # Documents only have the fields the request included, so fields the worker left out stay out
+    response_model_exclude_unset=True,
+    responses={
+        AttributionTimeoutError.status: generate_swagger_response(
+            AttributionTimeoutError  # type: ignore
+        )
+    },
+)
+async def get_batch_document_attributions(
+    index: AvailableInfiniGramIndexId,
+    body: AttributionBatchRequest,
+    attribution_service: Annotated[AttributionService, Depends()],
+    config: ConfigDependency,
+    priority: Annotated[
+        AttributionPriority,
+        Header(
+            alias="X-Attribution-Priority",
+            description="Batch and evaluation clients should send bulk so they don't compete with interactive requests",
+        ),
+    ] = AttributionPriority.INTERACTIVE,
+    timeout_seconds: Annotated[
+        float | None,
+        Header(
+            alias="X-Request-Timeout",
+            gt=0,
+            description="How many seconds the client will wait for a response. Requests that can't finish in time are rejected early",
+        ),
+    ] = None,
+) -> AttributionBatchResponse | Response:
+    if config.attribution_response_passthrough:
+        result_json = await attribution_service.get_attribution_batch_json_for_response(
+            index, body, priority=priority, timeout_seconds=timeout_seconds
+        )
+        return Response(content=result_json, media_type="application/json")
+
+    return await attribution_service.get_attribution_batch_for_response(
+        index, body, priority=priority, timeout_seconds=timeout_seconds
+    )
+
+
+@attribution_router.post(
+    path="/{index}/attribution/stream",
+    response_class=StreamingResponse,
+    responses={
+        200: {
+            "content": {"text/event-stream": {}},
+            "description": 'Server-sent events: "spans" with every span\'s documents left empty, "documents" for each span as its documents are ready, then "done" with the full response or "error"',
+        },
+        AttributionTimeoutError.status: generate_swagger_response(
+            AttributionTimeoutError  # type: ignore
+        ),
+    },
+)
+async def stream_document_attributions(
+    index: AvailableInfiniGramIndexId,
+    body: AttributionRequest,
+    attribution_service: Annotated[AttributionService, Depends()],
+    priority: Annotated[
+        AttributionPriority,
+        Header(
+            alias="X-Attribution-Priority",
+            description="Batch and evaluation clients should send bulk so they don't compete with interactive requests",
+        ),
+    ] = AttributionPriority.INTERACTIVE,
+    timeout_seconds: Annotated[
+        float | None,
+        Header(
+            alias="X-Request-Timeout",
+            gt=0,
+            description="How many seconds the client will wait for a response. Requests that can't finish in time are rejected early",
+        ),
+    ] = None,
+) -> StreamingResponse:
+    events = await attribution_service.stream_attribution(
+        index, body, priority=priority, timeout_seconds=timeout_seconds
+    )
+
+    return StreamingResponse(
+        events,
+        media_type="text/event-stream",
+        # Keeps proxies from buffering events until the stream ends
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
@@ -1,39 +1,66 @@
+import asyncio
+import json
 import logging
+import random
+import time
 from hashlib import sha256
-from typing import List, Optional, Sequence
-from uuid import uuid4
+from typing import Any, AsyncIterator, Awaitable, Callable, List, Optional, Sequence
 
 from infini_gram_processor.index_mappings import AvailableInfiniGramIndexId
 from infini_gram_processor.models import (
     BaseInfiniGramResponse,
     Document,
 )
+from infinigram_api_shared.cache.cache_codec import (
+    CacheCodec,
+    decode_cache_value,
+    get_cache_codec,
+)
+from infinigram_api_shared.saq.attribution_events import AttributionEvent
+from infinigram_api_shared.saq.queue_utils import AttributionPriority
 from opentelemetry import trace
 from opentelemetry.trace import Status, StatusCode
 from pydantic import Field, ValidationError
 from redis.asyncio import Redis
 from rfc9457 import StatusProblem
+from saq import Job
+from saq.queue import JobError
 
+from src.attribution.attribution_queue_monitor import (
+    AttributionQueueMonitor,
+    attribution_queue_monitor,
+)
 from src.attribution.attribution_queue_service import (
     abort_attribution_job,
+    enqueue_streaming_attribution_job,
+    publish_attribution_batch_job,
     publish_attribution_job,
+    read_attribution_events,
 )
-from src.attribution.attribution_request import AttributionRequest
-from src.cache import CacheDependency
+from src.attribution.attribution_request import (
+    AttributionBatchRequest,
+    AttributionOptions,
+    AttributionRequest,
+)
+from src.cache import AttributionLocalCacheDependency, CacheDependency
+from src.cache.local_cache import LocalCache
 from src.camel_case_model import CamelCaseModel
-from src.config import get_config
+from src.config import ConfigDependency, get_config
 
 tracer = trace.get_tracer(get_config().application_name)
 logger = logging.getLogger("uvicorn.error")
 
 
 class AttributionDocument(Document):
+    # Requests can leave these out with include
+    token_ids: list[int] = []
+    text: str = ""
     display_length_long: int
     needle_offset_long: int
-    text_long: str
+    text_long: str = ""
     display_offset_snippet: int
     needle_offset_snippet: int
-    text_snippet: str
+    text_snippet: str = ""
 
 
 class AttributionSpan(CamelCaseModel):
@@ -54,49 +81,118 @@ class AttributionResponse(BaseInfiniGramResponse):
     )
 
 
+class AttributionBatchResponse(CamelCaseModel):
+    results: Sequence[AttributionResponse]
+
+
 class AttributionTimeoutError(StatusProblem):
     type_ = "server-overloaded"
     title = "Server overloaded"
     status = 503
 
 
+class AttributionQueueFullError(StatusProblem):
+    type_ = "queue-full"
+    title = "Attribution queue full"
+    status = 503
+
+
+class AttributionDeadlineExceededError(StatusProblem):
+    type_ = "deadline-exceeded"
+    title = "Deadline can't be met"
+    status = 503
+
+
 _CACHE_EXPIRATION_TIME = 43_200
+_CACHE_NAME = "attribution_response"
+
+# Cached responses are returned to clients byte for byte, so bump this whenever the response's JSON changes shape
+_CACHE_FORMAT_VERSION = 2
+
+# Waiter counts outlive the job's own timeout in case a caller dies before it can decrement its count
+_JOB_WAITER_EXPIRATION_TIME = 300
+
+
+def format_server_sent_event(event: AttributionEvent, data: bytes) -> bytes:
+    # Event data is compact JSON, which never contains a raw newline, so it always fits on one data line
+    return b"event: " + event.value.encode() + b"\ndata: " + data + b"\n\n"
+
+
+async def _get_single_event_stream(
+    event: AttributionEvent, data: bytes
+) -> AsyncIterator[bytes]:
+    yield format_server_sent_event(event, data)
 
 
 class AttributionService:
     cache: Redis
+    cache_codec: CacheCodec
+    local_cache: LocalCache
+    validation_sample_rate: float
+    job_timeout_seconds: float
+    queue_depth_limits: dict[AttributionPriority, int]
+    queue_monitor: AttributionQueueMonitor
 
     def __init__(
         self,
         cache: CacheDependency,
+        local_cache: AttributionLocalCacheDependency,
+        config: ConfigDependency,
     ):
         self.cache = cache
-
-    def _get_cache_key(self, index: str, request: AttributionRequest) -> bytes:
-        combined_index_and_request = (
-            f"{request.__class__.__qualname__}::{index}{request.model_dump_json()}"
+        self.local_cache = local_cache
+        self.validation_sample_rate = config.attribution_response_validation_sample_rate
+        self.job_timeout_seconds = config.attribution_job_timeout_seconds
+        self.queue_depth_limits = {
+            AttributionPriority.INTERACTIVE: config.interactive_queue_depth_limit,
+            AttributionPriority.BULK: config.bulk_queue_depth_limit,
+        }
+        self.queue_monitor = attribution_queue_monitor
+        self.cache_codec = get_cache_codec(
+            config.cache_codec, compression_level=config.cache_compression_level
         )
+
+    def _get_cache_key(self, index: str, request: AttributionOptions) -> bytes:
+        combined_index_and_request = f"{request.__class__.__qualname__}:v{_CACHE_FORMAT_VERSION}::{index}{request.model_dump_json()}"
         key = sha256(
             combined_index_and_request.encode("utf-8", errors="ignore")
         ).digest()
 
         return key
 
-    @tracer.start_as_current_span("attribution_service/_get_cached_response")
-    async def _get_cached_response(
+    def _should_validate_response(self) -> bool:
+        return (
+            self.validation_sample_rate > 0
+            and random.random() < self.validation_sample_rate
+        )
+
+    @tracer.start_as_current_span("attribution_service/_get_cached_response_json")
+    async def _get_cached_response_json(
         self, index: AvailableInfiniGramIndexId, request: AttributionRequest
-    ) -> AttributionResponse | None:
+    ) -> bytes | None:
         key = self._get_cache_key(index.value, request)
 
+        # Hot responses are served from memory without a round trip to Redis
+        locally_cached_json = self.local_cache.get(key)
+        if locally_cached_json is not None:
+            trace.get_current_span().add_event(
+                "retrieved-locally-cached-attribution-response"
+            )
+            return locally_cached_json
+
         try:
             # Since someone asked for this again, we should keep it around longer
             # This sets it to expire after 12 hours
-            cached_json = await self.cache.getex(key, ex=_CACHE_EXPIRATION_TIME)
+            cached_value = await self.cache.getex(key, ex=_CACHE_EXPIRATION_TIME)
 
-            if cached_json is None:
+            if cached_value is None:
                 return None
 
-            cached_response = AttributionResponse.model_validate_json(cached_json)
+            cached_json = decode_cache_value(cached_value, cache_name=_CACHE_NAME)
+            if self._should_validate_response():
+                AttributionResponse.model_validate_json(cached_json)
+
+            self.local_cache.set(key, cached_json)
 
             current_span = trace.get_current_span()
             current_span.add_event("retrieved-cached-attribution-response")
@@ -104,12 +200,12 @@ class AttributionService:
                 "Retrieved cached attribution response",
             )
 
-            return cached_response
+            return cached_json
 
         except ValidationError:
             logger.error(
                 "Failed to parse cached response",
-                extra={"key": key.decode("utf-8")},
+                extra={"key": key.hex()},
                 exc_info=True,
             )
         except Exception:
@@ -125,13 +221,18 @@ class AttributionService:
         self,
         index: AvailableInfiniGramIndexId,
         request: AttributionRequest,
-        json_response: str,
+        json_response: bytes,
     ) -> None:
         key = self._get_cache_key(index.value, request)
+        self.local_cache.set(key, json_response)
 
         try:
             # save the response and expire it after an hour
-            await self.cache.set(key, json_response, ex=3_600)
+            await self.cache.set(
+                key,
+                self.cache_codec.encode(json_response, cache_name=_CACHE_NAME),
+                ex=3_600,
+            )
 
             current_span = trace.get_current_span()
             current_span.add_event("cached-attribution-response")
@@ -145,29 +246,280 @@ class AttributionService:
             )
             pass
 
-    @tracer.start_as_current_span("attribution_service/get_attribution_for_response")
+    def _get_job_waiter_key(self, job_key: str, priority: AttributionPriority) -> str:
+        # Each lane has its own queue, so the same request on both lanes is two jobs that need their own waiter counts
+        return f"attribution-job-waiters:{priority.value}:{job_key}"
+
+    async def _add_job_waiter(
+        self, job_key: str, priority: AttributionPriority
+    ) -> None:
+        waiter_key = self._get_job_waiter_key(job_key, priority)
+
+        try:
+            async with self.cache.pipeline(transaction=True) as pipeline:
+                pipeline.incr(waiter_key)
+                pipeline.expire(waiter_key, _JOB_WAITER_EXPIRATION_TIME)
+                await pipeline.execute()
+        except Exception:
+            logger.warning(
+                "Failed to register attribution job waiter",
+                extra={"job_key": job_key},
+                exc_info=True,
+            )
+
+    async def _remove_job_waiter(
+        self, job_key: str, priority: AttributionPriority
+    ) -> int:
+        """
+        Returns how many callers are still waiting on the job.
+        """
+        try:
+            remaining_waiters: int = await self.cache.decr(
+                self._get_job_waiter_key(job_key, priority)
+            )
+            return max(remaining_waiters, 0)
+        except Exception:
+            logger.warning(
+                "Failed to remove attribution job waiter",
+                extra={"job_key": job_key},
+                exc_info=True,
+            )
+            return 0
+
+    def _get_job_timeout_seconds(self, timeout_seconds: float | None) -> float:
+        return (
+            min(timeout_seconds, self.job_timeout_seconds)
+            if timeout_seconds is not None
+            else self.job_timeout_seconds
+        )
+
+    def _check_admission(
+        self,
+        index: AvailableInfiniGramIndexId,
+        priority: AttributionPriority,
+        timeout_seconds: float,
+    ) -> None:
+        """
+        Rejects a job up front if the queue is too deep or its wait is already longer than the caller is willing to wait.
+
+        Failing fast lets the caller back off instead of holding a connection open until it times out.
+        """
+        queue_stats = self.queue_monitor.get_stats(index, priority)
+        if queue_stats is None:
+            return
+
+        current_span = trace.get_current_span()
+        current_span.set_attributes(
+            {
+                "queue_depth": queue_stats.depth,
+                "queue_oldest_job_age_seconds": queue_stats.oldest_job_age_seconds,
+            }
+        )
+
+        if queue_stats.depth >= self.queue_depth_limits[priority]:
+            current_span.add_event("rejected-attribution-queue-full")
+            raise AttributionQueueFullError(
+                f"There are too many {priority.value} attribution requests waiting. Please try again later."
+            )
+
+        # The oldest job's age is how long the queue currently takes to drain, so a new job would wait at least that long
+        if queue_stats.oldest_job_age_seconds >= timeout_seconds:
+            current_span.add_event("rejected-attribution-deadline-exceeded")
+            raise AttributionDeadlineExceededError(
+                f"Attribution requests are currently waiting {queue_stats.oldest_job_age_seconds:.0f}s, which is longer than this request's {timeout_seconds:.0f}s timeout. Please try again later."
+            )
+
     async def get_attribution_for_response(
-        self, index: AvailableInfiniGramIndexId, request: AttributionRequest
+        self,
+        index: AvailableInfiniGramIndexId,
+        request: AttributionRequest,
+        priority: AttributionPriority = AttributionPriority.INTERACTIVE,
+        timeout_seconds: float | None = None,
     ) -> AttributionResponse:
-        cached_response = await self._get_cached_response(index, request)
-        if cached_response is not None:
-            return cached_response
+        return AttributionResponse.model_validate_json(
+            await self.get_attribution_json_for_response(
+                index, request, priority=priority, timeout_seconds=timeout_seconds
+            )
+        )
 
-        job_key = str(uuid4())
+    @tracer.start_as_current_span(
+        "attribution_service/get_attribution_json_for_response"
+    )
+    async def get_attribution_json_for_response(
+        self,
+        index: AvailableInfiniGramIndexId,
+        request: AttributionRequest,
+        priority: AttributionPriority = AttributionPriority.INTERACTIVE,
+        timeout_seconds: float | None = None,
+    ) -> bytes:
+        """
+        Gets the attribution response as the JSON the worker serialized it to.
+
+        The worker serializes responses the same way the API would, so this JSON can be sent to the client as-is.
+        timeout_seconds can only shorten the configured job timeout.
+        """
+        cached_response_json = await self._get_cached_response_json(index, request)
+        if cached_response_json is not None:
+            return cached_response_json
+
+        job_timeout_seconds = self._get_job_timeout_seconds(timeout_seconds)
+        self._check_admission(index, priority, job_timeout_seconds)
+
+        # Identical requests get the same job key. SAQ won't enqueue a job whose key is already in flight,
+        # so duplicate requests wait on the first one's job instead of taking up another worker slot.
+        job_key = self._get_cache_key(index.value, request).hex()
+
+        attribute_result_json: bytes = (
+            await self._wait_for_shared_job(
+                index,
+                job_key=job_key,
+                priority=priority,
+                publish_job=lambda: publish_attribution_job(
+                    index,
+                    request,
+                    job_key=job_key,
+                    priority=priority,
+                    timeout_seconds=job_timeout_seconds,
+                ),
+            )
+        ).encode("utf-8")
 
-        try:
-            logger.debug("Adding attribution request to queue", extra={"index": index})
+        # Checking a sample of responses catches the worker and API models drifting apart
+        if self._should_validate_response():
+            AttributionResponse.model_validate_json(attribute_result_json)
+
+        await self._cache_response(index, request, attribute_result_json)
+
+        return attribute_result_json
+
+    async def get_attribution_batch_for_response(
+        self,
+        index: AvailableInfiniGramIndexId,
+        request: AttributionBatchRequest,
+        priority: AttributionPriority = AttributionPriority.INTERACTIVE,
+        timeout_seconds: float | None = None,
+    ) -> AttributionBatchResponse:
+        return AttributionBatchResponse.model_validate_json(
+            await self.get_attribution_batch_json_for_response(
+                index, request, priority=priority, timeout_seconds=timeout_seconds
+            )
+        )
+
+    @tracer.start_as_current_span(
+        "attribution_service/get_attribution_batch_json_for_response"
+    )
+    async def get_attribution_batch_json_for_response(
+        self,
+        index: AvailableInfiniGramIndexId,
+        request: AttributionBatchRequest,
+        priority: AttributionPriority = AttributionPriority.INTERACTIVE,
+        timeout_seconds: float | None = None,
+    ) -> bytes:
+        """
+        Gets the attribution responses for every response in the batch, in order, as one JSON object.
+
+        Each response is looked up in the cache on its own, so only the ones that miss are sent to the worker, together in one job.
+        """
+        item_requests = request.get_item_requests()
+        response_jsons: list[bytes | None] = list(
+            await asyncio.gather(
+                *[
+                    self._get_cached_response_json(index, item_request)
+                    for item_request in item_requests
+                ]
+            )
+        )
+
+        # Duplicate responses in a batch only need to be attributed once
+        uncached_item_requests = {
+            item_request.response: item_request
+            for item_request, response_json in zip(item_requests, response_jsons)
+            if response_json is None
+        }
+        trace.get_current_span().set_attributes(
+            {
+                "batch_size": len(item_requests),
+                "uncached_count": len(uncached_item_requests),
+            }
+        )
+
+        if len(uncached_item_requests) > 0:
+            job_timeout_seconds = self._get_job_timeout_seconds(timeout_seconds)
+            self._check_admission(index, priority, job_timeout_seconds)
 
-            attribute_result_json = await publish_attribution_job(
-                index, request, job_key=job_key
+            uncached_request = request.model_copy(
+                update={"responses": list(uncached_item_requests.keys())}
             )
-            attribute_result = AttributionResponse.model_validate_json(
-                attribute_result_json
+            job_key = self._get_cache_key(index.value, uncached_request).hex()
+
+            uncached_results: list[str] = await self._wait_for_shared_job(
+                index,
+                job_key=job_key,
+                priority=priority,
+                publish_job=lambda: publish_attribution_batch_job(
+                    index,
+                    uncached_request,
+                    job_key=job_key,
+                    priority=priority,
+                    timeout_seconds=job_timeout_seconds,
+                ),
             )
 
-            await self._cache_response(index, request, attribute_result_json)
+            uncached_response_jsons: dict[str, bytes] = {}
+            for item_request, result in zip(
+                uncached_item_requests.values(), uncached_results
+            ):
+                result_json = result.encode("utf-8")
+                if self._should_validate_response():
+                    AttributionResponse.model_validate_json(result_json)
+
+                uncached_response_jsons[item_request.response] = result_json
+
+            await asyncio.gather(
+                *[
+                    self._cache_response(
+                        index,
+                        uncached_item_requests[response],
+                        response_json,
+                    )
+                    for response, response_json in uncached_response_jsons.items()
+                ]
+            )
 
-            return attribute_result
+            response_jsons = [
+                response_json
+                if response_json is not None
+                else uncached_response_jsons[item_request.response]
+                for item_request, response_json in zip(item_requests, response_jsons)
+            ]
+
+        # Each response is already in our response format, so the batch response is put together without parsing them
+        return (
+            b'{"results":['
+            + b",".join(
+                response_json
+                for response_json in response_jsons
+                if response_json is not None
+            )
+            + b"]}"
+        )
+
+    async def _wait_for_shared_job(
+        self,
+        index: AvailableInfiniGramIndexId,
+        job_key: str,
+        priority: AttributionPriority,
+        publish_job: Callable[[], Awaitable[Any]],
+    ) -> Any:
+        """
+        Publishes a job and waits for its result, aborting it if every caller waiting on it times out.
+        """
+        await self._add_job_waiter(job_key, priority)
+        remaining_waiters: int | None = None
+        try:
+            logger.debug("Adding attribution request to queue", extra={"index": index})
+
+            return await publish_job()
         except TimeoutError as ex:
             logger.error(
                 "Attribution request timed out",
@@ -180,8 +532,93 @@ class AttributionService:
                 ex, attributes={"job_key": job_key, "index": index.value}
             )
 
-            await abort_attribution_job(job_key, index=index)
+            remaining_waiters = await self._remove_job_waiter(job_key, priority)
+            # Other callers may still be waiting on this job, so only the last one to give up aborts it
+            if remaining_waiters == 0:
+                await abort_attribution_job(job_key, index=index, priority=priority)
+            else:
+                current_span.add_event(
+                    "left-shared-attribution-job-running",
+                    attributes={"remaining_waiters": remaining_waiters},
+                )
 
             raise AttributionTimeoutError(
                 "The server wasn't able to process your request in time. It is likely overloaded. Please try again later."
             )
+        except JobError as ex:
+            # The worker drops the job once every caller's deadline has passed, which can land just before our own wait times out
+            job_deadline = (ex.job.kwargs or {}).get("deadline")
+            if job_deadline is not None and time.time() >= job_deadline:
+                logger.error(
+                    "Shared attribution job expired",
+                    extra={"job_key": job_key, "index": index},
+                )
+                trace.get_current_span().set_status(Status(StatusCode.ERROR))
+
+                raise AttributionTimeoutError(
+                    "The server wasn't able to process your request in time. It is likely overloaded. Please try again later."
+                ) from ex
+
+            raise
+        finally:
+            if remaining_waiters is None:
+                await self._remove_job_waiter(job_key, priority)
+
+    @tracer.start_as_current_span("attribution_service/stream_attribution")
+    async def stream_attribution(
+        self,
+        index: AvailableInfiniGramIndexId,
+        request: AttributionRequest,
+        priority: AttributionPriority = AttributionPriority.INTERACTIVE,
+        timeout_seconds: float | None = None,
+    ) -> AsyncIterator[bytes]:
+        """
+        Starts an attribution job and returns its results as server-sent events while they're produced.
+
+        A "spans" event has the response with every span's documents empty, each "documents" event fills in one span's documents, and "done" has the full response.
+        Cached responses are sent as a single "done" event.
+        The cache and admission checks happen before this returns so rejected requests still get a problem response instead of a broken stream.
+        """
+        cached_response_json = await self._get_cached_response_json(index, request)
+        if cached_response_json is not None:
+            return _get_single_event_stream(AttributionEvent.DONE, cached_response_json)
+
+        job_timeout_seconds = self._get_job_timeout_seconds(timeout_seconds)
+        self._check_admission(index, priority, job_timeout_seconds)
+
+        # Streaming jobs publish events that regular jobs don't, so they can only be shared with other streaming requests
+        job_key = f"{self._get_cache_key(index.value, request).hex()}:stream"
+        job = await enqueue_streaming_attribution_job(
+            index,
+            request,
+            job_key=job_key,
+            priority=priority,
+            timeout_seconds=job_timeout_seconds,
+        )
+
+        return self._relay_attribution_events(
+            index, request, job=job, timeout_seconds=job_timeout_seconds
+        )
+
+    async def _relay_attribution_events(
+        self,
+        index: AvailableInfiniGramIndexId,
+        request: AttributionRequest,
+        job: Job,
+        timeout_seconds: float,
+    ) -> AsyncIterator[bytes]:
+        try:
+            async for event, data in read_attribution_events(job, timeout_seconds):
+                if event == AttributionEvent.DONE:
+                    await self._cache_response(index, request, data)
+
+                yield format_server_sent_event(event, data)
+        except TimeoutError:
+            # The worker drops the job once its deadline passes, so there's nothing to abort here
+            logger.error(
+                "Streaming attribution request timed out",
+                extra={"job_key": job.key, "index": index},
+            )
+            yield format_server_sent_event(
+                AttributionEvent.ERROR, json.dumps({"reason": "timeout"}).encode()
+            )
@@ -3,6 +3,15 @@ from typing import Annotated
 from fastapi import Depends
 from redis.asyncio import Redis
 
+from src.cache.local_cache import (
+    LocalCache,
+    get_attribution_local_cache,
+    get_count_local_cache,
+)
 from src.cache.redis import get_redis
 
 CacheDependency = Annotated[Redis, Depends(get_redis)]
+AttributionLocalCacheDependency = Annotated[
+    LocalCache, Depends(get_attribution_local_cache)
+]
+CountLocalCacheDependency = Annotated[LocalCache, Depends(get_count_local_cache)]
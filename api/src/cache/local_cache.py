@@ -0,0 +1,107 @@
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+
+from opentelemetry import metrics
+
+from src.config import get_config
+
+meter = metrics.get_meter(get_config().application_name)
+
+local_cache_hits = meter.create_counter(
+    "local_cache.hits",
+    description="Lookups that were served from an in-process cache",
+)
+local_cache_misses = meter.create_counter(
+    "local_cache.misses",
+    description="Lookups that weren't in an in-process cache or had expired",
+)
+local_cache_evictions = meter.create_counter(
+    "local_cache.evictions",
+    description="Entries evicted from an in-process cache to stay under its size limit",
+)
+local_cache_size = meter.create_up_down_counter(
+    "local_cache.size",
+    unit="By",
+    description="Bytes currently held by an in-process cache",
+)
+
+
+class LocalCache:
+    """
+    A bounded, in-process LRU cache of bytes that sits in front of Redis.
+
+    Entries are evicted least recently used first once the cache holds more than max_bytes, and are dropped when they're read after their TTL.
+    """
+
+    def __init__(self, name: str, max_bytes: int, ttl_seconds: float):
+        self.name = name
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+
+        self._entries: OrderedDict[bytes, tuple[float, bytes]] = OrderedDict()
+        self._size_bytes = 0
+        self._lock = threading.Lock()
+        self._attributes = {"cache": name}
+
+    def get(self, key: bytes) -> bytes | None:
+        with self._lock:
+            entry = self._entries.get(key)
+
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    local_cache_hits.add(1, attributes=self._attributes)
+                    return value
+
+                self._remove(key)
+
+        local_cache_misses.add(1, attributes=self._attributes)
+        return None
+
+    def set(self, key: bytes, value: bytes) -> None:
+        # Something this large would evict everything else and still not fit
+        if len(value) > self.max_bytes:
+            return
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._size_bytes += len(value)
+            local_cache_size.add(len(value), attributes=self._attributes)
+
+            while self._size_bytes > self.max_bytes:
+                oldest_key = next(iter(self._entries))
+                self._remove(oldest_key)
+                local_cache_evictions.add(1, attributes=self._attributes)
+
+    def _remove(self, key: bytes) -> None:
+        _, value = self._entries.pop(key)
+        self._size_bytes -= len(value)
+        local_cache_size.add(-len(value), attributes=self._attributes)
+
+
+@lru_cache
+def get_attribution_local_cache() -> LocalCache:
+    config = get_config()
+
+    return LocalCache(
+        name="attribution_response",
+        max_bytes=config.attribution_local_cache_max_bytes,
+        ttl_seconds=config.attribution_local_cache_ttl_seconds,
+    )
+
+
+@lru_cache
+def get_count_local_cache() -> LocalCache:
+    config = get_config()
+
+    return LocalCache(
+        name="n_gram_count",
+        max_bytes=config.count_local_cache_max_bytes,
+        ttl_seconds=config.count_local_cache_ttl_seconds,
+    )
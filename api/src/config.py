@@ -2,6 +2,7 @@ from functools import lru_cache
 from typing import Annotated
 
 from fastapi import Depends
+from infinigram_api_shared.cache.cache_codec import CacheCodecName
 from pydantic import Field, computed_field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -13,10 +14,29 @@ class Config(BaseSettings):
 
     index_base_path: str = "/mnt/infinigram-array"
     profiling_enabled: bool = False
+    preload_indexes: bool = False
+    warmup_queries_path: str | None = None
+    warmup_query_limit: int = 100
+    warmup_prefault_pages_per_file: int = 0
     application_name: str = "infini-gram-api"
     attribution_queue_url: str = Field(init=False)
     skiff_env: str = "prod"
     cache_url: str = Field(init=False)
+    cache_codec: CacheCodecName = CacheCodecName.ZLIB
+    cache_compression_level: int = 6
+    attribution_local_cache_max_bytes: int = 256 * 1024 * 1024
+    attribution_local_cache_ttl_seconds: float = 300
+    attribution_response_passthrough: bool = True
+    attribution_response_validation_sample_rate: float = 0.01
+    attribution_job_timeout_seconds: float = 90
+    interactive_queue_depth_limit: int = 100
+    bulk_queue_depth_limit: int = 1_000
+    queue_stats_refresh_seconds: float = 2
+    count_local_cache_max_bytes: int = 16 * 1024 * 1024
+    count_local_cache_ttl_seconds: float = 3_600
+    count_thread_pool_size: int = 4
+    documents_thread_pool_size: int = 4
+    documents_max_pending_requests: int = 64
 
     is_otel_enabled: bool = True
     otel_service_name: str = "infinigram-api"
@@ -28,6 +48,14 @@ class Config(BaseSettings):
 
         return f"{queue_prefix}-{self.skiff_env}"
 
+    @computed_field  # type: ignore[prop-decorator]
+    @property
+    def is_warmup_enabled(self) -> bool:
+        return (
+            self.warmup_queries_path is not None
+            or self.warmup_prefault_pages_per_file > 0
+        )
+
     @computed_field  # type: ignore[prop-decorator]
     @property
     def is_prod_environment(self) -> bool:
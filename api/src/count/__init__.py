@@ -0,0 +1 @@
+from .count_router import count_router as count_router
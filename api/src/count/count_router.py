@@ -0,0 +1,34 @@
+from typing import Annotated, TypeAlias
+
+from fastapi import APIRouter, Depends, Query
+from infini_gram_processor.models import InfiniGramCountResponse
+
+from src.count.count_service import (
+    CountBatchRequest,
+    CountBatchResponse,
+    CountService,
+)
+
+count_router = APIRouter()
+
+CountServiceDependency: TypeAlias = Annotated[CountService, Depends()]
+
+
+@count_router.get("/{index}/count", tags=["count"])
+async def count_n_gram(
+    count_service: CountServiceDependency,
+    query: Annotated[str, Query(title="The n-gram to count occurrences of")],
+) -> InfiniGramCountResponse:
+    return await count_service.count(query)
+
+
+@count_router.post("/{index}/count/batch", tags=["count"])
+async def count_n_grams(
+    count_service: CountServiceDependency,
+    body: CountBatchRequest,
+) -> CountBatchResponse:
+    counts = await count_service.count_batch(body.queries)
+
+    return CountBatchResponse(
+        index=count_service.infini_gram_processor.index, counts=counts
+    )
@@ -0,0 +1,134 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from hashlib import sha256
+from typing import List, Sequence
+
+from infini_gram_processor import InfiniGramProcessor
+from infini_gram_processor.models import BaseInfiniGramResponse, InfiniGramCountResponse
+from opentelemetry import trace
+from pydantic import Field
+
+from src.cache import CountLocalCacheDependency
+from src.cache.local_cache import LocalCache
+from src.camel_case_model import CamelCaseModel
+from src.config import get_config
+from src.infinigram.infini_gram_dependency import InfiniGramProcessorDependency
+
+tracer = trace.get_tracer(get_config().application_name)
+
+# Contamination checks send lots of short n-grams, so one batch can be much larger than an attribution batch
+MAXIMUM_COUNT_BATCH_SIZE = 1_000
+
+
+class CountBatchRequest(CamelCaseModel):
+    queries: List[str] = Field(
+        examples=[["busy medieval streets", "natural language processing"]],
+        min_length=1,
+        max_length=MAXIMUM_COUNT_BATCH_SIZE,
+    )
+
+
+class NGramCount(CamelCaseModel):
+    count: int
+    approx: bool
+
+
+class CountBatchResponse(BaseInfiniGramResponse):
+    counts: List[NGramCount]
+
+
+@lru_cache
+def get_count_executor() -> ThreadPoolExecutor:
+    return ThreadPoolExecutor(
+        max_workers=get_config().count_thread_pool_size, thread_name_prefix="count"
+    )
+
+
+class CountService:
+    infini_gram_processor: InfiniGramProcessor
+    count_cache: LocalCache
+
+    def __init__(
+        self,
+        infini_gram_processor: InfiniGramProcessorDependency,
+        count_cache: CountLocalCacheDependency,
+    ):
+        self.infini_gram_processor = infini_gram_processor
+        self.count_cache = count_cache
+
+    def _get_cache_key(self, input_ids: Sequence[int]) -> bytes:
+        token_ids = ",".join(str(token_id) for token_id in input_ids)
+        return sha256(
+            f"{self.infini_gram_processor.index}::{token_ids}".encode("utf-8")
+        ).digest()
+
+    async def count(self, query: str) -> InfiniGramCountResponse:
+        (n_gram_count,) = await self.count_batch([query])
+
+        return InfiniGramCountResponse(
+            index=self.infini_gram_processor.index,
+            count=n_gram_count.count,
+            approx=n_gram_count.approx,
+        )
+
+    @tracer.start_as_current_span("count_service/count_batch")
+    async def count_batch(self, queries: Sequence[str]) -> list[NGramCount]:
+        """
+        Counts every query in the index, returning the counts in the same order as the queries.
+
+        Queries are tokenized together and their counts are cached by token ids, so repeated n-grams don't reach the engine.
+        """
+        loop = asyncio.get_running_loop()
+        executor = get_count_executor()
+
+        input_ids_batch = await loop.run_in_executor(
+            executor, self.infini_gram_processor.tokenize_batch, queries
+        )
+        cache_keys = [self._get_cache_key(input_ids) for input_ids in input_ids_batch]
+
+        cached_counts: list[NGramCount | None] = []
+        for cache_key in cache_keys:
+            cached_count = self.count_cache.get(cache_key)
+            cached_counts.append(
+                NGramCount.model_validate_json(cached_count)
+                if cached_count is not None
+                else None
+            )
+
+        # Repeated queries in a batch only need to be counted once
+        uncached_input_ids = {
+            cache_key: input_ids
+            for cache_key, input_ids, cached_count in zip(
+                cache_keys, input_ids_batch, cached_counts
+            )
+            if cached_count is None
+        }
+        trace.get_current_span().set_attributes(
+            {"query_count": len(queries), "uncached_count": len(uncached_input_ids)}
+        )
+
+        count_responses = await asyncio.gather(
+            *[
+                loop.run_in_executor(
+                    executor, self.infini_gram_processor.count_tokens, input_ids
+                )
+                for input_ids in uncached_input_ids.values()
+            ]
+        )
+
+        # The index never changes under us, so counts only leave the cache to make room
+        counted: dict[bytes, NGramCount] = {}
+        for cache_key, count_response in zip(
+            uncached_input_ids.keys(), count_responses
+        ):
+            n_gram_count = NGramCount(
+                count=count_response.count, approx=count_response.approx
+            )
+            self.count_cache.set(cache_key, n_gram_count.model_dump_json().encode())
+            counted[cache_key] = n_gram_count
+
+        return [
+            cached_count if cached_count is not None else counted[cache_key]
+            for cache_key, cached_count in zip(cache_keys, cached_counts)
+        ]
@@ -0,0 +1,107 @@
+import asyncio
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache, partial
+from typing import Annotated, Callable, ParamSpec, TypeVar
+
+from fastapi import Depends
+from opentelemetry import metrics
+from rfc9457 import StatusProblem
+
+from src.config import get_config
+
+meter = metrics.get_meter(get_config().application_name)
+
+documents_request_duration = meter.create_histogram(
+    "documents.request.duration",
+    unit="s",
+    description="Time a documents request took, including time spent waiting for a free thread",
+)
+documents_queue_wait = meter.create_histogram(
+    "documents.executor.queue_wait",
+    unit="s",
+    description="Time a documents request waited for a free thread in the documents executor",
+)
+documents_rejected = meter.create_counter(
+    "documents.executor.rejected",
+    description="Documents requests rejected because too many were already waiting",
+)
+
+P = ParamSpec("P")
+T = TypeVar("T")
+
+
+class DocumentsBusyError(StatusProblem):
+    type_ = "documents-busy"
+    title = "Document service busy"
+    status = 503
+
+
+class DocumentsExecutor:
+    """
+    Runs blocking document lookups on their own bounded thread pool.
+
+    Keeping them off of Starlette's shared threadpool means a burst of document browsing can't starve other endpoints,
+    and rejecting requests once max_pending are in flight keeps a burst from building an unbounded backlog.
+    """
+
+    def __init__(self, max_workers: int, max_pending: int):
+        self.max_pending = max_pending
+
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="documents"
+        )
+        # Only touched from the event loop, so it doesn't need a lock
+        self._pending = 0
+
+    async def run(
+        self,
+        operation: str,
+        fn: Callable[P, T],
+        *args: P.args,
+        **kwargs: P.kwargs,
+    ) -> T:
+        attributes = {"operation": operation}
+
+        if self._pending >= self.max_pending:
+            documents_rejected.add(1, attributes=attributes)
+            raise DocumentsBusyError(
+                "There are too many document requests waiting. Please try again later."
+            )
+
+        self._pending += 1
+        queued_at = time.perf_counter()
+
+        def run_and_record_wait() -> T:
+            documents_queue_wait.record(
+                time.perf_counter() - queued_at, attributes=attributes
+            )
+            return fn(*args, **kwargs)
+
+        # Copying the context keeps the lookup's spans under the request's span
+        context = contextvars.copy_context()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(
+                self._executor, partial(context.run, run_and_record_wait)
+            )
+        finally:
+            self._pending -= 1
+            documents_request_duration.record(
+                time.perf_counter() - queued_at, attributes=attributes
+            )
+
+
+@lru_cache
+def get_documents_executor() -> DocumentsExecutor:
+    config = get_config()
+
+    return DocumentsExecutor(
+        max_workers=config.documents_thread_pool_size,
+        max_pending=config.documents_max_pending_requests,
+    )
+
+
+DocumentsExecutorDependency = Annotated[
+    DocumentsExecutor, Depends(get_documents_executor)
+]
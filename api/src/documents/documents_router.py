@@ -1,12 +1,20 @@
-from typing import Annotated, TypeAlias
+from typing import Annotated, Any, TypeAlias
 
-from fastapi import APIRouter, Depends, Query
+from fastapi import APIRouter, Depends, Query, Response
+from fastapi_problem.handler import generate_swagger_response
 from infini_gram_processor.models import GetDocumentByIndexRequest
+from pydantic import BaseModel
+from pydantic.main import IncEx
 
+from src.documents.documents_executor import (
+    DocumentsBusyError,
+    DocumentsExecutorDependency,
+)
 from src.documents.documents_service import (
     DocumentsService,
     InfiniGramDocumentResponse,
     InfiniGramDocumentsResponse,
+    InvalidCursorError,
     SearchResponse,
 )
 
@@ -20,12 +28,55 @@ MaximumDocumentDisplayLengthType: TypeAlias = Annotated[
     ),
 ]
 
+MetadataFieldsType: TypeAlias = Annotated[
+    list[str] | None,
+    Query(
+        title="Dotted paths of the metadata fields to return, like metadata.url. Returns all of each document's metadata when omitted.",
+    ),
+]
+
+IncludeTokenIdsType: TypeAlias = Annotated[
+    bool,
+    Query(
+        title="Set this to false to leave each document's token ids out of the response",
+    ),
+]
+
 DocumentsServiceDependency: TypeAlias = Annotated[DocumentsService, Depends()]
 
+DOCUMENTS_BUSY_RESPONSES: dict[int | str, dict[str, Any]] = {
+    DocumentsBusyError.status: generate_swagger_response(
+        DocumentsBusyError  # type: ignore
+    )
+}
+
+
+# Leaves out each document's token ids when the client doesn't need them
+_DOCUMENT_TOKEN_IDS: IncEx = {"token_ids"}
+_DOCUMENTS_TOKEN_IDS: IncEx = {"documents": {"__all__": {"token_ids"}}}
+
 
-@documents_router.get("/{index}/documents/", tags=["documents"])
-def search_documents(
+def _serialize_excluding(response: BaseModel, exclude: IncEx) -> Response:
+    return Response(
+        content=response.model_dump_json(by_alias=True, exclude=exclude),
+        media_type="application/json",
+    )
+
+
+@documents_router.get(
+    "/{index}/documents/",
+    tags=["documents"],
+    response_model=SearchResponse,
+    responses={
+        **DOCUMENTS_BUSY_RESPONSES,
+        InvalidCursorError.status: generate_swagger_response(
+            InvalidCursorError  # type: ignore
+        ),
+    },
+)
+async def search_documents(
     documents_service: DocumentsServiceDependency,
+    documents_executor: DocumentsExecutorDependency,
     search: str,
     maximum_document_display_length: MaximumDocumentDisplayLengthType = 10,
     page: Annotated[
@@ -41,38 +92,77 @@ def search_documents(
             gt=0,
         ),
     ] = 10,
-) -> SearchResponse:
-    result = documents_service.search_documents(
+    cursor: Annotated[
+        str | None,
+        Query(
+            title="The nextCursor from the previous page. Takes precedence over page and is much faster for deep pages.",
+        ),
+    ] = None,
+    metadata_fields: MetadataFieldsType = None,
+    include_token_ids: IncludeTokenIdsType = True,
+) -> SearchResponse | Response:
+    result = await documents_executor.run(
+        "search_documents",
+        documents_service.search_documents,
         search,
         maximum_context_length=maximum_document_display_length,
         page=page,
         page_size=page_size,
+        cursor=cursor,
+        metadata_fields=metadata_fields,
     )
 
+    if not include_token_ids:
+        return _serialize_excluding(result, _DOCUMENTS_TOKEN_IDS)
+
     return result
 
 
-@documents_router.get("/{index}/documents/{document_index}", tags=["documents"])
-def get_document_by_index(
+@documents_router.get(
+    "/{index}/documents/{document_index}",
+    tags=["documents"],
+    response_model=InfiniGramDocumentResponse,
+    responses=DOCUMENTS_BUSY_RESPONSES,
+)
+async def get_document_by_index(
     documents_service: DocumentsServiceDependency,
+    documents_executor: DocumentsExecutorDependency,
     document_index: int,
     maximum_document_display_length: MaximumDocumentDisplayLengthType = 10,
-) -> InfiniGramDocumentResponse:
-    result = documents_service.get_document_by_index(
+    metadata_fields: MetadataFieldsType = None,
+    include_token_ids: IncludeTokenIdsType = True,
+) -> InfiniGramDocumentResponse | Response:
+    result = await documents_executor.run(
+        "get_document_by_index",
+        documents_service.get_document_by_index,
         document_index=int(document_index),
         maximum_context_length=maximum_document_display_length,
+        metadata_fields=metadata_fields,
     )
 
+    if not include_token_ids:
+        return _serialize_excluding(result, _DOCUMENT_TOKEN_IDS)
+
     return result
 
 
-@documents_router.get("/{index}/documents", tags=["documents"])
-def get_documents_by_index(
+@documents_router.get(
+    "/{index}/documents",
+    tags=["documents"],
+    response_model=InfiniGramDocumentsResponse,
+    responses=DOCUMENTS_BUSY_RESPONSES,
+)
+async def get_documents_by_index(
     documents_service: DocumentsServiceDependency,
+    documents_executor: DocumentsExecutorDependency,
     document_indexes: Annotated[list[int], Query()],
     maximum_document_display_length: MaximumDocumentDisplayLengthType = 10,
-) -> InfiniGramDocumentsResponse:
-    result = documents_service.get_multiple_documents_by_index(
+    metadata_fields: MetadataFieldsType = None,
+    include_token_ids: IncludeTokenIdsType = True,
+) -> InfiniGramDocumentsResponse | Response:
+    result = await documents_executor.run(
+        "get_multiple_documents_by_index",
+        documents_service.get_multiple_documents_by_index,
         document_requests=[
             GetDocumentByIndexRequest(
                 document_index=document_index,
@@ -80,6 +170,10 @@ def get_documents_by_index(
             )
             for document_index in document_indexes
         ],
+        metadata_fields=metadata_fields,
     )
 
+    if not include_token_ids:
+        return _serialize_excluding(result, _DOCUMENTS_TOKEN_IDS)
+
     return result
@@ -1,5 +1,5 @@
 from math import ceil
-from typing import Iterable, List
+from typing import Collection, Iterable, List, Optional
 
 from infini_gram_processor import InfiniGramProcessor
 from infini_gram_processor.models import (
@@ -7,7 +7,9 @@ from infini_gram_processor.models import (
     Document,
     GetDocumentByIndexRequest,
 )
+from infini_gram_processor.search_pagination import InvalidSearchCursorError
 from opentelemetry import trace
+from rfc9457 import StatusProblem
 
 from src.config import get_config
 from src.infinigram.infini_gram_dependency import InfiniGramProcessorDependency
@@ -28,6 +30,13 @@ class SearchResponse(BaseInfiniGramResponse):
     page_size: int
     page_count: int
     total_documents: int
+    next_cursor: Optional[str] = None
+
+
+class InvalidCursorError(StatusProblem):
+    type_ = "invalid-cursor"
+    title = "Invalid cursor"
+    status = 400
 
 
 class DocumentsService:
@@ -43,13 +52,20 @@ class DocumentsService:
         maximum_context_length: int,
         page_size: int,
         page: int,
+        cursor: str | None = None,
+        metadata_fields: Collection[str] | None = None,
     ) -> SearchResponse:
-        search_documents_result = self.infini_gram_processor.search_documents(
-            search=search,
-            maximum_context_length=maximum_context_length,
-            page=page,
-            page_size=page_size,
-        )
+        try:
+            search_documents_result = self.infini_gram_processor.search_documents(
+                search=search,
+                maximum_context_length=maximum_context_length,
+                page=page,
+                page_size=page_size,
+                cursor=cursor,
+                metadata_fields=metadata_fields,
+            )
+        except InvalidSearchCursorError as ex:
+            raise InvalidCursorError(str(ex)) from ex
 
         mapped_documents = [
             Document(
@@ -67,19 +83,24 @@ class DocumentsService:
         return SearchResponse(
             index=self.infini_gram_processor.index,
             documents=mapped_documents,
-            page=page,
+            page=search_documents_result.offset // page_size,
             page_size=page_size,
             total_documents=search_documents_result.total_documents,
             page_count=ceil(search_documents_result.total_documents / page_size),
+            next_cursor=search_documents_result.next_cursor,
         )
 
     @tracer.start_as_current_span("documents_service/get_document_by_index")
     def get_document_by_index(
-        self, document_index: int, maximum_context_length: int
+        self,
+        document_index: int,
+        maximum_context_length: int,
+        metadata_fields: Collection[str] | None = None,
     ) -> InfiniGramDocumentResponse:
         document = self.infini_gram_processor.get_document_by_index(
             document_index=document_index,
             maximum_context_length=maximum_context_length,
+            metadata_fields=metadata_fields,
         )
 
         return InfiniGramDocumentResponse(
@@ -97,9 +118,11 @@ class DocumentsService:
     def get_multiple_documents_by_index(
         self,
         document_requests: Iterable[GetDocumentByIndexRequest],
+        metadata_fields: Collection[str] | None = None,
     ) -> InfiniGramDocumentsResponse:
         documents = self.infini_gram_processor.get_documents_by_indexes(
             document_requests=document_requests,
+            metadata_fields=metadata_fields,
         )
         mapped_documents = [
             Document(
@@ -1,11 +1,20 @@
-from fastapi import APIRouter, status
+import threading
+
+from fastapi import APIRouter, Response, status
 
 health_router = APIRouter(prefix="/health")
 
+# Cleared while the indexes are warming up so we don't get traffic before we can serve it quickly
+readiness = threading.Event()
+readiness.set()
+
 
 # This tells the machinery that powers Skiff (Kubernetes) that your application
 # is ready to receive traffic. Returning a non 2XX response code will prevent the
 # application from receiving live requests.
 @health_router.get("/", status_code=status.HTTP_204_NO_CONTENT)
-def health() -> None:
+def health(response: Response) -> None:
+    if not readiness.is_set():
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+
     return
@@ -0,0 +1,36 @@
+import asyncio
+import logging
+
+from infini_gram_processor.index_mappings import AvailableInfiniGramIndexId
+from infini_gram_processor.processor_registry import get_infini_gram_processor
+from infini_gram_processor.warmup import load_warmup_queries, warm_up_processor
+
+from src.config import Config
+from src.health import readiness
+
+logger = logging.getLogger("uvicorn.error")
+
+
+def warm_up_indexes(config: Config) -> None:
+    queries = (
+        load_warmup_queries(config.warmup_queries_path, config.warmup_query_limit)
+        if config.warmup_queries_path is not None
+        else []
+    )
+
+    for index in AvailableInfiniGramIndexId:
+        warm_up_processor(
+            get_infini_gram_processor(index),
+            queries=queries,
+            prefault_pages_per_file=config.warmup_prefault_pages_per_file,
+        )
+
+
+async def warm_up_indexes_before_ready(config: Config) -> None:
+    try:
+        await asyncio.to_thread(warm_up_indexes, config)
+    except Exception:
+        # A failed warm-up only means slower first requests, so we still want to serve traffic
+        logger.error("Failed to warm up indexes", exc_info=True)
+    finally:
+        readiness.set()
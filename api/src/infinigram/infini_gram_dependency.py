@@ -3,12 +3,13 @@ from typing import Annotated
 from fastapi import Depends
 from infini_gram_processor.index_mappings import AvailableInfiniGramIndexId
 from infini_gram_processor.processor import InfiniGramProcessor
+from infini_gram_processor.processor_registry import get_infini_gram_processor
 
 
 def InfiniGramProcessorFactoryPathParam(
     index: AvailableInfiniGramIndexId,
 ) -> InfiniGramProcessor:
-    return InfiniGramProcessor(index)
+    return get_infini_gram_processor(index)
 
 
 InfiniGramProcessorDependency = Annotated[
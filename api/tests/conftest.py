@@ -0,0 +1,5 @@
+import os
+
+# The config requires these, but the tests never connect to them
+os.environ.setdefault("ATTRIBUTION_QUEUE_URL", "redis://localhost:6379")
+os.environ.setdefault("CACHE_URL", "redis://localhost:6379")
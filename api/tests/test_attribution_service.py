@@ -0,0 +1,178 @@
+import asyncio
+from typing import Any
+
+import pytest
+from infini_gram_processor.index_mappings import AvailableInfiniGramIndexId
+from infinigram_api_shared.saq.queue_utils import AttributionPriority
+from src.attribution import attribution_service
+from src.attribution.attribution_service import (
+    AttributionService,
+    AttributionTimeoutError,
+)
+from src.cache.local_cache import LocalCache
+from src.config import get_config
+
+INDEX = AvailableInfiniGramIndexId.OLMO_2_0325_32B
+JOB_KEY = "same-request"
+
+
+class InMemoryRedis:
+    """
+    Just enough of Redis to count job waiters.
+    """
+
+    def __init__(self) -> None:
+        self.values: dict[str, int] = {}
+
+    def pipeline(self, transaction: bool = True) -> "InMemoryRedis":
+        return self
+
+    async def __aenter__(self) -> "InMemoryRedis":
+        return self
+
+    async def __aexit__(self, *args: Any) -> None:
+        pass
+
+    def incr(self, key: str) -> None:
+        self.values[key] = self.values.get(key, 0) + 1
+
+    def expire(self, key: str, seconds: int) -> None:
+        pass
+
+    async def execute(self) -> None:
+        pass
+
+    async def decr(self, key: str) -> int:
+        self.values[key] = self.values.get(key, 0) - 1
+        return self.values[key]
+
+
+def create_service() -> AttributionService:
+    return AttributionService(
+        cache=InMemoryRedis(),  # type: ignore[arg-type]
+        local_cache=LocalCache("test", max_bytes=1024, ttl_seconds=60),
+        config=get_config(),
+    )
+
+
+@pytest.mark.parametrize(
+    ("timed_out_priority", "waiting_priority"),
+    [
+        (AttributionPriority.INTERACTIVE, AttributionPriority.BULK),
+        (AttributionPriority.BULK, AttributionPriority.INTERACTIVE),
+    ],
+)
+def test_timed_out_lane_aborts_its_job_while_the_other_lane_waits(
+    monkeypatch: pytest.MonkeyPatch,
+    timed_out_priority: AttributionPriority,
+    waiting_priority: AttributionPriority,
+) -> None:
+    aborted_jobs: list[tuple[str, AttributionPriority]] = []
+
+    async def abort_attribution_job(
+        job_key: str,
+        index: AvailableInfiniGramIndexId,
+        priority: AttributionPriority,
+    ) -> None:
+        aborted_jobs.append((job_key, priority))
+
+    monkeypatch.setattr(
+        attribution_service, "abort_attribution_job", abort_attribution_job
+    )
+
+    async def run() -> None:
+        service = create_service()
+        waiting_job_started = asyncio.Event()
+        waiting_job_finished = asyncio.Event()
+
+        async def wait_for_job() -> str:
+            waiting_job_started.set()
+            await waiting_job_finished.wait()
+            return "result"
+
+        async def time_out() -> str:
+            raise TimeoutError()
+
+        waiting_caller = asyncio.create_task(
+            service._wait_for_shared_job(
+                INDEX,
+                job_key=JOB_KEY,
+                priority=waiting_priority,
+                publish_job=wait_for_job,
+            )
+        )
+        await waiting_job_started.wait()
+
+        with pytest.raises(AttributionTimeoutError):
+            await service._wait_for_shared_job(
+                INDEX,
+                job_key=JOB_KEY,
+                priority=timed_out_priority,
+                publish_job=time_out,
+            )
+
+        # Only the lane nobody is waiting on anymore is aborted
+        assert aborted_jobs == [(JOB_KEY, timed_out_priority)]
+
+        waiting_job_finished.set()
+        assert await waiting_caller == "result"
+        assert aborted_jobs == [(JOB_KEY, timed_out_priority)]
+
+    asyncio.run(run())
+
+
+def test_last_waiter_in_a_lane_aborts_the_job(
+    monkeypatch: pytest.MonkeyPatch,
+) -> None:
+    aborted_jobs: list[tuple[str, AttributionPriority]] = []
+
+    async def abort_attribution_job(
+        job_key: str,
+        index: AvailableInfiniGramIndexId,
+        priority: AttributionPriority,
+    ) -> None:
+        aborted_jobs.append((job_key, priority))
+
+    monkeypatch.setattr(
+        attribution_service, "abort_attribution_job", abort_attribution_job
+    )
+
+    async def run() -> None:
+        service = create_service()
+        first_caller_waiting = asyncio.Event()
+        first_caller_timed_out = asyncio.Event()
+
+        async def time_out_first() -> str:
+            first_caller_waiting.set()
+            await first_caller_timed_out.wait()
+            raise TimeoutError()
+
+        async def time_out() -> str:
+            raise TimeoutError()
+
+        first_caller = asyncio.create_task(
+            service._wait_for_shared_job(
+                INDEX,
+                job_key=JOB_KEY,
+                priority=AttributionPriority.INTERACTIVE,
+                publish_job=time_out_first,
+            )
+        )
+        await first_caller_waiting.wait()
+
+        # The first caller is still waiting on the same lane, so the job keeps running
+        with pytest.raises(AttributionTimeoutError):
+            await service._wait_for_shared_job(
+                INDEX,
+                job_key=JOB_KEY,
+                priority=AttributionPriority.INTERACTIVE,
+                publish_job=time_out,
+            )
+        assert aborted_jobs == []
+
+        first_caller_timed_out.set()
+        with pytest.raises(AttributionTimeoutError):
+            await first_caller
+        assert aborted_jobs == [(JOB_KEY, AttributionPriority.INTERACTIVE)]
+
+    asyncio.run(run())
@@ -0,0 +1,63 @@
+import logging
+from typing import Sequence
+
+from infinigram_api_shared.saq.attribution_events import (
+    ATTRIBUTION_EVENT_DATA_FIELD,
+    ATTRIBUTION_EVENT_NAME_FIELD,
+    ATTRIBUTION_EVENT_STREAM_EXPIRATION_SECONDS,
+    AttributionEvent,
+    get_attribution_event_stream_key,
+)
+from redis.asyncio import Redis
+from saq import Job
+from saq.queue.redis import RedisQueue
+
+logger = logging.getLogger()
+
+
+class AttributionEventStream:
+    """
+    Publishes a streaming attribution job's partial results to a Redis stream the API relays to the client.
+    """
+
+    def __init__(self, redis: Redis, job_key: str, queued: int):
+        self.redis = redis
+        self.stream_key = get_attribution_event_stream_key(job_key, queued)
+
+    async def publish(
+        self, events: Sequence[tuple[AttributionEvent, str | bytes]]
+    ) -> None:
+        if len(events) == 0:
+            return
+
+        try:
+            async with self.redis.pipeline(transaction=False) as pipeline:
+                for event, data in events:
+                    pipeline.xadd(
+                        self.stream_key,
+                        {
+                            ATTRIBUTION_EVENT_NAME_FIELD: event.value,
+                            ATTRIBUTION_EVENT_DATA_FIELD: data,
+                        },
+                    )
+                pipeline.expire(
+                    self.stream_key, ATTRIBUTION_EVENT_STREAM_EXPIRATION_SECONDS
+                )
+                await pipeline.execute()
+        except Exception:
+            # The job's result still gets saved, so a client that misses events can fall back to it
+            logger.warning("Failed to publish attribution events", exc_info=True)
+
+
+def get_attribution_event_stream(job: Job | None) -> AttributionEventStream | None:
+    """
+    Returns the job's event stream if whoever enqueued it asked for its results to be streamed.
+    """
+    if job is None or not (job.kwargs or {}).get("stream_events", False):
+        return None
+
+    if not isinstance(job.queue, RedisQueue):
+        logger.warning("Attribution events can only be streamed through Redis queues")
+        return None
+
+    return AttributionEventStream(job.queue.redis, job.key, queued=job.queued)
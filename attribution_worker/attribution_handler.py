@@ -1,25 +1,41 @@
 import asyncio
-from typing import Any
+from typing import AbstractSet, Any, Sequence
 
 import numpy as np
+from infini_gram.models import AttributionSpan as AttributionSpanFromEngine
+from infini_gram_processor.document_batch import DocumentBatch
 from infini_gram_processor.models import (
+    AttributionDocument,
+    AttributionDocumentField,
+    GetDocumentByPointerRequest,
+    InfiniGramAttributionResponse,
     SpanRankingMethod,
 )
 from infini_gram_processor.models.models import (
     AttributionResponse,
-    AttributionSpan,
+    AttributionSpanDocuments,
 )
+from infini_gram_processor.processor import InfiniGramProcessor
+from infinigram_api_shared.saq.attribution_events import AttributionEvent
 from infinigram_api_shared.saq.queue_constants import TASK_NAME_KEY, TASK_TAG_KEY
-from opentelemetry import trace
+from opentelemetry import metrics, trace
 from opentelemetry.semconv.trace import SpanAttributes
 from opentelemetry.trace import SpanKind
 from opentelemetry.trace.propagation.tracecontext import TraceContextTextMapPropagator
 
+from attribution_worker.attribution_event_stream import (
+    AttributionEventStream,
+    get_attribution_event_stream,
+)
 from attribution_worker.attribution_worker_context import AttributionWorkerContext
 from attribution_worker.config import get_config
+from attribution_worker.job_deadline import JobDeadline
+from attribution_worker.span_document_cache import get_span_cache_key
+from attribution_worker.stage_executors import AttributionStage, run_stage
 
 from .get_documents import (
     get_document_requests,
+    get_excluded_document_fields,
     get_spans_with_documents,
     sort_and_cap_spans,
 )
@@ -28,6 +44,37 @@ config = get_config()
 
 
 tracer = trace.get_tracer(config.application_name)
+meter = metrics.get_meter(config.application_name)
+
+expired_jobs = meter.create_counter(
+    "attribution_worker.job.expired",
+    description="Attribution jobs dropped because their caller's deadline passed before the job finished",
+)
+
+
+class AttributionJobExpiredError(Exception):
+    pass
+
+
+async def _raise_if_expired(
+    deadline: JobDeadline, stage: AttributionStage, index: str
+) -> None:
+    """
+    Stops a job before a stage if the API has already given up waiting on it.
+
+    Nobody will read the result of an expired job, so skipping its remaining stages frees the worker for jobs that still have a caller.
+    """
+    if not await deadline.has_passed():
+        return
+
+    expired_jobs.add(1, attributes={"index": index, "stage": stage.value})
+    trace.get_current_span().add_event(
+        "attribution-job-expired", attributes={"stage": stage.value}
+    )
+
+    raise AttributionJobExpiredError(
+        f"The job's deadline passed before the {stage.value} stage"
+    )
 
 
 async def attribution_job(
@@ -46,6 +93,10 @@ async def attribution_job(
     maximum_context_length_snippet: int,
     maximum_documents_per_span: int,
     otel_context: dict[str, Any],
+    deadline: float | None = None,
+    metadata_fields: list[str] | None = None,
+    include: list[AttributionDocumentField] | None = None,
+    stream_events: bool = False,
 ) -> str:
     extracted_context = TraceContextTextMapPropagator().extract(carrier=otel_context)
 
@@ -67,53 +118,378 @@ async def attribution_job(
         if worker is not None:
             otel_span.set_attribute(SpanAttributes.MESSAGING_CLIENT_ID, worker.id)
 
-        infini_gram_index = ctx["infini_gram_processor"]
+        event_stream = get_attribution_event_stream(job) if stream_events else None
 
-        attribute_result = await asyncio.to_thread(
-            infini_gram_index.attribute,
+        input_token_ids, input_tokens = await run_stage(
+            ctx["stage_executors"],
+            AttributionStage.TOKENIZE,
+            _tokenize_input,
+            infini_gram_index=ctx["infini_gram_processor"],
             input=input,
+        )
+
+        return await _attribute_input(
+            ctx,
+            index=index,
+            input_token_ids=input_token_ids,
+            input_tokens=input_tokens,
             delimiters=delimiters,
             allow_spans_with_partial_words=allow_spans_with_partial_words,
             minimum_span_length=minimum_span_length,
             maximum_frequency=maximum_frequency,
+            maximum_span_density=maximum_span_density,
+            span_ranking_method=span_ranking_method,
+            maximum_context_length=maximum_context_length,
+            maximum_context_length_long=maximum_context_length_long,
+            maximum_context_length_snippet=maximum_context_length_snippet,
+            maximum_documents_per_span=maximum_documents_per_span,
+            metadata_fields=metadata_fields,
+            include=include,
+            deadline=JobDeadline(deadline, job),
+            event_stream=event_stream,
         )
 
-        # Limit the density of spans, and keep the longest ones
-        maximum_num_spans = int(
-            np.ceil(len(attribute_result.input_token_ids) * maximum_span_density)
+
+async def attribution_batch_job(
+    ctx: AttributionWorkerContext,
+    *,
+    index: str,
+    inputs: list[str],
+    delimiters: list[str],
+    allow_spans_with_partial_words: bool,
+    minimum_span_length: int,
+    maximum_frequency: int,
+    maximum_span_density: float,
+    span_ranking_method: SpanRankingMethod,
+    maximum_context_length: int,
+    maximum_context_length_long: int,
+    maximum_context_length_snippet: int,
+    maximum_documents_per_span: int,
+    otel_context: dict[str, Any],
+    deadline: float | None = None,
+    metadata_fields: list[str] | None = None,
+    include: list[AttributionDocumentField] | None = None,
+) -> list[str]:
+    """
+    Attributes every input with the same options and returns their responses in order.
+
+    The inputs are attributed concurrently so their stages overlap in the stage executors and their document fetches go out in one grouped engine call.
+    """
+    extracted_context = TraceContextTextMapPropagator().extract(carrier=otel_context)
+
+    with tracer.start_as_current_span(
+        "attribution-worker/attribute-batch",
+        kind=SpanKind.CLIENT,
+        context=extracted_context,
+        attributes={
+            SpanAttributes.MESSAGING_SYSTEM: "saq",
+            TASK_NAME_KEY: "attribute_batch",
+            TASK_TAG_KEY: "apply_async",
+            "input_count": len(inputs),
+        },
+    ) as otel_span:
+        job = ctx.get("job")
+        if job is not None:
+            otel_span.set_attribute(SpanAttributes.MESSAGING_MESSAGE_ID, job.key)
+
+        worker = ctx.get("worker")
+        if worker is not None:
+            otel_span.set_attribute(SpanAttributes.MESSAGING_CLIENT_ID, worker.id)
+
+        # The inputs share one deadline, so an extension one of them reads from Redis applies to all of them
+        job_deadline = JobDeadline(deadline, job)
+
+        # Every input is tokenized in one call so the fast tokenizer can encode them in parallel
+        tokenized_inputs = await run_stage(
+            ctx["stage_executors"],
+            AttributionStage.TOKENIZE,
+            _tokenize_inputs,
+            infini_gram_index=ctx["infini_gram_processor"],
+            inputs=inputs,
         )
 
-        sorted_spans = sort_and_cap_spans(
-            attribute_result.spans,
-            ranking_method=span_ranking_method,
-            maximum_num_spans=maximum_num_spans,
+        return list(
+            await asyncio.gather(
+                *[
+                    _attribute_input(
+                        ctx,
+                        index=index,
+                        input_token_ids=input_token_ids,
+                        input_tokens=input_tokens,
+                        delimiters=delimiters,
+                        allow_spans_with_partial_words=allow_spans_with_partial_words,
+                        minimum_span_length=minimum_span_length,
+                        maximum_frequency=maximum_frequency,
+                        maximum_span_density=maximum_span_density,
+                        span_ranking_method=span_ranking_method,
+                        maximum_context_length=maximum_context_length,
+                        maximum_context_length_long=maximum_context_length_long,
+                        maximum_context_length_snippet=maximum_context_length_snippet,
+                        maximum_documents_per_span=maximum_documents_per_span,
+                        metadata_fields=metadata_fields,
+                        include=include,
+                        deadline=job_deadline,
+                        event_stream=None,
+                    )
+                    for input_token_ids, input_tokens in tokenized_inputs
+                ]
+            )
         )
 
-        document_request_by_span = get_document_requests(
-            spans=sorted_spans,
+
+async def _attribute_input(
+    ctx: AttributionWorkerContext,
+    *,
+    index: str,
+    input_token_ids: list[int],
+    input_tokens: Sequence[str],
+    delimiters: list[str],
+    allow_spans_with_partial_words: bool,
+    minimum_span_length: int,
+    maximum_frequency: int,
+    maximum_span_density: float,
+    span_ranking_method: SpanRankingMethod,
+    maximum_context_length: int,
+    maximum_context_length_long: int,
+    maximum_context_length_snippet: int,
+    maximum_documents_per_span: int,
+    metadata_fields: list[str] | None,
+    include: list[AttributionDocumentField] | None,
+    deadline: JobDeadline,
+    event_stream: AttributionEventStream | None,
+) -> str:
+    infini_gram_index = ctx["infini_gram_processor"]
+    executors = ctx["stage_executors"]
+
+    await _raise_if_expired(deadline, AttributionStage.ATTRIBUTE, index=index)
+    attribute_result = await run_stage(
+        executors,
+        AttributionStage.ATTRIBUTE,
+        infini_gram_index.attribute_tokens,
+        input_ids=input_token_ids,
+        delimiters=delimiters,
+        allow_spans_with_partial_words=allow_spans_with_partial_words,
+        minimum_span_length=minimum_span_length,
+        maximum_frequency=maximum_frequency,
+    )
+
+    sorted_spans, document_request_by_span = await run_stage(
+        executors,
+        AttributionStage.RANK_SPANS,
+        _rank_spans,
+        attribute_result=attribute_result,
+        maximum_span_density=maximum_span_density,
+        span_ranking_method=span_ranking_method,
+        maximum_documents_per_span=maximum_documents_per_span,
+        maximum_context_length=maximum_context_length,
+    )
+
+    if event_stream is not None:
+        await _publish_spans(
+            event_stream,
+            infini_gram_index=infini_gram_index,
+            sorted_spans=sorted_spans,
             input_token_ids=attribute_result.input_token_ids,
+            input_tokens=input_tokens,
+        )
+
+    await _raise_if_expired(deadline, AttributionStage.FETCH_DOCUMENTS, index=index)
+    excluded_fields = get_excluded_document_fields(include)
+    span_document_cache = ctx.get("span_document_cache")
+    span_cache_keys = [
+        get_span_cache_key(
+            index=infini_gram_index.index,
+            span_token_ids=document_request.span_ids,
             maximum_documents_per_span=maximum_documents_per_span,
             maximum_context_length=maximum_context_length,
+            maximum_context_length_long=maximum_context_length_long,
+            maximum_context_length_snippet=maximum_context_length_snippet,
+            metadata_fields=metadata_fields,
+            excluded_fields=excluded_fields,
         )
+        for document_request in document_request_by_span
+    ]
+    cached_documents_by_span: list[list[AttributionDocument] | None] = (
+        await span_document_cache.get_many(
+            span_cache_keys, index=infini_gram_index.index
+        )
+        if span_document_cache is not None
+        else [None] * len(span_cache_keys)
+    )
+    uncached_span_indexes = [
+        span_index
+        for span_index, cached_documents in enumerate(cached_documents_by_span)
+        if cached_documents is None
+    ]
 
-        documents_by_span = await asyncio.to_thread(
-            infini_gram_index.get_documents_by_pointers,
-            document_request_by_span=document_request_by_span,
+    if event_stream is not None:
+        # Cached spans are ready now, so clients don't have to wait on the fetch to show them
+        await _publish_span_documents(
+            event_stream,
+            [
+                (span_index, cached_documents)
+                for span_index, cached_documents in enumerate(cached_documents_by_span)
+                if cached_documents is not None
+            ],
+            excluded_fields=excluded_fields,
         )
 
-        spans_with_documents: list[AttributionSpan] = get_spans_with_documents(
-            infini_gram_index=infini_gram_index,
-            spans=sorted_spans,
-            documents_by_span=documents_by_span,
-            input_token_ids=attribute_result.input_token_ids,
-            maximum_context_length_long=maximum_context_length_long,
-            maximum_context_length_snippet=maximum_context_length_snippet,
+    # Fetches from concurrent jobs are grouped into one engine call by the batcher
+    fetched_documents = await ctx["document_fetch_batcher"].fetch(
+        [document_request_by_span[span_index] for span_index in uncached_span_indexes]
+    )
+
+    await _raise_if_expired(deadline, AttributionStage.CUT_DOCUMENTS, index=index)
+    spans_with_documents = await run_stage(
+        executors,
+        AttributionStage.CUT_DOCUMENTS,
+        get_spans_with_documents,
+        infini_gram_index=infini_gram_index,
+        spans=sorted_spans,
+        cached_documents_by_span=cached_documents_by_span,
+        fetched_documents=fetched_documents,
+        input_token_ids=attribute_result.input_token_ids,
+        maximum_context_length_long=maximum_context_length_long,
+        maximum_context_length_snippet=maximum_context_length_snippet,
+        metadata_fields=metadata_fields,
+        excluded_fields=excluded_fields,
+    )
+
+    if event_stream is not None:
+        await _publish_span_documents(
+            event_stream,
+            [
+                (span_index, spans_with_documents[span_index].documents)
+                for span_index in uncached_span_indexes
+            ],
+            excluded_fields=excluded_fields,
         )
 
-        response = AttributionResponse(
-            index=infini_gram_index.index,
-            spans=spans_with_documents,
-            input_tokens=infini_gram_index.tokenize_to_list(input),
+    if span_document_cache is not None:
+        await span_document_cache.set_many(
+            {
+                span_cache_keys[span_index]: spans_with_documents[span_index].documents
+                for span_index in uncached_span_indexes
+            },
+            excluded_fields=excluded_fields,
+        )
+
+    response = AttributionResponse(
+        index=infini_gram_index.index,
+        spans=spans_with_documents,
+        input_tokens=input_tokens,
+    )
+
+    # The API returns this JSON to clients as-is, so it's serialized the same way the API serializes responses
+    return await run_stage(
+        executors,
+        AttributionStage.SERIALIZE,
+        response.model_dump_json,
+        by_alias=True,
+        exclude={"spans": {"__all__": {"documents": {"__all__": set(excluded_fields)}}}}
+        if len(excluded_fields) > 0
+        else None,
+    )
+
+
+def _tokenize_input(
+    infini_gram_index: InfiniGramProcessor, input: str
+) -> tuple[list[int], Sequence[str]]:
+    # One tokenizer pass gives us both the ids to attribute and the token strings to return
+    input_token_ids, offsets = infini_gram_index.tokenize_with_offsets(input)
+
+    return input_token_ids, [input[start:stop] for start, stop in offsets]
+
+
+def _tokenize_inputs(
+    infini_gram_index: InfiniGramProcessor, inputs: list[str]
+) -> list[tuple[list[int], Sequence[str]]]:
+    return [
+        (input_token_ids, [input[start:stop] for start, stop in offsets])
+        for input, (input_token_ids, offsets) in zip(
+            inputs, infini_gram_index.tokenize_batch_with_offsets(inputs)
         )
+    ]
+
+
+def _rank_spans(
+    attribute_result: InfiniGramAttributionResponse,
+    maximum_span_density: float,
+    span_ranking_method: SpanRankingMethod,
+    maximum_documents_per_span: int,
+    maximum_context_length: int,
+) -> tuple[list[AttributionSpanFromEngine], list[GetDocumentByPointerRequest]]:
+    # Limit the density of spans, and keep the longest ones
+    maximum_num_spans = int(
+        np.ceil(len(attribute_result.input_token_ids) * maximum_span_density)
+    )
+
+    sorted_spans = sort_and_cap_spans(
+        attribute_result.spans,
+        ranking_method=span_ranking_method,
+        maximum_num_spans=maximum_num_spans,
+    )
+
+    document_request_by_span = get_document_requests(
+        spans=sorted_spans,
+        input_token_ids=attribute_result.input_token_ids,
+        maximum_documents_per_span=maximum_documents_per_span,
+        maximum_context_length=maximum_context_length,
+    )
+
+    return sorted_spans, document_request_by_span
+
+
+async def _publish_spans(
+    event_stream: AttributionEventStream,
+    infini_gram_index: InfiniGramProcessor,
+    sorted_spans: list[AttributionSpanFromEngine],
+    input_token_ids: list[int],
+    input_tokens: Sequence[str],
+) -> None:
+    # Spans only need the input to be built, so clients can highlight them before any documents are ready
+    spans_without_documents = get_spans_with_documents(
+        infini_gram_index=infini_gram_index,
+        spans=sorted_spans,
+        cached_documents_by_span=[[] for _ in sorted_spans],
+        fetched_documents=DocumentBatch.from_engine_results([]),
+        input_token_ids=input_token_ids,
+        maximum_context_length_long=0,
+        maximum_context_length_snippet=0,
+    )
+
+    await event_stream.publish(
+        [
+            (
+                AttributionEvent.SPANS,
+                AttributionResponse(
+                    index=infini_gram_index.index,
+                    spans=spans_without_documents,
+                    input_tokens=input_tokens,
+                ).model_dump_json(by_alias=True),
+            )
+        ]
+    )
+
 
-        return response.model_dump_json()
+async def _publish_span_documents(
+    event_stream: AttributionEventStream,
+    documents_by_span_index: list[tuple[int, list[AttributionDocument]]],
+    excluded_fields: AbstractSet[str],
+) -> None:
+    await event_stream.publish(
+        [
+            (
+                AttributionEvent.DOCUMENTS,
+                AttributionSpanDocuments(
+                    span_index=span_index, documents=documents
+                ).model_dump_json(
+                    by_alias=True,
+                    exclude={"documents": {"__all__": set(excluded_fields)}}
+                    if len(excluded_fields) > 0
+                    else None,
+                ),
+            )
+            for span_index, documents in documents_by_span_index
+        ]
+    )
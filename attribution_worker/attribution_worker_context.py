@@ -1,6 +1,20 @@
+import asyncio
+
 from infini_gram_processor.processor import InfiniGramProcessor
+from infinigram_api_shared.saq.queue_utils import AttributionPriority
+from saq import Worker
 from saq.types import Context
 
+from attribution_worker.document_fetch_batcher import DocumentFetchBatcher
+from attribution_worker.span_document_cache import SpanDocumentCache
+from attribution_worker.stage_executors import StageExecutors
+
 
 class AttributionWorkerContext(Context):
     infini_gram_processor: InfiniGramProcessor
+    stage_executors: StageExecutors
+    span_document_cache: SpanDocumentCache | None
+    document_fetch_batcher: DocumentFetchBatcher
+    priority: AttributionPriority
+    bulk_worker: Worker["AttributionWorkerContext"]
+    bulk_worker_task: asyncio.Task[None]
@@ -1,3 +1,4 @@
+from infinigram_api_shared.cache.cache_codec import CacheCodecName
 from pydantic import computed_field
 from pydantic_settings import BaseSettings, SettingsConfigDict
 
@@ -9,7 +10,22 @@ class Config(BaseSettings):
     index_base_path: str = "/mnt/infinigram-array"
     application_name: str = "infini-gram-api-worker"
     attribution_queue_url: str = "redis://localhost:6379"
+    cache_url: str | None = None
+    span_cache_expiration_seconds: int = 43_200
+    cache_codec: CacheCodecName = CacheCodecName.ZLIB
+    cache_compression_level: int = 6
     skiff_env: str = "prod"
+    job_concurrency: int = 4
+    bulk_job_concurrency: int = 1
+    engine_thread_pool_size: int = 4
+    post_processing_thread_pool_size: int = 4
+    bulk_engine_thread_pool_size: int = 1
+    bulk_post_processing_thread_pool_size: int = 1
+    document_fetch_batch_wait_seconds: float = 0.002
+    document_fetch_batch_max_spans: int = 256
+    warmup_queries_path: str | None = None
+    warmup_query_limit: int = 100
+    warmup_prefault_pages_per_file: int = 0
 
     is_otel_enabled: bool = True
     otel_service_name: str = "infinigram-api"
@@ -21,6 +37,14 @@ class Config(BaseSettings):
 
         return f"{queue_prefix}-{self.skiff_env}"
 
+    @computed_field  # type: ignore[prop-decorator]
+    @property
+    def is_warmup_enabled(self) -> bool:
+        return (
+            self.warmup_queries_path is not None
+            or self.warmup_prefault_pages_per_file > 0
+        )
+
     @computed_field  # type: ignore[prop-decorator]
     @property
     def is_prod_environment(self) -> bool:
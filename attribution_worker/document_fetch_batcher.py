@@ -0,0 +1,133 @@
+import asyncio
+from dataclasses import dataclass
+
+from infini_gram_processor.document_batch import DocumentBatch
+from infini_gram_processor.models import GetDocumentByPointerRequest
+from infini_gram_processor.processor import InfiniGramProcessor
+from opentelemetry import metrics, trace
+
+from .config import get_config
+from .stage_executors import AttributionStage, StageExecutors, run_stage
+
+config = get_config()
+
+meter = metrics.get_meter(config.application_name)
+
+batch_job_count = meter.create_histogram(
+    "attribution_worker.document_fetch_batch.jobs",
+    description="Number of attribution jobs whose document fetches were grouped into one engine call",
+)
+batch_span_count = meter.create_histogram(
+    "attribution_worker.document_fetch_batch.spans",
+    description="Number of spans fetched in one grouped engine call",
+)
+
+
+@dataclass
+class _PendingFetch:
+    document_request_by_span: list[GetDocumentByPointerRequest]
+    future: asyncio.Future[DocumentBatch]
+
+
+class DocumentFetchBatcher:
+    """
+    Groups the document fetches of concurrent attribution jobs into one get_docs_by_ptrs_2_grouped call.
+
+    A batch is sent once max_spans spans are waiting or max_wait_seconds after its first fetch arrived, whichever comes first.
+    """
+
+    def __init__(
+        self,
+        infini_gram_processor: InfiniGramProcessor,
+        executors: StageExecutors,
+        max_wait_seconds: float,
+        max_spans: int,
+    ):
+        self.infini_gram_processor = infini_gram_processor
+        self.executors = executors
+        self.max_wait_seconds = max_wait_seconds
+        self.max_spans = max_spans
+
+        self._pending: list[_PendingFetch] = []
+        self._pending_span_count = 0
+        self._flush_handle: asyncio.TimerHandle | None = None
+        # Keep references to in-flight batches so they aren't garbage collected
+        self._batch_tasks: set[asyncio.Task[None]] = set()
+
+    async def fetch(
+        self, document_request_by_span: list[GetDocumentByPointerRequest]
+    ) -> DocumentBatch:
+        if len(document_request_by_span) == 0:
+            return DocumentBatch.from_engine_results([])
+
+        loop = asyncio.get_running_loop()
+        pending_fetch = _PendingFetch(
+            document_request_by_span=document_request_by_span,
+            future=loop.create_future(),
+        )
+        self._pending.append(pending_fetch)
+        self._pending_span_count += len(document_request_by_span)
+
+        if self._pending_span_count >= self.max_spans:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = loop.call_later(self.max_wait_seconds, self._flush)
+
+        return await pending_fetch.future
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        batch = self._pending
+        self._pending = []
+        self._pending_span_count = 0
+
+        if len(batch) == 0:
+            return
+
+        task = asyncio.create_task(self._fetch_batch(batch))
+        self._batch_tasks.add(task)
+        task.add_done_callback(self._batch_tasks.discard)
+
+    async def _fetch_batch(self, batch: list[_PendingFetch]) -> None:
+        document_request_by_span = [
+            document_request
+            for pending_fetch in batch
+            for document_request in pending_fetch.document_request_by_span
+        ]
+
+        batch_job_count.record(len(batch))
+        batch_span_count.record(len(document_request_by_span))
+        trace.get_current_span().add_event(
+            "fetching-document-batch",
+            attributes={
+                "job_count": len(batch),
+                "span_count": len(document_request_by_span),
+            },
+        )
+
+        try:
+            # Documents are decoded while they're cut so each one only gets decoded once
+            documents = await run_stage(
+                self.executors,
+                AttributionStage.FETCH_DOCUMENTS,
+                self.infini_gram_processor.get_document_batch_by_pointers,
+                document_request_by_span=document_request_by_span,
+            )
+        except Exception as ex:
+            for pending_fetch in batch:
+                if not pending_fetch.future.done():
+                    pending_fetch.future.set_exception(ex)
+            return
+
+        offset = 0
+        for pending_fetch in batch:
+            span_count = len(pending_fetch.document_request_by_span)
+            # A job can be aborted while it waits on its batch
+            if not pending_fetch.future.done():
+                pending_fetch.future.set_result(
+                    documents.select_spans(offset, offset + span_count)
+                )
+            offset += span_count
@@ -1,76 +1,165 @@
 import random
+from typing import AbstractSet, Collection, Sequence
 
 from infini_gram.models import AttributionSpan as AttributionSpanFromEngine
+from infini_gram_processor.document_batch import DocumentBatch
+from infini_gram_processor.document_metadata import parse_document_metadata
 from infini_gram_processor.models import (
     AttributionDocument,
+    AttributionDocumentField,
     AttributionSpan,
-    Document,
     GetDocumentByPointerRequest,
     SpanRankingMethod,
 )
 from infini_gram_processor.processor import InfiniGramProcessor
 
 from .get_span_text import get_span_text
+from .span_ranking import SpanColumns, rank_and_cap_spans
 
 
-def cut_document(
-    infini_gram_index: InfiniGramProcessor,
-    token_ids: list[int],
+def get_cut_range(
+    document_length: int,
     needle_offset: int,
     span_length: int,
     maximum_context_length: int,
-) -> tuple[int, int, str]:
+) -> tuple[int, int, int]:
+    """
+    Finds the [start, stop) token range of a document that keeps at most maximum_context_length tokens on each side of the span.
+
+    Returns the range along with the needle offset inside of it.
+    """
     # cut the left context if necessary
-    if needle_offset > maximum_context_length:
-        token_ids = token_ids[(needle_offset - maximum_context_length) :]
-        needle_offset = maximum_context_length
+    start = max(needle_offset - maximum_context_length, 0)
     # cut the right context if necessary
-    if len(token_ids) - needle_offset - span_length > maximum_context_length:
-        token_ids = token_ids[: (needle_offset + span_length + maximum_context_length)]
-    display_length = len(token_ids)
-    text = infini_gram_index.decode_tokens(token_ids)
-    return display_length, needle_offset, text
+    stop = min(needle_offset + span_length + maximum_context_length, document_length)
+    return start, stop, needle_offset - start
+
+
+def get_excluded_document_fields(
+    include: Collection[str] | None,
+) -> frozenset[str]:
+    """
+    Finds the optional document fields that weren't asked for. Nothing is excluded when include is None.
+    """
+    if include is None:
+        return frozenset()
+
+    return frozenset(
+        field for field in AttributionDocumentField if field not in include
+    )
+
+
+def cut_document(
+    infini_gram_index: InfiniGramProcessor,
+    documents: DocumentBatch,
+    position: int,
+    span_length: int,
+    maximum_context_length_long: int,
+    maximum_context_length_snippet: int,
+    metadata_fields: Collection[str] | None = None,
+    excluded_fields: AbstractSet[str] = frozenset(),
+) -> AttributionDocument:
+    token_ids = documents.token_ids[position]
+    document_length = len(token_ids)
+    needle_offset = documents.needle_offsets[position]
+
+    start_long, stop_long, needle_offset_long = get_cut_range(
+        document_length=document_length,
+        needle_offset=needle_offset,
+        span_length=span_length,
+        maximum_context_length=maximum_context_length_long,
+    )
+    start_snippet, stop_snippet, needle_offset_snippet = get_cut_range(
+        document_length=document_length,
+        needle_offset=needle_offset,
+        span_length=span_length,
+        maximum_context_length=maximum_context_length_snippet,
+    )
+
+    text_ranges = {
+        field: text_range
+        for field, text_range in (
+            (AttributionDocumentField.TEXT, (0, document_length)),
+            (AttributionDocumentField.TEXT_LONG, (start_long, stop_long)),
+            (AttributionDocumentField.TEXT_SNIPPET, (start_snippet, stop_snippet)),
+        )
+        if field not in excluded_fields
+    }
+    texts: dict[AttributionDocumentField, str] = {}
+    if len(text_ranges) > 0:
+        # The views are cut from the same tokens, so we decode them all at once, and only as far as the requested views reach
+        decode_start = min(start for start, _ in text_ranges.values())
+        decode_stop = max(stop for _, stop in text_ranges.values())
+        decoded_texts = infini_gram_index.decode_token_ranges(
+            token_ids
+            if decode_start == 0 and decode_stop == document_length
+            else token_ids[decode_start:decode_stop],
+            [
+                (start - decode_start, stop - decode_start)
+                for start, stop in text_ranges.values()
+            ],
+        )
+        texts = dict(zip(text_ranges, decoded_texts))
+
+    # This is the only place a fetched document becomes a model. Its values come straight from the engine, so validating them would only copy them again.
+    return AttributionDocument.model_construct(
+        document_index=documents.document_indexes[position],
+        document_length=documents.document_lengths[position],
+        display_length=documents.display_lengths[position],
+        needle_offset=needle_offset,
+        metadata=parse_document_metadata(documents.metadata[position], metadata_fields),
+        token_ids=token_ids
+        if AttributionDocumentField.TOKEN_IDS not in excluded_fields
+        else [],
+        text=texts.get(AttributionDocumentField.TEXT, ""),
+        blocked=documents.blocked[position],
+        display_length_long=stop_long - start_long,
+        needle_offset_long=needle_offset_long,
+        text_long=texts.get(AttributionDocumentField.TEXT_LONG, ""),
+        display_offset_snippet=stop_snippet - start_snippet,
+        needle_offset_snippet=needle_offset_snippet,
+        text_snippet=texts.get(AttributionDocumentField.TEXT_SNIPPET, ""),
+    )
 
 
 def get_spans_with_documents(
     infini_gram_index: InfiniGramProcessor,
     spans: list[AttributionSpanFromEngine],
-    documents_by_span: list[list[Document]],
+    cached_documents_by_span: Sequence[list[AttributionDocument] | None],
+    fetched_documents: DocumentBatch,
     input_token_ids: list[int],
     maximum_context_length_long: int,
     maximum_context_length_snippet: int,
+    metadata_fields: Collection[str] | None = None,
+    excluded_fields: AbstractSet[str] = frozenset(),
 ) -> list[AttributionSpan]:
+    """
+    Builds the response's spans. Spans without cached documents take the next span's documents from fetched_documents, in order.
+    """
+    fetched_span_index = 0
     spans_with_documents: list[AttributionSpan] = []
-    for span, documents in zip(spans, documents_by_span):
-        span_documents: list[AttributionDocument] = []
-        for document in documents:
-            display_length_long, needle_offset_long, text_long = cut_document(
-                infini_gram_index=infini_gram_index,
-                token_ids=document.token_ids,
-                needle_offset=document.needle_offset,
-                span_length=span["length"],
-                maximum_context_length=maximum_context_length_long,
-            )
-
-            display_length_snippet, needle_offset_snippet, text_snippet = cut_document(
-                infini_gram_index=infini_gram_index,
-                token_ids=document.token_ids,
-                needle_offset=document.needle_offset,
-                span_length=span["length"],
-                maximum_context_length=maximum_context_length_snippet,
-            )
-
-            span_documents.append(
-                AttributionDocument(
-                    **vars(document),
-                    display_length_long=display_length_long,
-                    needle_offset_long=needle_offset_long,
-                    text_long=text_long,
-                    display_offset_snippet=display_length_snippet,
-                    needle_offset_snippet=needle_offset_snippet,
-                    text_snippet=text_snippet,
+    for span, cached_documents in zip(spans, cached_documents_by_span):
+        # Documents that came from the span document cache have already been cut
+        span_documents: list[AttributionDocument]
+        if cached_documents is not None:
+            span_documents = cached_documents
+        else:
+            span_documents = [
+                cut_document(
+                    infini_gram_index=infini_gram_index,
+                    documents=fetched_documents,
+                    position=position,
+                    span_length=span["length"],
+                    maximum_context_length_long=maximum_context_length_long,
+                    maximum_context_length_snippet=maximum_context_length_snippet,
+                    metadata_fields=metadata_fields,
+                    excluded_fields=excluded_fields,
                 )
-            )
+                for position in fetched_documents.get_span_document_range(
+                    fetched_span_index
+                )
+            ]
+            fetched_span_index += 1
 
         (span_text_tokens, span_text) = get_span_text(
             infini_gram_index=infini_gram_index,
@@ -105,8 +194,8 @@ def get_document_requests(
     for span in spans:
         docs = span["docs"]
         if len(docs) > maximum_documents_per_span:
-            random.seed(42)  # For reproducibility
-            docs = random.sample(docs, maximum_documents_per_span)
+            # For reproducibility. Each call gets its own generator since concurrent jobs rank their spans on separate threads.
+            docs = random.Random(42).sample(docs, maximum_documents_per_span)
         document_request_by_span.append(
             GetDocumentByPointerRequest(
                 docs=docs,
@@ -123,17 +212,10 @@ def sort_and_cap_spans(
     ranking_method: SpanRankingMethod,
     maximum_num_spans: int,
 ) -> list[AttributionSpanFromEngine]:
-    sorted_spans: list[AttributionSpanFromEngine]
-
-    if ranking_method == SpanRankingMethod.LENGTH:
-        sorted_spans = sorted(spans, key=lambda x: x["length"], reverse=True)
-    elif ranking_method == SpanRankingMethod.UNIGRAM_LOGPROB_SUM:
-        sorted_spans = sorted(
-            spans,
-            key=lambda x: x["unigram_logprob_sum"],
-            reverse=False,
-        )
-    else:
-        raise ValueError(f"Unknown span ranking method: {ranking_method}")
+    selected_span_indexes = rank_and_cap_spans(
+        SpanColumns(spans),
+        ranking_method=ranking_method,
+        maximum_num_spans=maximum_num_spans,
+    )
 
-    return sorted(list(sorted_spans[:maximum_num_spans]), key=lambda span: span["l"])
+    return [spans[span_index] for span_index in selected_span_indexes]
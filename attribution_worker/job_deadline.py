@@ -0,0 +1,43 @@
+import logging
+import time
+
+from infinigram_api_shared.saq.attribution_deadlines import (
+    get_attribution_job_deadline,
+)
+from saq import Job
+from saq.queue.redis import RedisQueue
+
+logger = logging.getLogger()
+
+
+class JobDeadline:
+    """
+    When the last caller waiting on an attribution job stops waiting.
+
+    The job's deadline kwarg comes from whoever enqueued it, and callers that join it later can push it out in Redis.
+    Redis is only asked once that first deadline has passed, so jobs that finish in time never pay for the round trip.
+    """
+
+    def __init__(self, deadline: float | None, job: Job | None):
+        self.deadline = deadline
+        self._job = job
+
+    async def has_passed(self) -> bool:
+        if self.deadline is None or time.time() < self.deadline:
+            return False
+
+        if self._job is None or not isinstance(self._job.queue, RedisQueue):
+            return True
+
+        try:
+            extended_deadline = await get_attribution_job_deadline(
+                self._job.queue.redis, self._job.queue.name, self._job.key
+            )
+        except Exception:
+            logger.warning("Failed to read attribution job deadline", exc_info=True)
+            return True
+
+        if extended_deadline is not None and extended_deadline > self.deadline:
+            self.deadline = extended_deadline
+
+        return time.time() >= self.deadline
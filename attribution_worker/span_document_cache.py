@@ -0,0 +1,150 @@
+import json
+import logging
+from hashlib import sha256
+from typing import AbstractSet, Collection, Sequence
+
+from infini_gram_processor.models import AttributionDocument
+from infinigram_api_shared.cache.cache_codec import CacheCodec, decode_cache_value
+from opentelemetry import metrics, trace
+from pydantic import TypeAdapter, ValidationError
+from redis.asyncio import Redis
+
+from .config import get_config
+
+config = get_config()
+
+tracer = trace.get_tracer(config.application_name)
+meter = metrics.get_meter(config.application_name)
+logger = logging.getLogger()
+
+span_cache_hits = meter.create_counter(
+    "attribution_worker.span_cache.hits",
+    description="Spans whose documents were found in the span document cache",
+)
+span_cache_misses = meter.create_counter(
+    "attribution_worker.span_cache.misses",
+    description="Spans whose documents had to be fetched from the index",
+)
+
+_span_documents_adapter = TypeAdapter(list[AttributionDocument])
+
+_CACHE_NAME = "span_documents"
+
+# Bump this if the shape of a cached AttributionDocument changes so old entries are ignored
+_CACHE_KEY_VERSION = 2
+
+
+def get_span_cache_key(
+    index: str,
+    span_token_ids: Sequence[int],
+    maximum_documents_per_span: int,
+    maximum_context_length: int,
+    maximum_context_length_long: int,
+    maximum_context_length_snippet: int,
+    metadata_fields: Collection[str] | None,
+    excluded_fields: Collection[str],
+) -> bytes:
+    """
+    Builds the cache key for the documents attributed to a span.
+
+    The engine returns every occurrence of a span's tokens and we sample them with a fixed seed, so the same tokens always resolve to the same documents.
+    The cached documents are already cut and shaped, so every context length, metadata field, and excluded field is part of the key.
+    """
+    span_ids = ",".join(str(token_id) for token_id in span_token_ids)
+    # JSON keeps "every field" (null) apart from any list of fields, even ones with commas in them
+    metadata_key = json.dumps(
+        sorted(set(metadata_fields)) if metadata_fields is not None else None
+    )
+    combined_key = (
+        f"span-documents:v{_CACHE_KEY_VERSION}::{index}::{maximum_documents_per_span}"
+        f"::{maximum_context_length}::{maximum_context_length_long}::{maximum_context_length_snippet}"
+        f"::{metadata_key}::{json.dumps(sorted(excluded_fields))}::{span_ids}"
+    )
+
+    return sha256(combined_key.encode("utf-8")).digest()
+
+
+class SpanDocumentCache:
+    """
+    Stores the documents attributed to a span so jobs that share spans don't have to fetch them from the index again.
+    """
+
+    cache: Redis
+    cache_codec: CacheCodec
+    expiration_seconds: int
+
+    def __init__(self, cache: Redis, cache_codec: CacheCodec, expiration_seconds: int):
+        self.cache = cache
+        self.cache_codec = cache_codec
+        self.expiration_seconds = expiration_seconds
+
+    @tracer.start_as_current_span("span_document_cache/get_many")
+    async def get_many(
+        self, keys: Sequence[bytes], index: str
+    ) -> list[list[AttributionDocument] | None]:
+        if len(keys) == 0:
+            return []
+
+        try:
+            cached_values: list[bytes | None] = await self.cache.mget(keys)
+        except Exception:
+            logger.warning("Failed to retrieve cached span documents", exc_info=True)
+            cached_values = [None] * len(keys)
+
+        documents_by_span: list[list[AttributionDocument] | None] = []
+        for cached_value in cached_values:
+            if cached_value is None:
+                documents_by_span.append(None)
+                continue
+
+            try:
+                documents_by_span.append(
+                    _span_documents_adapter.validate_json(
+                        decode_cache_value(cached_value, cache_name=_CACHE_NAME)
+                    )
+                )
+            except ValidationError:
+                logger.error("Failed to parse cached span documents", exc_info=True)
+                documents_by_span.append(None)
+            except Exception:
+                logger.error("Failed to decode cached span documents", exc_info=True)
+                documents_by_span.append(None)
+
+        hits = sum(1 for documents in documents_by_span if documents is not None)
+        span_cache_hits.add(hits, attributes={"index": index})
+        span_cache_misses.add(len(keys) - hits, attributes={"index": index})
+        trace.get_current_span().set_attributes(
+            {"span_count": len(keys), "cache_hits": hits}
+        )
+
+        return documents_by_span
+
+    @tracer.start_as_current_span("span_document_cache/set_many")
+    async def set_many(
+        self,
+        documents_by_key: dict[bytes, list[AttributionDocument]],
+        excluded_fields: AbstractSet[str] = frozenset(),
+    ) -> None:
+        if len(documents_by_key) == 0:
+            return
+
+        try:
+            async with self.cache.pipeline(transaction=False) as pipeline:
+                for key, documents in documents_by_key.items():
+                    pipeline.set(
+                        key,
+                        self.cache_codec.encode(
+                            # Fields the request left out are left out of the cache too, and read back as their defaults
+                            _span_documents_adapter.dump_json(
+                                documents,
+                                exclude={"__all__": set(excluded_fields)}
+                                if len(excluded_fields) > 0
+                                else None,
+                            ),
+                            cache_name=_CACHE_NAME,
+                        ),
+                        ex=self.expiration_seconds,
+                    )
+                await pipeline.execute()
+        except Exception:
+            logger.warning("Failed to cache span documents", exc_info=True)
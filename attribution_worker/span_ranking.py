@@ -0,0 +1,140 @@
+from functools import cached_property
+from operator import itemgetter
+from typing import Any
+
+import numpy as np
+import numpy.typing as npt
+from infini_gram.models import AttributionSpan as AttributionSpanFromEngine
+from infini_gram_processor.models import SpanRankingMethod
+
+
+class SpanColumns:
+    """
+    The engine's spans as one array per field, so they can be ranked without sorting Python dicts.
+
+    Columns are built the first time they're used, so ranking only pays for the fields its method needs.
+    """
+
+    def __init__(self, spans: list[AttributionSpanFromEngine]):
+        self._spans = spans
+
+    def __len__(self) -> int:
+        return len(self._spans)
+
+    def _get_column(
+        self, field: str, dtype: type[np.int64] | type[np.float64]
+    ) -> npt.NDArray[Any]:
+        return np.fromiter(map(itemgetter(field), self._spans), dtype, len(self))
+
+    @cached_property
+    def left(self) -> npt.NDArray[np.int64]:
+        return self._get_column("l", np.int64)
+
+    @cached_property
+    def right(self) -> npt.NDArray[np.int64]:
+        return self._get_column("r", np.int64)
+
+    @cached_property
+    def length(self) -> npt.NDArray[np.int64]:
+        return self._get_column("length", np.int64)
+
+    @cached_property
+    def count(self) -> npt.NDArray[np.int64]:
+        return self._get_column("count", np.int64)
+
+    @cached_property
+    def unigram_logprob_sum(self) -> npt.NDArray[np.float64]:
+        return self._get_column("unigram_logprob_sum", np.float64)
+
+
+def _get_ranking_keys(
+    columns: SpanColumns, ranking_method: SpanRankingMethod
+) -> npt.NDArray[np.float64]:
+    """
+    Returns a key per span where a smaller key means a better span.
+    """
+    if ranking_method in (
+        SpanRankingMethod.LENGTH,
+        SpanRankingMethod.OVERLAP_SUPPRESSED,
+    ):
+        return -columns.length.astype(np.float64)
+    elif ranking_method == SpanRankingMethod.UNIGRAM_LOGPROB_SUM:
+        return columns.unigram_logprob_sum
+    elif ranking_method == SpanRankingMethod.COUNT_WEIGHTED_LENGTH:
+        # A span that only appears once keeps its full length, and more common spans are discounted
+        count_weighted_keys: npt.NDArray[np.float64] = -columns.length / np.log2(
+            np.maximum(columns.count, 1) + 1
+        )
+        return count_weighted_keys
+    else:
+        raise ValueError(f"Unknown span ranking method: {ranking_method}")
+
+
+def _select_top_k(keys: npt.NDArray[np.float64], k: int) -> npt.NDArray[np.intp]:
+    """
+    Picks the k spans with the smallest keys in O(n), breaking ties by position like a stable sort would.
+    """
+    if k >= len(keys):
+        return np.arange(len(keys))
+    if k <= 0:
+        return np.array([], dtype=np.intp)
+
+    kth_key = np.partition(keys, k - 1)[k - 1]
+    better_indexes = np.flatnonzero(keys < kth_key)
+    tied_indexes = np.flatnonzero(keys == kth_key)[: k - len(better_indexes)]
+
+    return np.concatenate([better_indexes, tied_indexes])
+
+
+def _select_non_overlapping(
+    columns: SpanColumns, keys: npt.NDArray[np.float64], k: int
+) -> npt.NDArray[np.intp]:
+    """
+    Greedily picks the best spans that don't share any tokens with a span that was already picked.
+    """
+    if k <= 0 or len(keys) == 0:
+        return np.array([], dtype=np.intp)
+
+    covered_tokens = np.zeros(int(columns.right.max()), dtype=np.bool_)
+    selected_indexes: list[int] = []
+    for span_index in np.argsort(keys, kind="stable"):
+        left, right = columns.left[span_index], columns.right[span_index]
+        if covered_tokens[left:right].any():
+            continue
+
+        covered_tokens[left:right] = True
+        selected_indexes.append(int(span_index))
+        if len(selected_indexes) == k:
+            break
+
+    return np.array(selected_indexes, dtype=np.intp)
+
+
+def rank_and_cap_spans(
+    columns: SpanColumns,
+    ranking_method: SpanRankingMethod,
+    maximum_num_spans: int,
+) -> npt.NDArray[np.intp]:
+    """
+    Picks the best maximum_num_spans spans and returns their indexes ordered by where they start in the input.
+
+    Spans that start at the same token stay in ranking order.
+    """
+    keys = _get_ranking_keys(columns, ranking_method)
+
+    selected_indexes = (
+        _select_non_overlapping(columns, keys, maximum_num_spans)
+        if ranking_method == SpanRankingMethod.OVERLAP_SUPPRESSED
+        else _select_top_k(keys, maximum_num_spans)
+    )
+
+    # lexsort sorts by its last key first
+    order = np.lexsort(
+        (
+            selected_indexes,
+            keys[selected_indexes],
+            columns.left[selected_indexes],
+        )
+    )
+    ordered_indexes: npt.NDArray[np.intp] = selected_indexes[order]
+    return ordered_indexes
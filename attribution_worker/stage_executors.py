@@ -0,0 +1,104 @@
+import asyncio
+import contextvars
+import time
+from concurrent.futures import ThreadPoolExecutor
+from enum import StrEnum
+from functools import partial
+from typing import Callable, ParamSpec, TypeVar
+
+from opentelemetry import metrics, trace
+
+from .config import get_config
+
+config = get_config()
+
+tracer = trace.get_tracer(config.application_name)
+meter = metrics.get_meter(config.application_name)
+
+stage_queue_wait = meter.create_histogram(
+    "attribution_worker.stage.queue_wait",
+    unit="s",
+    description="Time an attribution stage waited for a free thread in its executor",
+)
+stage_execution = meter.create_histogram(
+    "attribution_worker.stage.execution",
+    unit="s",
+    description="Time an attribution stage spent running on its executor",
+)
+
+P = ParamSpec("P")
+T = TypeVar("T")
+
+
+class AttributionStage(StrEnum):
+    TOKENIZE = "tokenize"
+    ATTRIBUTE = "attribute"
+    RANK_SPANS = "rank_spans"
+    FETCH_DOCUMENTS = "fetch_documents"
+    CUT_DOCUMENTS = "cut_documents"
+    SERIALIZE = "serialize"
+
+
+# These stages call into the infini-gram engine, everything else is CPU-bound Python/tokenizer work
+_ENGINE_STAGES = {AttributionStage.ATTRIBUTE, AttributionStage.FETCH_DOCUMENTS}
+
+StageExecutors = dict[AttributionStage, ThreadPoolExecutor]
+
+
+def create_stage_executors(
+    engine_thread_pool_size: int = config.engine_thread_pool_size,
+    post_processing_thread_pool_size: int = config.post_processing_thread_pool_size,
+    thread_name_prefix: str = "attribution",
+) -> StageExecutors:
+    return {
+        stage: ThreadPoolExecutor(
+            max_workers=engine_thread_pool_size
+            if stage in _ENGINE_STAGES
+            else post_processing_thread_pool_size,
+            thread_name_prefix=f"{thread_name_prefix}-{stage.value}",
+        )
+        for stage in AttributionStage
+    }
+
+
+def shutdown_stage_executors(executors: StageExecutors) -> None:
+    for executor in executors.values():
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+async def run_stage(
+    executors: StageExecutors,
+    stage: AttributionStage,
+    fn: Callable[P, T],
+    *args: P.args,
+    **kwargs: P.kwargs,
+) -> T:
+    """
+    Runs one stage of an attribution job on that stage's executor.
+
+    Each stage has its own pool so a slow stage in one job doesn't hold up other jobs that are in a different stage.
+    Like asyncio.to_thread, this copies the current context so OTel spans started inside the stage are parented to the job.
+    """
+    submitted_at = time.perf_counter()
+    context = contextvars.copy_context()
+    attributes = {"stage": stage.value}
+
+    def run_in_span() -> T:
+        started_at = time.perf_counter()
+        queue_wait = started_at - submitted_at
+        stage_queue_wait.record(queue_wait, attributes=attributes)
+
+        try:
+            with tracer.start_as_current_span(
+                f"attribution-worker/{stage.value}",
+                attributes={"queue_wait_seconds": queue_wait},
+            ):
+                return fn(*args, **kwargs)
+        finally:
+            stage_execution.record(
+                time.perf_counter() - started_at, attributes=attributes
+            )
+
+    return await asyncio.get_running_loop().run_in_executor(
+        executors[stage], partial(context.run, run_in_span)
+    )
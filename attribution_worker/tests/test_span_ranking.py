@@ -0,0 +1,204 @@
+import random
+
+import pytest
+from infini_gram.models import AttributionSpan as AttributionSpanFromEngine
+from infini_gram_processor.models import SpanRankingMethod
+
+from attribution_worker.get_documents import sort_and_cap_spans
+
+
+def make_span(
+    left: int, right: int, count: int = 1, unigram_logprob_sum: float = -1.0
+) -> AttributionSpanFromEngine:
+    return {
+        "l": left,
+        "r": right,
+        "length": right - left,
+        "count": count,
+        "unigram_logprob_sum": unigram_logprob_sum,
+        "docs": [],
+    }
+
+
+def sort_and_cap_spans_with_stable_sorts(
+    spans: list[AttributionSpanFromEngine],
+    ranking_method: SpanRankingMethod,
+    maximum_num_spans: int,
+) -> list[AttributionSpanFromEngine]:
+    """
+    How spans were ranked before top-k selection, which LENGTH and UNIGRAM_LOGPROB_SUM have to keep matching.
+    """
+    if ranking_method == SpanRankingMethod.LENGTH:
+        sorted_spans = sorted(spans, key=lambda x: x["length"], reverse=True)
+    else:
+        sorted_spans = sorted(spans, key=lambda x: x["unigram_logprob_sum"])
+
+    return sorted(sorted_spans[:maximum_num_spans], key=lambda span: span["l"])
+
+
+def get_bounds(
+    spans: list[AttributionSpanFromEngine],
+) -> list[tuple[int, int]]:
+    return [(span["l"], span["r"]) for span in spans]
+
+
+@pytest.mark.parametrize(
+    "ranking_method",
+    [SpanRankingMethod.LENGTH, SpanRankingMethod.UNIGRAM_LOGPROB_SUM],
+)
+def test_matches_stable_sorts(ranking_method: SpanRankingMethod) -> None:
+    rng = random.Random(0)
+
+    for _ in range(500):
+        # Few distinct lengths, starts and logprobs so most keys are tied
+        spans = []
+        for _ in range(rng.randrange(0, 40)):
+            left = rng.randrange(0, 10)
+            spans.append(
+                make_span(
+                    left,
+                    left + rng.randrange(1, 4),
+                    unigram_logprob_sum=rng.choice([-3.0, -2.0, -1.0]),
+                )
+            )
+        maximum_num_spans = rng.randrange(0, len(spans) + 3)
+
+        selected_spans = sort_and_cap_spans(spans, ranking_method, maximum_num_spans)
+        expected_spans = sort_and_cap_spans_with_stable_sorts(
+            spans, ranking_method, maximum_num_spans
+        )
+        # Tied spans can be equal dicts, so we check they're the same spans in the same order
+        assert [id(span) for span in selected_spans] == [
+            id(span) for span in expected_spans
+        ]
+
+
+@pytest.mark.parametrize("ranking_method", list(SpanRankingMethod))
+def test_keeps_every_span_when_k_is_at_least_n(
+    ranking_method: SpanRankingMethod,
+) -> None:
+    spans = [make_span(4, 6), make_span(0, 3), make_span(8, 9)]
+
+    for maximum_num_spans in (3, 10):
+        assert get_bounds(
+            sort_and_cap_spans(spans, ranking_method, maximum_num_spans)
+        ) == [(0, 3), (4, 6), (8, 9)]
+
+
+@pytest.mark.parametrize("ranking_method", list(SpanRankingMethod))
+def test_keeps_no_spans_when_k_is_zero(ranking_method: SpanRankingMethod) -> None:
+    assert sort_and_cap_spans([make_span(0, 3)], ranking_method, 0) == []
+    assert sort_and_cap_spans([], ranking_method, 5) == []
+
+
+def test_breaks_ties_at_the_kth_key_by_position() -> None:
+    spans = [
+        make_span(20, 22),
+        make_span(0, 3),
+        make_span(10, 12),
+        make_span(30, 32),
+        make_span(40, 41),
+    ]
+
+    # Three spans are tied with length 2 for the last two places, so the first two of them are kept
+    assert get_bounds(sort_and_cap_spans(spans, SpanRankingMethod.LENGTH, 3)) == [
+        (0, 3),
+        (10, 12),
+        (20, 22),
+    ]
+
+
+def test_orders_spans_with_the_same_start_by_rank() -> None:
+    spans = [
+        make_span(5, 6, unigram_logprob_sum=-1.0),
+        make_span(5, 9, unigram_logprob_sum=-4.0),
+        make_span(0, 2, unigram_logprob_sum=-2.0),
+        make_span(5, 7, unigram_logprob_sum=-2.0),
+    ]
+
+    assert get_bounds(sort_and_cap_spans(spans, SpanRankingMethod.LENGTH, 4)) == [
+        (0, 2),
+        (5, 9),
+        (5, 7),
+        (5, 6),
+    ]
+    assert get_bounds(
+        sort_and_cap_spans(spans, SpanRankingMethod.UNIGRAM_LOGPROB_SUM, 4)
+    ) == [(0, 2), (5, 9), (5, 7), (5, 6)]
+    # Spans tied on rank and start keep their input order
+    first_tied_span = make_span(5, 7)
+    second_tied_span = make_span(5, 7)
+    earlier_span = make_span(0, 1)
+    selected_spans = sort_and_cap_spans(
+        [first_tied_span, second_tied_span, earlier_span], SpanRankingMethod.LENGTH, 3
+    )
+    assert [id(span) for span in selected_spans] == [
+        id(earlier_span),
+        id(first_tied_span),
+        id(second_tied_span),
+    ]
+
+
+def test_count_weighted_length_prefers_rare_spans() -> None:
+    common_long_span = make_span(0, 6, count=63)
+    rare_short_span = make_span(10, 12, count=1)
+    spans = [common_long_span, rare_short_span]
+
+    # 6 / log2(64) = 1 is worse than 2 / log2(2) = 2
+    assert sort_and_cap_spans(spans, SpanRankingMethod.COUNT_WEIGHTED_LENGTH, 1) == [
+        rare_short_span
+    ]
+    assert sort_and_cap_spans(spans, SpanRankingMethod.LENGTH, 1) == [common_long_span]
+
+
+def test_count_weighted_length_treats_a_zero_count_as_one() -> None:
+    spans = [make_span(0, 2, count=0), make_span(10, 13, count=1)]
+
+    assert get_bounds(
+        sort_and_cap_spans(spans, SpanRankingMethod.COUNT_WEIGHTED_LENGTH, 1)
+    ) == [(10, 13)]
+
+
+def test_overlap_suppressed_skips_spans_that_share_tokens() -> None:
+    spans = [
+        make_span(0, 4),
+        make_span(2, 5),
+        make_span(4, 6),
+        make_span(5, 9),
+        make_span(9, 10),
+    ]
+
+    # (0, 4) and (5, 9) are the longest, (2, 5) and (4, 6) overlap them, and (9, 10) only touches (5, 9)
+    assert get_bounds(
+        sort_and_cap_spans(spans, SpanRankingMethod.OVERLAP_SUPPRESSED, 10)
+    ) == [(0, 4), (5, 9), (9, 10)]
+    # The tie between the two longest spans goes to the first
+    assert get_bounds(
+        sort_and_cap_spans(spans, SpanRankingMethod.OVERLAP_SUPPRESSED, 1)
+    ) == [(0, 4)]
+    assert get_bounds(
+        sort_and_cap_spans(spans, SpanRankingMethod.OVERLAP_SUPPRESSED, 2)
+    ) == [(0, 4), (5, 9)]
+
+
+def test_overlap_suppressed_never_selects_overlapping_spans() -> None:
+    rng = random.Random(0)
+
+    for _ in range(200):
+        spans = []
+        for _ in range(rng.randrange(1, 30)):
+            left = rng.randrange(0, 20)
+            spans.append(make_span(left, left + rng.randrange(1, 6)))
+        maximum_num_spans = rng.randrange(1, 10)
+
+        selected_spans = sort_and_cap_spans(
+            spans, SpanRankingMethod.OVERLAP_SUPPRESSED, maximum_num_spans
+        )
+
+        assert 0 < len(selected_spans) <= maximum_num_spans
+        for previous_span, span in zip(selected_spans, selected_spans[1:]):
+            assert previous_span["r"] <= span["l"]
+
+        # The longest span is always picked first, so it's always kept
+        longest_length = max(span["length"] for span in spans)
+        assert any(span["length"] == longest_length for span in selected_spans)
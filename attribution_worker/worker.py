@@ -1,22 +1,53 @@
+import asyncio
+import json
 import logging
 import os
 
 from infini_gram_processor.index_mappings import AvailableInfiniGramIndexId
-from infini_gram_processor.processor import InfiniGramProcessor
+from infini_gram_processor.processor_registry import get_infini_gram_processor
+from infini_gram_processor.warmup import load_warmup_queries, warm_up_processor
+from infinigram_api_shared.cache.cache_codec import get_cache_codec
+from infinigram_api_shared.saq.attribution_events import AttributionEvent
 from infinigram_api_shared.saq.queue_utils import (
+    AttributionPriority,
+    get_attribute_batch_job_name_for_index,
     get_attribute_job_name_for_index,
     get_queue_name,
 )
-from saq import Queue
-from saq.types import SettingsDict
+from opentelemetry import metrics
+from redis.asyncio import Redis
+from saq import Queue, Status, Worker
+from saq.types import FunctionsType, SettingsDict
+from saq.utils import now, seconds
 
 from attribution_worker.attribution_worker_context import AttributionWorkerContext
 
-from .attribution_handler import attribution_job
+from .attribution_event_stream import get_attribution_event_stream
+from .attribution_handler import (
+    AttributionJobExpiredError,
+    attribution_batch_job,
+    attribution_job,
+)
 from .config import get_config
+from .document_fetch_batcher import DocumentFetchBatcher
+from .span_document_cache import SpanDocumentCache
+from .stage_executors import create_stage_executors, shutdown_stage_executors
 
 config = get_config()
 
+meter = metrics.get_meter(config.application_name)
+
+job_queue_wait = meter.create_histogram(
+    "attribution_worker.job.queue_wait",
+    unit="s",
+    description="Time an attribution job waited in the queue before a worker picked it up",
+)
+job_execution = meter.create_histogram(
+    "attribution_worker.job.execution",
+    unit="s",
+    description="Time a worker spent processing an attribution job",
+)
+
 try:
     assigned_index = os.getenv("ASSIGNED_INDEX")
     assigned_index_enum = AvailableInfiniGramIndexId(assigned_index)
@@ -36,6 +67,27 @@ queue = Queue.from_url(
         index_id=assigned_index_enum, base_queue_name=config.attribution_queue_name
     ),
 )
+bulk_queue = Queue.from_url(
+    config.attribution_queue_url,
+    name=get_queue_name(
+        index_id=assigned_index_enum,
+        base_queue_name=config.attribution_queue_name,
+        priority=AttributionPriority.BULK,
+    ),
+)
+
+functions: FunctionsType[AttributionWorkerContext] = [
+    (get_attribute_job_name_for_index(assigned_index_enum), attribution_job),  # type: ignore[list-item] # The type for this isn't general enough to work with our fns
+    (
+        get_attribute_batch_job_name_for_index(assigned_index_enum),
+        attribution_batch_job,
+    ),
+]
+
+
+class BulkWorker(Worker[AttributionWorkerContext]):
+    # The main worker owns the process's signal handlers and stops this worker when it shuts down
+    SIGNALS = []
 
 
 async def startup(ctx: AttributionWorkerContext) -> None:
@@ -43,18 +95,144 @@ async def startup(ctx: AttributionWorkerContext) -> None:
         "Worker starting up for index %s", assigned_index_enum.value
     )
 
-    ctx["infini_gram_processor"] = InfiniGramProcessor(assigned_index_enum)
+    infini_gram_processor = get_infini_gram_processor(assigned_index_enum)
+    ctx["infini_gram_processor"] = infini_gram_processor
+    ctx["stage_executors"] = create_stage_executors()
+    ctx["span_document_cache"] = (
+        SpanDocumentCache(
+            Redis.from_url(config.cache_url),
+            cache_codec=get_cache_codec(
+                config.cache_codec, compression_level=config.cache_compression_level
+            ),
+            expiration_seconds=config.span_cache_expiration_seconds,
+        )
+        if config.cache_url is not None
+        else None
+    )
+    ctx["document_fetch_batcher"] = DocumentFetchBatcher(
+        infini_gram_processor,
+        executors=ctx["stage_executors"],
+        max_wait_seconds=config.document_fetch_batch_wait_seconds,
+        max_spans=config.document_fetch_batch_max_spans,
+    )
+
+    # SAQ doesn't start dequeuing until startup finishes, so jobs won't land on a cold index
+    if config.is_warmup_enabled:
+        queries = (
+            load_warmup_queries(config.warmup_queries_path, config.warmup_query_limit)
+            if config.warmup_queries_path is not None
+            else []
+        )
+        await asyncio.to_thread(
+            warm_up_processor,
+            infini_gram_processor,
+            queries=queries,
+            prefault_pages_per_file=config.warmup_prefault_pages_per_file,
+        )
+
+    ctx["priority"] = AttributionPriority.INTERACTIVE
+
+    # Bulk jobs get their own, smaller set of job slots and stage executors, so they can never take engine threads away from interactive jobs
+    bulk_stage_executors = create_stage_executors(
+        engine_thread_pool_size=config.bulk_engine_thread_pool_size,
+        post_processing_thread_pool_size=config.bulk_post_processing_thread_pool_size,
+        thread_name_prefix="attribution-bulk",
+    )
+    bulk_worker = BulkWorker(
+        bulk_queue,
+        functions=functions,
+        concurrency=config.bulk_job_concurrency,
+        before_process=before_process,
+        after_process=after_process,
+    )
+    bulk_worker.context.update(
+        {
+            "infini_gram_processor": ctx["infini_gram_processor"],
+            "stage_executors": bulk_stage_executors,
+            "span_document_cache": ctx["span_document_cache"],
+            # Bulk fetches are grouped separately so they run on the bulk fetch executor
+            "document_fetch_batcher": DocumentFetchBatcher(
+                infini_gram_processor,
+                executors=bulk_stage_executors,
+                max_wait_seconds=config.document_fetch_batch_wait_seconds,
+                max_spans=config.document_fetch_batch_max_spans,
+            ),
+            "priority": AttributionPriority.BULK,
+        }
+    )
+    ctx["bulk_worker"] = bulk_worker
+    ctx["bulk_worker_task"] = asyncio.create_task(bulk_worker.start())
 
     logging.getLogger().info(
         "Worker finished starting up for index %s", assigned_index_enum.value
     )
 
 
+async def shutdown(ctx: AttributionWorkerContext) -> None:
+    await ctx["bulk_worker"].stop()
+    await ctx["bulk_worker_task"]
+
+    shutdown_stage_executors(ctx["bulk_worker"].context["stage_executors"])
+    shutdown_stage_executors(ctx["stage_executors"])
+
+    span_document_cache = ctx.get("span_document_cache")
+    if span_document_cache is not None:
+        await span_document_cache.cache.aclose()
+
+
+async def before_process(ctx: AttributionWorkerContext) -> None:
+    job = ctx.get("job")
+    if job is not None:
+        job_queue_wait.record(
+            seconds(job.started - job.queued),
+            attributes={
+                "index": assigned_index_enum.value,
+                "priority": ctx["priority"].value,
+            },
+        )
+
+
+async def after_process(ctx: AttributionWorkerContext) -> None:
+    job = ctx.get("job")
+    if job is not None:
+        job_execution.record(
+            seconds(now() - job.started),
+            attributes={
+                "index": assigned_index_enum.value,
+                "priority": ctx["priority"].value,
+                "status": job.status.value,
+            },
+        )
+
+        await _publish_job_outcome(ctx)
+
+
+async def _publish_job_outcome(ctx: AttributionWorkerContext) -> None:
+    # SAQ saves the job's result before calling after_process, so a client that sees "done" can also read it from the job
+    job = ctx.get("job")
+    event_stream = get_attribution_event_stream(job)
+    if job is None or event_stream is None:
+        return
+
+    if job.status == Status.COMPLETE:
+        await event_stream.publish([(AttributionEvent.DONE, job.result)])
+    elif job.status in (Status.FAILED, Status.ABORTED):
+        reason = (
+            "expired"
+            if isinstance(ctx.get("exception"), AttributionJobExpiredError)
+            else job.status.value
+        )
+        await event_stream.publish(
+            [(AttributionEvent.ERROR, json.dumps({"reason": reason}))]
+        )
+
+
 settings = SettingsDict(
     queue=queue,
-    functions=[
-        (get_attribute_job_name_for_index(assigned_index_enum), attribution_job)  # type: ignore[list-item] # The type for this isn't general enough to work with our fns
-    ],
+    functions=functions,
     startup=startup,
-    concurrency=1,
+    shutdown=shutdown,
+    before_process=before_process,
+    after_process=after_process,
+    concurrency=config.job_concurrency,
 )
@@ -0,0 +1,4 @@
+import os
+
+# Importing attribution_worker builds its SAQ settings, which need an index to serve
+os.environ.setdefault("ASSIGNED_INDEX", "olmo-2-0325-32b")
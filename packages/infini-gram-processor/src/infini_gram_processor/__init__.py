@@ -5,5 +5,8 @@ from .infini_gram_engine_exception import (
 )
 from .models.camel_case_model import CamelCaseModel as CamelCaseModel
 from .processor import InfiniGramProcessor as InfiniGramProcessor
+from .processor_registry import (
+    get_infini_gram_processor as get_infini_gram_processor,
+)
 from .tokenizers.tokenizer import Tokenizer as Tokenizer
 from .tokenizers.tokenizer_factory import get_llama_2_tokenizer as get_llama_2_tokenizer
@@ -0,0 +1,91 @@
+from dataclasses import dataclass
+from itertools import accumulate, chain
+from typing import Any, Sequence
+
+
+@dataclass(frozen=True)
+class DocumentBatch:
+    """
+    The documents from one engine call, grouped by span, kept as flat columns instead of one model per document.
+
+    span_offsets[s] and span_offsets[s + 1] bound span s's documents.
+    Token ids are the engine's own lists rather than copies, so documents only turn into models when they're serialized.
+    """
+
+    # Copying into one contiguous buffer costs more than it saves when the engine hands us lists and the response needs lists
+    token_ids: Sequence[list[int]]
+    span_offsets: Sequence[int]
+    document_indexes: Sequence[int]
+    document_lengths: Sequence[int]
+    display_lengths: Sequence[int]
+    needle_offsets: Sequence[int]
+    blocked: Sequence[bool]
+    # Left as the engine's JSON so it's only parsed for documents that are returned
+    metadata: Sequence[str]
+
+    @classmethod
+    def from_engine_results(
+        cls, documents_by_span_result: Sequence[Sequence[Any]]
+    ) -> "DocumentBatch":
+        document_results = list(chain.from_iterable(documents_by_span_result))
+
+        return cls(
+            token_ids=[
+                document_result["token_ids"] for document_result in document_results
+            ],
+            span_offsets=list(
+                accumulate(
+                    (
+                        len(documents_result)
+                        for documents_result in documents_by_span_result
+                    ),
+                    initial=0,
+                )
+            ),
+            document_indexes=[
+                document_result["doc_ix"] for document_result in document_results
+            ],
+            document_lengths=[
+                document_result["doc_len"] for document_result in document_results
+            ],
+            display_lengths=[
+                document_result["disp_len"] for document_result in document_results
+            ],
+            needle_offsets=[
+                document_result["needle_offset"] for document_result in document_results
+            ],
+            blocked=[
+                document_result["blocked"] for document_result in document_results
+            ],
+            metadata=[
+                document_result["metadata"] for document_result in document_results
+            ],
+        )
+
+    @property
+    def span_count(self) -> int:
+        return len(self.span_offsets) - 1
+
+    def get_span_document_range(self, span_index: int) -> range:
+        return range(self.span_offsets[span_index], self.span_offsets[span_index + 1])
+
+    def select_spans(self, start: int, stop: int) -> "DocumentBatch":
+        """
+        Returns the documents of spans [start, stop) as their own batch, sharing this batch's token id lists.
+        """
+        first_document = self.span_offsets[start]
+        last_document = self.span_offsets[stop]
+
+        return DocumentBatch(
+            token_ids=self.token_ids[first_document:last_document],
+            span_offsets=[
+                span_offset - first_document
+                for span_offset in self.span_offsets[start : stop + 1]
+            ],
+            document_indexes=self.document_indexes[first_document:last_document],
+            document_lengths=self.document_lengths[first_document:last_document],
+            display_lengths=self.display_lengths[first_document:last_document],
+            needle_offsets=self.needle_offsets[first_document:last_document],
+            blocked=self.blocked[first_document:last_document],
+            metadata=self.metadata[first_document:last_document],
+        )
@@ -0,0 +1,45 @@
+from typing import Any, Collection
+
+import orjson
+
+
+def project_metadata(
+    metadata: dict[str, Any], fields: Collection[str]
+) -> dict[str, Any]:
+    """
+    Keeps only the given fields of a document's metadata.
+
+    Fields are dotted paths into the metadata, like "path" or "metadata.url". The kept fields stay nested the same way they were in the metadata. Fields that aren't in the metadata are left out.
+    """
+    projected_metadata: dict[str, Any] = {}
+    for field in fields:
+        *parent_keys, key = field.split(".")
+
+        source: Any = metadata
+        for parent_key in parent_keys:
+            source = source.get(parent_key) if isinstance(source, dict) else None
+
+        if not isinstance(source, dict) or key not in source:
+            continue
+
+        target = projected_metadata
+        for parent_key in parent_keys:
+            target = target.setdefault(parent_key, {})
+        target[key] = source[key]
+
+    return projected_metadata
+
+
+def parse_document_metadata(
+    raw_metadata: str | bytes, fields: Collection[str] | None = None
+) -> dict[str, Any]:
+    """
+    Parses the metadata JSON the engine returns with each document. Returns every field when fields is None.
+    """
+    # Dolma metadata can be large, and orjson parses it several times faster than the json module
+    metadata: dict[str, Any] = orjson.loads(raw_metadata)
+
+    if fields is None:
+        return metadata
+
+    return project_metadata(metadata, fields)
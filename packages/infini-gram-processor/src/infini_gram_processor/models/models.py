@@ -7,7 +7,7 @@ from infini_gram.models import (
 from infini_gram.models import (
     AttributionSpan as AttributionSpanFromEngine,
 )
-from pydantic import BaseModel, Field
+from pydantic import AliasChoices, BaseModel, Field
 
 from .camel_case_model import CamelCaseModel
 
@@ -34,6 +34,19 @@ class GetDocumentByIndexRequest(BaseModel):
 class SpanRankingMethod(StrEnum):
     LENGTH = "length"
     UNIGRAM_LOGPROB_SUM = "unigram_logprob_sum"
+    COUNT_WEIGHTED_LENGTH = "count_weighted_length"
+    OVERLAP_SUPPRESSED = "overlap_suppressed"
+
+
+class AttributionDocumentField(StrEnum):
+    """
+    The attribution document fields a request can choose to leave out of its response.
+    """
+
+    TOKEN_IDS = "token_ids"
+    TEXT = "text"
+    TEXT_LONG = "text_long"
+    TEXT_SNIPPET = "text_snippet"
 
 
 class BaseInfiniGramResponse(CamelCaseModel):
@@ -50,10 +63,18 @@ class InfiniGramCountResponse(BaseInfiniGramResponse):
 
 
 class Document(CamelCaseModel):
-    document_index: int = Field(validation_alias="doc_ix")
-    document_length: int = Field(validation_alias="doc_len")
-    display_length: int = Field(validation_alias="disp_len")
-    needle_offset: int = Field(validation_alias="needle_offset")
+    document_index: int = Field(
+        validation_alias=AliasChoices("doc_ix", "documentIndex")
+    )
+    document_length: int = Field(
+        validation_alias=AliasChoices("doc_len", "documentLength")
+    )
+    display_length: int = Field(
+        validation_alias=AliasChoices("disp_len", "displayLength")
+    )
+    needle_offset: int = Field(
+        validation_alias=AliasChoices("needle_offset", "needleOffset")
+    )
     metadata: dict[str, Any]
     token_ids: list[int]
     text: str
@@ -68,15 +89,20 @@ class InfiniGramAttributionResponse(BaseInfiniGramResponse):
 class InfiniGramSearchResponse(CamelCaseModel):
     documents: list[Document]
     total_documents: int
+    offset: int = 0
+    next_cursor: Optional[str] = None
 
 
 class AttributionDocument(Document):
+    # Requests can leave these out of the response, so they need defaults to read those responses back
+    token_ids: list[int] = []
+    text: str = ""
     display_length_long: int
     needle_offset_long: int
-    text_long: str
+    text_long: str = ""
     display_offset_snippet: int
     needle_offset_snippet: int
-    text_snippet: str
+    text_snippet: str = ""
 
 
 class AttributionSpan(CamelCaseModel):
@@ -95,3 +121,8 @@ class AttributionResponse(BaseInfiniGramResponse):
     input_tokens: Optional[Sequence[str]] = Field(
         examples=[["busy", " medieval", " streets", "."]]
     )
+
+
+class AttributionSpanDocuments(CamelCaseModel):
+    span_index: int
+    documents: list[AttributionDocument]
@@ -1,6 +1,7 @@
-import json
 import logging
 from typing import (
+    Any,
+    Collection,
     Iterable,
     Sequence,
     cast,
@@ -18,6 +19,8 @@ from transformers.tokenization_utils_base import (
     TextInput,
 )
 
+from .document_batch import DocumentBatch
+from .document_metadata import parse_document_metadata
 from .index_mappings import AvailableInfiniGramIndexId, index_mappings
 from .infini_gram_engine_exception import InfiniGramEngineException
 from .models import (
@@ -33,6 +36,13 @@ from .models.is_infini_gram_error_response import (
     TInfiniGramResponse,
     is_infini_gram_error_response,
 )
+from .processor_config import get_processor_config
+from .search_pagination import (
+    FindResult,
+    FindResultCache,
+    decode_search_cursor,
+    encode_search_cursor,
+)
 from .tokenizers.tokenizer import Tokenizer
 
 tracer = trace.get_tracer(__name__)
@@ -43,6 +53,7 @@ class InfiniGramProcessor:
     index: str
     tokenizer: Tokenizer
     infini_gram_engine: InfiniGramEngineDiff
+    find_result_cache: FindResultCache
 
     def __init__(self, index: AvailableInfiniGramIndexId):
         logger.debug("Initializing index %s", index.value)
@@ -65,6 +76,12 @@ class InfiniGramProcessor:
             vocab_size=self.tokenizer.hf_tokenizer.vocab_size,
             token_dtype=index_mapping["token_dtype"],
         )
+        processor_config = get_processor_config()
+        self.find_result_cache = FindResultCache(
+            self.index,
+            max_entries=processor_config.find_result_cache_max_entries,
+            ttl_seconds=processor_config.find_result_cache_ttl_seconds,
+        )
         logger.debug("Finished initializing processor for index %s", index.value)
 
     def tokenize(
@@ -72,9 +89,30 @@ class InfiniGramProcessor:
     ) -> list[int]:
         return self.tokenizer.tokenize(input)
 
+    def tokenize_batch(self, inputs: Sequence[TextInput]) -> list[list[int]]:
+        return self.tokenizer.tokenize_batch(inputs)
+
     def decode_tokens(self, token_ids: Iterable[int]) -> str:
         return self.tokenizer.decode_tokens(token_ids)
 
+    def decode_batch(self, token_ids_batch: Sequence[Sequence[int]]) -> list[str]:
+        return self.tokenizer.decode_batch(token_ids_batch)
+
+    def decode_token_ranges(
+        self, token_ids: Sequence[int], ranges: Sequence[tuple[int, int]]
+    ) -> list[str]:
+        return self.tokenizer.decode_token_ranges(token_ids, ranges)
+
+    def tokenize_with_offsets(
+        self, input: TextInput
+    ) -> tuple[list[int], list[tuple[int, int]]]:
+        return self.tokenizer.tokenize_with_offsets(input)
+
+    def tokenize_batch_with_offsets(
+        self, inputs: Sequence[TextInput]
+    ) -> list[tuple[list[int], list[tuple[int, int]]]]:
+        return self.tokenizer.tokenize_batch_with_offsets(inputs)
+
     def tokenize_to_list(self, input: TextInput) -> Sequence[str]:
         return self.tokenizer.tokenize_to_list(input)
 
@@ -97,9 +135,11 @@ class InfiniGramProcessor:
 
     @tracer.start_as_current_span("infini_gram_processor/count_n_gram")
     def count_n_gram(self, query: str) -> InfiniGramCountResponse:
-        tokenized_query_ids = self.tokenize(query)
+        return self.count_tokens(self.tokenize(query))
 
-        count_response = self.infini_gram_engine.count(input_ids=tokenized_query_ids)
+    @tracer.start_as_current_span("infini_gram_processor/count_tokens")
+    def count_tokens(self, input_ids: list[int]) -> InfiniGramCountResponse:
+        count_response = self.infini_gram_engine.count(input_ids=input_ids)
 
         count_result = self.__handle_error(count_response)
 
@@ -107,7 +147,12 @@ class InfiniGramProcessor:
 
     @tracer.start_as_current_span("infini_gram_processor/get_document_by_rank")
     def get_document_by_rank(
-        self, shard: int, rank: int, needle_length: int, maximum_context_length: int
+        self,
+        shard: int,
+        rank: int,
+        needle_length: int,
+        maximum_context_length: int,
+        metadata_fields: Collection[str] | None = None,
     ) -> Document:
         get_doc_by_rank_response = self.infini_gram_engine.get_doc_by_rank_2(
             s=shard,
@@ -118,7 +163,9 @@ class InfiniGramProcessor:
 
         document_result = self.__handle_error(get_doc_by_rank_response)
 
-        parsed_metadata = json.loads(document_result["metadata"])
+        parsed_metadata = parse_document_metadata(
+            document_result["metadata"], metadata_fields
+        )
         decoded_text = self.decode_tokens(document_result["token_ids"])
 
         return Document(
@@ -135,6 +182,7 @@ class InfiniGramProcessor:
     def get_documents_by_ranks(
         self,
         document_requests: Iterable[GetDocumentByRankRequest],
+        metadata_fields: Collection[str] | None = None,
     ) -> list[Document]:
         get_docs_by_ranks_response = self.infini_gram_engine.get_docs_by_ranks_2(
             requests=[
@@ -149,11 +197,15 @@ class InfiniGramProcessor:
         )
 
         document_results = self.__handle_error(get_docs_by_ranks_response)
+        decoded_texts = self.decode_batch(
+            [document_result["token_ids"] for document_result in document_results]
+        )
 
         documents = []
-        for document_result in document_results:
-            parsed_metadata = json.loads(document_result["metadata"])
-            decoded_text = self.decode_tokens(document_result["token_ids"])
+        for document_result, decoded_text in zip(document_results, decoded_texts):
+            parsed_metadata = parse_document_metadata(
+                document_result["metadata"], metadata_fields
+            )
 
             documents.append(
                 Document(
@@ -171,7 +223,12 @@ class InfiniGramProcessor:
 
     @tracer.start_as_current_span("infini_gram_processor/get_document_by_pointer")
     def get_document_by_pointer(
-        self, shard: int, pointer: int, needle_length: int, maximum_context_length: int
+        self,
+        shard: int,
+        pointer: int,
+        needle_length: int,
+        maximum_context_length: int,
+        metadata_fields: Collection[str] | None = None,
     ) -> Document:
         document_response = self.infini_gram_engine.get_doc_by_ptr_2(
             s=shard,
@@ -182,7 +239,9 @@ class InfiniGramProcessor:
 
         document_result = self.__handle_error(result=document_response)
 
-        parsed_metadata = json.loads(document_result["metadata"])
+        parsed_metadata = parse_document_metadata(
+            document_result["metadata"], metadata_fields
+        )
         decoded_text = self.decode_tokens(document_result["token_ids"])
 
         return Document(
@@ -199,22 +258,23 @@ class InfiniGramProcessor:
     def get_documents_by_pointers(
         self,
         document_request_by_span: Iterable[GetDocumentByPointerRequest],
+        # Dotted paths like "metadata.url" to keep from each document's metadata. Every field is kept when this is None.
+        metadata_fields: Collection[str] | None = None,
     ) -> list[list[Document]]:
-        get_docs_by_pointers_response = (
-            self.infini_gram_engine.get_docs_by_ptrs_2_grouped(
-                requests=[
-                    {
-                        "docs": document_request.docs,
-                        "span_ids": document_request.span_ids,
-                        "needle_len": document_request.needle_length,
-                        "max_ctx_len": document_request.maximum_context_length,
-                    }
-                    for document_request in document_request_by_span
-                ],
-            )
+        documents_by_span_result = self._get_documents_by_pointers_result(
+            document_request_by_span
         )
 
-        documents_by_span_result = self.__handle_error(get_docs_by_pointers_response)
+        # Decode every span's documents in one batch instead of one at a time
+        decoded_texts = iter(
+            self.decode_batch(
+                [
+                    document_result["token_ids"]
+                    for documents_result in documents_by_span_result
+                    for document_result in documents_result
+                ]
+            )
+        )
 
         return [
             [
@@ -223,9 +283,11 @@ class InfiniGramProcessor:
                     document_length=document_result["doc_len"],
                     display_length=document_result["disp_len"],
                     needle_offset=document_result["needle_offset"],
-                    metadata=json.loads(document_result["metadata"]),
+                    metadata=parse_document_metadata(
+                        document_result["metadata"], metadata_fields
+                    ),
                     token_ids=document_result["token_ids"],
-                    text=self.decode_tokens(document_result["token_ids"]),
+                    text=next(decoded_texts),
                     blocked=document_result["blocked"],
                 )
                 for document_result in documents_result
@@ -233,9 +295,48 @@ class InfiniGramProcessor:
             for documents_result in documents_by_span_result
         ]
 
+    @tracer.start_as_current_span(
+        "infini_gram_processor/get_document_batch_by_pointers"
+    )
+    def get_document_batch_by_pointers(
+        self,
+        document_request_by_span: Iterable[GetDocumentByPointerRequest],
+    ) -> DocumentBatch:
+        """
+        Like get_documents_by_pointers, but keeps the documents in columns instead of building a model for each one.
+
+        Text isn't decoded and metadata isn't parsed, so callers can do that only for the documents they return.
+        """
+        return DocumentBatch.from_engine_results(
+            self._get_documents_by_pointers_result(document_request_by_span)
+        )
+
+    def _get_documents_by_pointers_result(
+        self,
+        document_request_by_span: Iterable[GetDocumentByPointerRequest],
+    ) -> list[list[Any]]:
+        get_docs_by_pointers_response = (
+            self.infini_gram_engine.get_docs_by_ptrs_2_grouped(
+                requests=[
+                    {
+                        "docs": document_request.docs,
+                        "span_ids": document_request.span_ids,
+                        "needle_len": document_request.needle_length,
+                        "max_ctx_len": document_request.maximum_context_length,
+                    }
+                    for document_request in document_request_by_span
+                ],
+            )
+        )
+
+        return cast(list[list[Any]], self.__handle_error(get_docs_by_pointers_response))
+
     @tracer.start_as_current_span("infini_gram_processor/get_document_by_index")
     def get_document_by_index(
-        self, document_index: int, maximum_context_length: int
+        self,
+        document_index: int,
+        maximum_context_length: int,
+        metadata_fields: Collection[str] | None = None,
     ) -> Document:
         get_doc_by_index_response = self.infini_gram_engine.get_doc_by_ix_2(
             doc_ix=document_index,
@@ -244,7 +345,9 @@ class InfiniGramProcessor:
 
         document_result = self.__handle_error(get_doc_by_index_response)
 
-        parsed_metadata = json.loads(document_result["metadata"])
+        parsed_metadata = parse_document_metadata(
+            document_result["metadata"], metadata_fields
+        )
         decoded_text = self.decode_tokens(document_result["token_ids"])
 
         return Document(
@@ -259,7 +362,9 @@ class InfiniGramProcessor:
 
     @tracer.start_as_current_span("infini_gram_processor/get_documents_by_indexes")
     def get_documents_by_indexes(
-        self, document_requests: Iterable[GetDocumentByIndexRequest]
+        self,
+        document_requests: Iterable[GetDocumentByIndexRequest],
+        metadata_fields: Collection[str] | None = None,
     ) -> list[Document]:
         get_docs_by_indexes_response = self.infini_gram_engine.get_docs_by_ixs_2(
             requests=[
@@ -272,11 +377,15 @@ class InfiniGramProcessor:
         )
 
         document_results = self.__handle_error(get_docs_by_indexes_response)
+        decoded_texts = self.decode_batch(
+            [document_result["token_ids"] for document_result in document_results]
+        )
 
         documents = []
-        for document_result in document_results:
-            parsed_metadata = json.loads(document_result["metadata"])
-            decoded_text = self.decode_tokens(document_result["token_ids"])
+        for document_result, decoded_text in zip(document_results, decoded_texts):
+            parsed_metadata = parse_document_metadata(
+                document_result["metadata"], metadata_fields
+            )
 
             documents.append(
                 Document(
@@ -299,56 +408,74 @@ class InfiniGramProcessor:
         maximum_context_length: int,
         page: int,
         page_size: int,
+        cursor: str | None = None,
+        metadata_fields: Collection[str] | None = None,
     ) -> InfiniGramSearchResponse:
-        tokenized_query_ids = self.tokenize(search)
-        matching_documents = self.infini_gram_engine.find(input_ids=tokenized_query_ids)
+        """
+        Gets a page of the documents that contain the search.
 
-        matching_documents_result = self.__handle_error(matching_documents)
+        A cursor from a previous page's next_cursor takes precedence over page, and lets deep pages start from a known shard and rank.
+        """
+        tokenized_query_ids = self.tokenize(search)
+        find_result = self._find(tokenized_query_ids)
 
-        if (page * page_size) >= matching_documents_result["cnt"]:
-            # Pagination standard is to return an empty array if we're out of bounds
-            return InfiniGramSearchResponse(
-                documents=[], total_documents=matching_documents_result["cnt"]
-            )
+        offset = (
+            find_result.get_offset(decode_search_cursor(cursor))
+            if cursor is not None
+            else page * page_size
+        )
 
         document_requests = []
-        shard = 0
-        offset = page * page_size
-        for _ in range(page_size):
-            while (
-                offset
-                >= matching_documents_result["segment_by_shard"][shard][1]
-                - matching_documents_result["segment_by_shard"][shard][0]
-            ):
-                offset -= (
-                    matching_documents_result["segment_by_shard"][shard][1]
-                    - matching_documents_result["segment_by_shard"][shard][0]
-                )
-                shard += 1
-                if shard >= len(matching_documents_result["segment_by_shard"]):
-                    break
-            if shard >= len(matching_documents_result["segment_by_shard"]):
-                # We have reached the end of results
+        for match_offset in range(offset, offset + page_size):
+            position = find_result.get_position(match_offset)
+            if position is None:
+                # Pagination standard is to return an empty array if we're out of bounds
                 break
+
             document_requests.append(
                 GetDocumentByRankRequest(
-                    shard=shard,
-                    rank=matching_documents_result["segment_by_shard"][shard][0]
-                    + offset,
+                    shard=position.shard,
+                    rank=position.rank,
                     needle_length=len(tokenized_query_ids),
                     maximum_context_length=maximum_context_length,
                 )
             )
-            offset += 1
 
-        docs = self.get_documents_by_ranks(
-            document_requests=document_requests,
+        docs = (
+            self.get_documents_by_ranks(
+                document_requests=document_requests, metadata_fields=metadata_fields
+            )
+            if len(document_requests) > 0
+            else []
         )
 
+        next_position = find_result.get_position(offset + page_size)
+
         return InfiniGramSearchResponse(
-            documents=docs, total_documents=matching_documents_result["cnt"]
+            documents=docs,
+            total_documents=find_result.total_documents,
+            offset=offset,
+            next_cursor=encode_search_cursor(next_position)
+            if next_position is not None
+            else None,
         )
 
+    def _find(self, input_ids: list[int]) -> FindResult:
+        cached_find_result = self.find_result_cache.get(input_ids)
+        if cached_find_result is not None:
+            return cached_find_result
+
+        find_response = self.__handle_error(
+            self.infini_gram_engine.find(input_ids=input_ids)
+        )
+        find_result = FindResult.from_segments(
+            total_documents=find_response["cnt"],
+            segment_by_shard=find_response["segment_by_shard"],
+        )
+        self.find_result_cache.set(input_ids, find_result)
+
+        return find_result
+
     @tracer.start_as_current_span("infini_gram_processor/attribute")
     # Attribute doesn't return a high-level response, it just returns stuff from the engine. Use this inside a service instead of returning it directly
     def attribute(
@@ -359,8 +486,24 @@ class InfiniGramProcessor:
         minimum_span_length: int,
         maximum_frequency: int,
     ) -> InfiniGramAttributionResponse:
-        input_ids = self.tokenize(input)
+        return self.attribute_tokens(
+            input_ids=self.tokenize(input),
+            delimiters=delimiters,
+            allow_spans_with_partial_words=allow_spans_with_partial_words,
+            minimum_span_length=minimum_span_length,
+            maximum_frequency=maximum_frequency,
+        )
 
+    @tracer.start_as_current_span("infini_gram_processor/attribute_tokens")
+    # Same as attribute, for callers that have already tokenized the input
+    def attribute_tokens(
+        self,
+        input_ids: list[int],
+        delimiters: list[str],
+        allow_spans_with_partial_words: bool,
+        minimum_span_length: int,
+        maximum_frequency: int,
+    ) -> InfiniGramAttributionResponse:
         delimiter_token_ids = self.tokenizer.tokenize_attribution_delimiters(delimiters)
 
         attribute_response = self.infini_gram_engine.attribute(
@@ -6,6 +6,8 @@ class ProcessorConfig(BaseSettings):
 
     index_base_path: str = "/mnt/infinigram-array"
     vendor_base_path: str = "/app/vendor"
+    find_result_cache_max_entries: int = 1_024
+    find_result_cache_ttl_seconds: float = 300
 
 
 tokenizer_config = ProcessorConfig()
@@ -0,0 +1,128 @@
+import logging
+import os
+import resource
+import threading
+import time
+from dataclasses import dataclass
+from typing import Iterable
+
+from opentelemetry import metrics, trace
+
+from .index_mappings import AvailableInfiniGramIndexId
+from .processor import InfiniGramProcessor
+
+tracer = trace.get_tracer(__name__)
+meter = metrics.get_meter(__name__)
+logger = logging.getLogger("uvicorn.error")
+
+processor_init_duration = meter.create_histogram(
+    "infini_gram_processor.init.duration",
+    unit="s",
+    description="Time taken to build an InfiniGramProcessor for an index",
+)
+processor_init_memory = meter.create_histogram(
+    "infini_gram_processor.init.resident_memory",
+    unit="By",
+    description="Change in resident memory while building an InfiniGramProcessor for an index",
+)
+
+
+@dataclass
+class ProcessorInitStats:
+    index: str
+    init_seconds: float
+    resident_memory_delta_bytes: int
+
+
+def _get_resident_memory_bytes() -> int:
+    try:
+        with open("/proc/self/statm") as statm:
+            resident_pages = int(statm.read().split()[1])
+
+        return resident_pages * os.sysconf("SC_PAGE_SIZE")
+    except OSError:
+        # /proc isn't available on macOS, fall back to the peak RSS which it reports in bytes
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+
+class InfiniGramProcessorRegistry:
+    """
+    Holds one InfiniGramProcessor per index for the lifetime of the process.
+
+    Building a processor attaches every shard of the index, so it should only happen once per process instead of once per request.
+    """
+
+    def __init__(self) -> None:
+        self._processors: dict[AvailableInfiniGramIndexId, InfiniGramProcessor] = {}
+        self._stats: dict[AvailableInfiniGramIndexId, ProcessorInitStats] = {}
+        self._lock = threading.Lock()
+
+    def get(self, index: AvailableInfiniGramIndexId) -> InfiniGramProcessor:
+        processor = self._processors.get(index)
+        if processor is not None:
+            return processor
+
+        with self._lock:
+            # Another thread may have finished building the processor while we waited for the lock
+            processor = self._processors.get(index)
+            if processor is None:
+                processor = self._create_processor(index)
+                self._processors[index] = processor
+
+        return processor
+
+    def load(self, indexes: Iterable[AvailableInfiniGramIndexId]) -> None:
+        for index in indexes:
+            self.get(index)
+
+    @property
+    def stats(self) -> list[ProcessorInitStats]:
+        return list(self._stats.values())
+
+    def _create_processor(
+        self, index: AvailableInfiniGramIndexId
+    ) -> InfiniGramProcessor:
+        with tracer.start_as_current_span(
+            "infini_gram_processor_registry/create_processor",
+            attributes={"index": index.value},
+        ) as span:
+            resident_memory_before = _get_resident_memory_bytes()
+            start = time.perf_counter()
+
+            processor = InfiniGramProcessor(index)
+
+            stats = ProcessorInitStats(
+                index=index.value,
+                init_seconds=time.perf_counter() - start,
+                resident_memory_delta_bytes=_get_resident_memory_bytes()
+                - resident_memory_before,
+            )
+            self._stats[index] = stats
+
+            span.set_attributes(
+                {
+                    "init_seconds": stats.init_seconds,
+                    "resident_memory_delta_bytes": stats.resident_memory_delta_bytes,
+                }
+            )
+            processor_init_duration.record(
+                stats.init_seconds, attributes={"index": index.value}
+            )
+            processor_init_memory.record(
+                stats.resident_memory_delta_bytes, attributes={"index": index.value}
+            )
+            logger.info(
+                "Initialized processor for index %s in %.2fs (resident memory delta: %d bytes)",
+                index.value,
+                stats.init_seconds,
+                stats.resident_memory_delta_bytes,
+            )
+
+            return processor
+
+
+processor_registry = InfiniGramProcessorRegistry()
+
+
+def get_infini_gram_processor(index: AvailableInfiniGramIndexId) -> InfiniGramProcessor:
+    return processor_registry.get(index)
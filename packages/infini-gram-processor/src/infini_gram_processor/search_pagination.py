@@ -0,0 +1,157 @@
+import base64
+import binascii
+import threading
+import time
+from bisect import bisect_right
+from collections import OrderedDict
+from dataclasses import dataclass
+from itertools import accumulate
+from typing import Sequence
+
+from opentelemetry import metrics
+
+meter = metrics.get_meter(__name__)
+
+find_result_cache_hits = meter.create_counter(
+    "infini_gram_processor.find_result_cache.hits",
+    description="Searches that reused a cached find result instead of calling the engine",
+)
+find_result_cache_misses = meter.create_counter(
+    "infini_gram_processor.find_result_cache.misses",
+    description="Searches that had to call the engine's find",
+)
+
+
+class InvalidSearchCursorError(Exception):
+    pass
+
+
+@dataclass(frozen=True)
+class SearchPosition:
+    shard: int
+    rank: int
+
+
+@dataclass(frozen=True)
+class FindResult:
+    """
+    Where an n-gram's matches are in each shard's suffix array.
+
+    Matches are numbered across shards in order, so a match's offset is the number of matches in earlier shards plus its place in its own shard.
+    """
+
+    total_documents: int
+    segment_by_shard: Sequence[tuple[int, int]]
+    # shard_offsets[shard] is the offset of the shard's first match
+    shard_offsets: Sequence[int]
+
+    @classmethod
+    def from_segments(
+        cls, total_documents: int, segment_by_shard: Sequence[tuple[int, int]]
+    ) -> "FindResult":
+        segment_lengths = [end - start for start, end in segment_by_shard]
+
+        return cls(
+            total_documents=total_documents,
+            segment_by_shard=[(start, end) for start, end in segment_by_shard],
+            shard_offsets=list(accumulate(segment_lengths, initial=0))[:-1],
+        )
+
+    @property
+    def match_count(self) -> int:
+        if len(self.segment_by_shard) == 0:
+            return 0
+
+        last_start, last_end = self.segment_by_shard[-1]
+        return self.shard_offsets[-1] + last_end - last_start
+
+    def get_position(self, offset: int) -> SearchPosition | None:
+        """
+        Finds the shard and rank of the match at offset, or None if there are fewer matches than that.
+        """
+        if offset < 0 or offset >= self.match_count:
+            return None
+
+        # Empty shards share their offset with the next shard, so bisect_right skips past them
+        shard = bisect_right(self.shard_offsets, offset) - 1
+        return SearchPosition(
+            shard=shard,
+            rank=self.segment_by_shard[shard][0] + offset - self.shard_offsets[shard],
+        )
+
+    def get_offset(self, position: SearchPosition) -> int:
+        if not 0 <= position.shard < len(self.segment_by_shard):
+            raise InvalidSearchCursorError("The cursor's shard isn't in this search")
+
+        start, end = self.segment_by_shard[position.shard]
+        if not start <= position.rank < end:
+            raise InvalidSearchCursorError("The cursor's rank isn't in this search")
+
+        return self.shard_offsets[position.shard] + position.rank - start
+
+
+def encode_search_cursor(position: SearchPosition) -> str:
+    return (
+        base64.urlsafe_b64encode(f"{position.shard}:{position.rank}".encode())
+        .decode()
+        .rstrip("=")
+    )
+
+
+def decode_search_cursor(cursor: str) -> SearchPosition:
+    try:
+        decoded_cursor = base64.urlsafe_b64decode(
+            cursor + "=" * (-len(cursor) % 4)
+        ).decode()
+        shard, rank = decoded_cursor.split(":")
+        return SearchPosition(shard=int(shard), rank=int(rank))
+    except (binascii.Error, UnicodeDecodeError, ValueError) as ex:
+        raise InvalidSearchCursorError("The search cursor is malformed") from ex
+
+
+class FindResultCache:
+    """
+    A small LRU cache of find results keyed by the query's token ids.
+
+    Paging through a search asks for the same find result on every page, so keeping it for a few minutes means only the first page calls the engine.
+    """
+
+    def __init__(self, index: str, max_entries: int, ttl_seconds: float):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+
+        self._entries: OrderedDict[tuple[int, ...], tuple[float, FindResult]] = (
+            OrderedDict()
+        )
+        self._lock = threading.Lock()
+        self._attributes = {"index": index}
+
+    def get(self, token_ids: Sequence[int]) -> FindResult | None:
+        key = tuple(token_ids)
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, find_result = entry
+                if expires_at > time.monotonic():
+                    self._entries.move_to_end(key)
+                    find_result_cache_hits.add(1, attributes=self._attributes)
+                    return find_result
+
+                del self._entries[key]
+
+        find_result_cache_misses.add(1, attributes=self._attributes)
+        return None
+
+    def set(self, token_ids: Sequence[int], find_result: FindResult) -> None:
+        if self.max_entries <= 0:
+            return
+
+        key = tuple(token_ids)
+
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl_seconds, find_result)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
@@ -0,0 +1,148 @@
+import codecs
+import json
+import re
+from itertools import accumulate
+from typing import List, Optional, Sequence, Tuple, cast
+
+from transformers import PreTrainedTokenizer, PreTrainedTokenizerFast
+from transformers.models.gpt2.tokenization_gpt2 import bytes_to_unicode
+
+_METASPACE = "\u2581"
+_BYTE_FALLBACK_TOKEN = re.compile(r"<0x([0-9A-F]{2})>")
+
+# The decoder used by SentencePiece-based tokenizers like Llama 2's
+_METASPACE_DECODER = {
+    "type": "Sequence",
+    "decoders": [
+        {"type": "Replace", "pattern": {"String": _METASPACE}, "content": " "},
+        {"type": "ByteFallback"},
+        {"type": "Fuse"},
+        {"type": "Strip", "content": " ", "start": 1, "stop": 0},
+    ],
+}
+
+
+class TokenRangeDecoder:
+    """
+    Decodes several ranges of the same token sequence with a single UTF-8 decode of the whole sequence.
+
+    This only works for decoders that turn each token into a fixed byte string, so use from_hf_tokenizer to check if a tokenizer is supported.
+    """
+
+    token_bytes: List[Optional[bytes]]
+    strip_leading_space: bool
+
+    def __init__(
+        self, token_bytes: List[Optional[bytes]], strip_leading_space: bool
+    ) -> None:
+        self.token_bytes = token_bytes
+        self.strip_leading_space = strip_leading_space
+
+    @classmethod
+    def from_hf_tokenizer(
+        cls, hf_tokenizer: PreTrainedTokenizer | PreTrainedTokenizerFast
+    ) -> Optional["TokenRangeDecoder"]:
+        if (
+            not isinstance(hf_tokenizer, PreTrainedTokenizerFast)
+            or hf_tokenizer.clean_up_tokenization_spaces
+        ):
+            return None
+
+        decoder = json.loads(hf_tokenizer.backend_tokenizer.to_str())["decoder"]
+        tokens = hf_tokenizer.convert_ids_to_tokens(list(range(len(hf_tokenizer))))
+
+        token_bytes: List[Optional[bytes]]
+        if decoder is not None and decoder["type"] == "ByteLevel":
+            byte_decoder = {
+                character: byte for byte, character in bytes_to_unicode().items()
+            }
+            token_bytes = [
+                bytes(byte_decoder[character] for character in token)
+                if all(character in byte_decoder for character in token)
+                else None
+                for token in tokens
+            ]
+            strip_leading_space = False
+        elif decoder == _METASPACE_DECODER:
+            token_bytes = []
+            for token in tokens:
+                byte_fallback = _BYTE_FALLBACK_TOKEN.fullmatch(token)
+                token_bytes.append(
+                    bytes([int(byte_fallback.group(1), 16)])
+                    if byte_fallback is not None
+                    else token.replace(_METASPACE, " ").encode("utf-8")
+                )
+            strip_leading_space = True
+        else:
+            return None
+
+        # HF decodes added tokens (like EOS) outside of the decoder, so we leave those to it
+        for added_token_id in hf_tokenizer.added_tokens_decoder:
+            if added_token_id < len(token_bytes):
+                token_bytes[added_token_id] = None
+
+        return cls(token_bytes=token_bytes, strip_leading_space=strip_leading_space)
+
+    def decode_ranges(
+        self, token_ids: Sequence[int], ranges: Sequence[Tuple[int, int]]
+    ) -> Optional[List[str]]:
+        """
+        Returns the decoded text of each [start, stop) range, or None if the ranges can't be decoded exactly like HF would.
+        """
+        try:
+            pieces = [self.token_bytes[token_id] for token_id in token_ids]
+        except IndexError:
+            return None
+        if None in pieces:
+            return None
+
+        # Slicing clamps out of range bounds, so we leave those ranges to HF
+        if any(
+            not 0 <= boundary <= len(token_ids)
+            for bounds in ranges
+            for boundary in bounds
+        ):
+            return None
+
+        byte_pieces = cast(List[bytes], pieces)
+        byte_offsets = [0, *accumulate(len(piece) for piece in byte_pieces)]
+        encoded_text = b"".join(byte_pieces)
+
+        # Decode incrementally so we know the character offset of every range boundary
+        utf8_decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        text_parts: List[str] = []
+        character_offsets: dict[int, int] = {}
+        text_length = 0
+        previous_byte_offset = 0
+        for boundary in sorted({boundary for bounds in ranges for boundary in bounds}):
+            byte_offset = byte_offsets[boundary]
+            text_part = utf8_decoder.decode(
+                encoded_text[previous_byte_offset:byte_offset]
+            )
+            pending_bytes, _ = utf8_decoder.getstate()
+            if pending_bytes:
+                # A character is split by this boundary, HF would decode each side of it to replacement characters
+                return None
+
+            text_parts.append(text_part)
+            text_length += len(text_part)
+            character_offsets[boundary] = text_length
+            previous_byte_offset = byte_offset
+
+        text_parts.append(
+            utf8_decoder.decode(encoded_text[previous_byte_offset:], final=True)
+        )
+        text = "".join(text_parts)
+
+        if "\ufffd" in text:
+            # Decoders don't all replace invalid UTF-8 the same way, so let HF handle it
+            return None
+
+        decoded_ranges: List[str] = []
+        for start, stop in ranges:
+            decoded_range = text[character_offsets[start] : character_offsets[stop]]
+            if self.strip_leading_space and decoded_range.startswith(" "):
+                decoded_range = decoded_range[1:]
+            decoded_ranges.append(decoded_range)
+
+        return decoded_ranges
@@ -1,5 +1,6 @@
+from functools import cached_property
 from os import PathLike
-from typing import Iterable, List, Sequence, Tuple, cast
+from typing import Iterable, List, Optional, Sequence, Tuple, cast
 
 from transformers import (
     AutoTokenizer,
@@ -12,6 +13,8 @@ from transformers.tokenization_utils_base import (
     TextInput,
 )
 
+from .token_range_decoder import TokenRangeDecoder
+
 
 class Tokenizer:
     hf_tokenizer: PreTrainedTokenizer | PreTrainedTokenizerFast
@@ -47,23 +50,108 @@ class Tokenizer:
         encoded_query: List[int] = self.hf_tokenizer.encode(input)  # pyright: ignore[reportUnknownMemberType]
         return encoded_query
 
+    def tokenize_batch(self, inputs: Sequence[TextInput]) -> List[List[int]]:
+        """
+        Tokenizes many inputs in one call. Each result matches tokenize for that input.
+
+        Fast tokenizers encode a batch in parallel in Rust, which is much quicker than tokenizing the inputs one at a time.
+        """
+        if len(inputs) == 0:
+            return []
+
+        encoded_batch = self.hf_tokenizer(list(inputs))
+        return cast(List[List[int]], encoded_batch.data.get("input_ids", []))  # pyright: ignore [reportUnknownMemberType]
+
     def decode_tokens(self, token_ids: Iterable[int]) -> str:
         return self.hf_tokenizer.decode(token_ids)
 
-    def tokenize_to_list(self, input: TextInput) -> Sequence[str]:
+    def decode_batch(self, token_ids_batch: Sequence[Sequence[int]]) -> List[str]:
+        """
+        Decodes many token sequences in one call. Each result matches decode_tokens for that sequence.
+
+        HF's batch_decode just calls decode in a Python loop, so we go straight to the Rust tokenizer's decode_batch which decodes in parallel without holding the GIL.
+        """
+        if not isinstance(self.hf_tokenizer, PreTrainedTokenizerFast):
+            return self.hf_tokenizer.batch_decode(token_ids_batch)
+
+        decoded_batch: List[str] = self.hf_tokenizer.backend_tokenizer.decode_batch(
+            [list(token_ids) for token_ids in token_ids_batch],
+            skip_special_tokens=False,
+        )
+
+        if self.hf_tokenizer.clean_up_tokenization_spaces:
+            return [
+                self.hf_tokenizer.clean_up_tokenization(decoded)
+                for decoded in decoded_batch
+            ]
+
+        return decoded_batch
+
+    @cached_property
+    def _token_range_decoder(self) -> Optional[TokenRangeDecoder]:
+        return TokenRangeDecoder.from_hf_tokenizer(self.hf_tokenizer)
+
+    def decode_token_ranges(
+        self, token_ids: Sequence[int], ranges: Sequence[Tuple[int, int]]
+    ) -> List[str]:
+        """
+        Decodes several [start, stop) ranges of the same token sequence. Each result matches decode_tokens(token_ids[start:stop]).
+
+        When the tokenizer supports it, the sequence is decoded once and every range is sliced out of that text.
+        """
+        if self._token_range_decoder is not None:
+            decoded_ranges = self._token_range_decoder.decode_ranges(token_ids, ranges)
+            if decoded_ranges is not None:
+                return decoded_ranges
+
+        return self.decode_batch([token_ids[start:stop] for start, stop in ranges])
+
+    def tokenize_with_offsets(
+        self, input: TextInput
+    ) -> Tuple[List[int], List[Tuple[int, int]]]:
+        """
+        Tokenizes the input and returns each token's (start, stop) character offsets into it along with the token ids.
+        """
         tokenized_input = self.hf_tokenizer(input, return_offsets_mapping=True)
 
-        offset_mapping = tokenized_input.data.get("offset_mapping", [])  # pyright: ignore [reportUnknownMemberType]
-        # This is to fix a corner case: when input begins with a number, the token ids will begin with [29871 (whitespace), 29896, ...] with offset_mapping being [(0, 1), (0, 1), ...]
-        if len(offset_mapping) > 1:
-            if offset_mapping[0][1] > offset_mapping[1][0]:
-                offset_mapping[0] = (offset_mapping[0][0], offset_mapping[1][0])
+        input_ids = cast(List[int], tokenized_input.data.get("input_ids", []))  # pyright: ignore [reportUnknownMemberType]
+        offset_mapping = cast(
+            List[Tuple[int, int]],
+            tokenized_input.data.get("offset_mapping", []),  # pyright: ignore [reportUnknownMemberType]
+        )
+
+        return input_ids, _fix_leading_offset(offset_mapping)
+
+    def tokenize_batch_with_offsets(
+        self, inputs: Sequence[TextInput]
+    ) -> List[Tuple[List[int], List[Tuple[int, int]]]]:
+        """
+        Tokenizes many inputs in one call. Each result matches tokenize_with_offsets for that input.
+        """
+        if len(inputs) == 0:
+            return []
+
+        tokenized_batch = self.hf_tokenizer(list(inputs), return_offsets_mapping=True)
+
+        input_ids_batch = cast(
+            List[List[int]],
+            tokenized_batch.data.get("input_ids", []),  # pyright: ignore [reportUnknownMemberType]
+        )
+        offset_mapping_batch = cast(
+            List[List[Tuple[int, int]]],
+            tokenized_batch.data.get("offset_mapping", []),  # pyright: ignore [reportUnknownMemberType]
+        )
 
         return [
-            input[offset[0] : offset[1]]
-            for offset in cast(List[Tuple[(int, int)]], offset_mapping)
+            (input_ids, _fix_leading_offset(offset_mapping))
+            for input_ids, offset_mapping in zip(input_ids_batch, offset_mapping_batch)
         ]
 
+    def tokenize_to_list(self, input: TextInput) -> Sequence[str]:
+        _, offset_mapping = self.tokenize_with_offsets(input)
+
+        return [input[offset[0] : offset[1]] for offset in offset_mapping]
+
     def tokenize_attribution_delimiters(self, delimiters: Iterable[str]) -> List[int]:
         """
         A method made specifically to tokenize delimiters for attribution uses.
@@ -82,10 +170,22 @@ class Tokenizer:
             else:
                 non_mapped_delimiters.append(delimiter)
 
-        encoded_delimiters += (
-            self.hf_tokenizer.encode(non_mapped_delimiters)  # pyright: ignore[reportUnknownMemberType]
-            if len(non_mapped_delimiters) > 0
-            else []
-        )
+        # Passing the list to encode would treat it as one pre-tokenized input (or a text pair), so each delimiter is encoded on its own
+        encoded_delimiters += [
+            token_id
+            for token_ids in self.tokenize_batch(non_mapped_delimiters)
+            for token_id in token_ids
+        ]
 
         return encoded_delimiters
+
+
+def _fix_leading_offset(
+    offset_mapping: List[Tuple[int, int]],
+) -> List[Tuple[int, int]]:
+    # This is to fix a corner case: when input begins with a number, the token ids will begin with [29871 (whitespace), 29896, ...] with offset_mapping being [(0, 1), (0, 1), ...]
+    if len(offset_mapping) > 1:
+        if offset_mapping[0][1] > offset_mapping[1][0]:
+            offset_mapping[0] = (offset_mapping[0][0], offset_mapping[1][0])
+
+    return offset_mapping
@@ -0,0 +1,174 @@
+import json
+import logging
+import mmap
+import os
+import resource
+import time
+from dataclasses import dataclass
+from glob import glob
+from pathlib import Path
+from typing import Iterable
+
+from opentelemetry import trace
+
+from .index_mappings import AvailableInfiniGramIndexId, index_mappings
+from .models import GetDocumentByPointerRequest
+from .processor import InfiniGramProcessor
+
+tracer = trace.get_tracer(__name__)
+logger = logging.getLogger("uvicorn.error")
+
+_WARMUP_DELIMITERS = ["\n", "."]
+_WARMUP_MAXIMUM_FREQUENCY = 10
+_WARMUP_MAXIMUM_DOCUMENTS_PER_SPAN = 10
+_WARMUP_MAXIMUM_CONTEXT_LENGTH = 250
+
+# The suffix array files are what every query binary searches through
+_PREFAULT_FILE_GLOB = "table.*"
+
+
+@dataclass
+class WarmupResult:
+    index: str
+    duration_seconds: float
+    queries_replayed: int
+    pages_prefaulted: int
+    page_faults: int
+
+
+def load_warmup_queries(path: str, limit: int) -> list[str]:
+    """
+    Loads a corpus of representative queries to replay during warm-up.
+
+    The file should be a JSON list of strings or of objects with a "response" field, like load-test/bailey100.json.
+    """
+    with open(path) as queries_file:
+        entries = json.load(queries_file)
+
+    queries = [
+        entry if isinstance(entry, str) else entry["response"] for entry in entries
+    ]
+
+    return queries[:limit]
+
+
+def _get_page_fault_count() -> int:
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    return usage.ru_minflt + usage.ru_majflt
+
+
+def _get_index_dirs(index: AvailableInfiniGramIndexId) -> list[str]:
+    index_dir = index_mappings[index.value]["index_dir"]
+    index_dir_diff = index_mappings[index.value]["index_dir_diff"]
+
+    return [
+        *([index_dir] if isinstance(index_dir, str) else index_dir),
+        *([index_dir_diff] if isinstance(index_dir_diff, str) else index_dir_diff),
+    ]
+
+
+def prefault_file(path: str, pages: int) -> int:
+    """
+    Touches `pages` evenly spaced pages of a file so they're in the page cache.
+
+    Evenly spaced pages are the midpoints a binary search visits first, so this pre-faults the top levels of every search through the file.
+    """
+    file_size = os.path.getsize(path)
+    if file_size == 0 or pages <= 0:
+        return 0
+
+    total_pages = (file_size + mmap.PAGESIZE - 1) // mmap.PAGESIZE
+    pages_to_touch = min(pages, total_pages)
+
+    with (
+        open(path, "rb") as file,
+        mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped_file,
+    ):
+        for i in range(pages_to_touch):
+            page = i * total_pages // pages_to_touch
+            # Reading a byte is enough to fault the whole page in
+            _ = mapped_file[page * mmap.PAGESIZE]
+
+    return pages_to_touch
+
+
+def prefault_index(index: AvailableInfiniGramIndexId, pages_per_file: int) -> int:
+    touched_pages = 0
+    for index_dir in _get_index_dirs(index):
+        for path in sorted(glob(str(Path(index_dir) / _PREFAULT_FILE_GLOB))):
+            touched_pages += prefault_file(path, pages_per_file)
+
+    return touched_pages
+
+
+@tracer.start_as_current_span("infini_gram_processor/warm_up_processor")
+def warm_up_processor(
+    processor: InfiniGramProcessor,
+    queries: Iterable[str],
+    prefault_pages_per_file: int = 0,
+) -> WarmupResult:
+    """
+    Pulls an index's hot pages into the page cache before it starts taking real traffic.
+
+    Replaying queries touches the same suffix array, token, and metadata regions that attribution requests will.
+    """
+    start = time.perf_counter()
+    page_faults_before = _get_page_fault_count()
+
+    pages_prefaulted = (
+        prefault_index(
+            AvailableInfiniGramIndexId(processor.index), prefault_pages_per_file
+        )
+        if prefault_pages_per_file > 0
+        else 0
+    )
+
+    queries_replayed = 0
+    for input_ids in processor.tokenize_batch(list(queries)):
+        attribute_result = processor.attribute_tokens(
+            input_ids=input_ids,
+            delimiters=_WARMUP_DELIMITERS,
+            allow_spans_with_partial_words=False,
+            minimum_span_length=1,
+            maximum_frequency=_WARMUP_MAXIMUM_FREQUENCY,
+        )
+        processor.get_document_batch_by_pointers(
+            document_request_by_span=[
+                GetDocumentByPointerRequest(
+                    docs=span["docs"][:_WARMUP_MAXIMUM_DOCUMENTS_PER_SPAN],
+                    span_ids=attribute_result.input_token_ids[span["l"] : span["r"]],
+                    needle_length=span["length"],
+                    maximum_context_length=_WARMUP_MAXIMUM_CONTEXT_LENGTH,
+                )
+                for span in attribute_result.spans
+            ]
+        )
+        queries_replayed += 1
+
+    result = WarmupResult(
+        index=processor.index,
+        duration_seconds=time.perf_counter() - start,
+        queries_replayed=queries_replayed,
+        pages_prefaulted=pages_prefaulted,
+        page_faults=_get_page_fault_count() - page_faults_before,
+    )
+
+    trace.get_current_span().set_attributes(
+        {
+            "index": result.index,
+            "duration_seconds": result.duration_seconds,
+            "queries_replayed": result.queries_replayed,
+            "pages_prefaulted": result.pages_prefaulted,
+            "page_faults": result.page_faults,
+        }
+    )
+    logger.info(
+        "Warmed up index %s in %.2fs: replayed %d queries, pre-faulted %d pages, %d page faults",
+        result.index,
+        result.duration_seconds,
+        result.queries_replayed,
+        result.pages_prefaulted,
+        result.page_faults,
+    )
+
+    return result
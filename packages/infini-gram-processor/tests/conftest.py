@@ -0,0 +1,7 @@
+import os
+from pathlib import Path
+
+# The tokenizers are loaded from the repo's vendor directory unless the environment points somewhere else
+os.environ.setdefault(
+    "VENDOR_BASE_PATH", str(Path(__file__).resolve().parents[3] / "vendor")
+)
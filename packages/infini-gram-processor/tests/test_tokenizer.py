@@ -0,0 +1,333 @@
+from typing import Callable
+
+import pytest
+from infini_gram_processor.tokenizers.token_range_decoder import TokenRangeDecoder
+from infini_gram_processor.tokenizers.tokenizer import Tokenizer
+from infini_gram_processor.tokenizers.tokenizer_factory import (
+    get_dolma_2_tokenizer,
+    get_llama_2_tokenizer,
+)
+
+SENTENCE = "Hailing a taxi in Rome is fairly easy."
+# Llama 2 splits the digits and puts a whitespace token in front of them
+LEADING_NUMBER = "123 busy medieval streets"
+# Llama 2 falls back to one token per byte for the emoji, and Dolma 2 splits characters across tokens
+MULTIBYTE = "naïve café 漢字 🤖"
+
+TEXTS = [SENTENCE, LEADING_NUMBER, "", MULTIBYTE]
+
+EXPECTED_TOKEN_IDS: dict[str, dict[str, list[int]]] = {
+    "llama-2": {
+        SENTENCE: [379, 737, 292, 263, 8818, 29875, 297, 9184, 338, 12558, 4780, 29889],
+        LEADING_NUMBER: [29871, 29896, 29906, 29941, 19587, 27690, 19756],
+        "": [],
+        MULTIBYTE: [
+            1055,
+            30085,
+            345,
+            274,
+            28059,
+            29871,
+            31652,
+            30578,
+            29871,
+            243,
+            162,
+            167,
+            153,
+        ],
+    },
+    "dolma-2": {
+        SENTENCE: [39, 14612, 264, 33605, 304, 22463, 374, 14470, 4228, 13],
+        LEADING_NUMBER: [4513, 13326, 42108, 14708],
+        "": [],
+        MULTIBYTE: [3458, 38672, 588, 53050, 6704, 120, 95, 19113, 11410, 97, 244],
+    },
+}
+
+EXPECTED_OFFSETS: dict[str, dict[str, list[tuple[int, int]]]] = {
+    "llama-2": {
+        SENTENCE: [
+            (0, 1),
+            (1, 4),
+            (4, 7),
+            (7, 9),
+            (9, 13),
+            (13, 14),
+            (14, 17),
+            (17, 22),
+            (22, 25),
+            (25, 32),
+            (32, 37),
+            (37, 38),
+        ],
+        # The whitespace token's offset is trimmed so it doesn't overlap the first digit
+        LEADING_NUMBER: [(0, 0), (0, 1), (1, 2), (2, 3), (3, 8), (8, 17), (17, 25)],
+        "": [],
+        MULTIBYTE: [
+            (0, 2),
+            (2, 3),
+            (3, 5),
+            (5, 7),
+            (7, 10),
+            (10, 11),
+            (11, 12),
+            (12, 13),
+            (13, 14),
+            (14, 15),
+            (14, 15),
+            (14, 15),
+            (14, 15),
+        ],
+    },
+    "dolma-2": {
+        SENTENCE: [
+            (0, 1),
+            (1, 7),
+            (7, 9),
+            (9, 14),
+            (14, 17),
+            (17, 22),
+            (22, 25),
+            (25, 32),
+            (32, 37),
+            (37, 38),
+        ],
+        LEADING_NUMBER: [(0, 3), (3, 8), (8, 17), (17, 25)],
+        "": [],
+        MULTIBYTE: [
+            (0, 2),
+            (2, 3),
+            (3, 5),
+            (5, 10),
+            (10, 12),
+            (11, 12),
+            (11, 12),
+            (12, 13),
+            (13, 15),
+            (14, 15),
+            (14, 15),
+        ],
+    },
+}
+
+EXPECTED_DELIMITER_IDS: dict[str, list[tuple[list[str], list[int]]]] = {
+    "llama-2": [
+        ([], []),
+        # Mapped delimiters come from the tokenizer's delimiter mapping
+        (["\n", "."], [13, 29889]),
+        (["!"], [1738]),
+        (["!", "?"], [1738, 1577]),
+        (["!", "?", ";"], [1738, 1577, 2056]),
+        (["\n", ".", "!"], [13, 29889, 1738]),
+        ([" and"], [29871, 322]),
+    ],
+    "dolma-2": [
+        ([], []),
+        (["\n", "."], [198, 13]),
+        (["!"], [0]),
+        (["!", "?"], [0, 30]),
+        (["!", "?", ";"], [0, 30, 26]),
+        (["\n", ".", "!"], [198, 13, 0]),
+        ([" and"], [323]),
+    ],
+}
+
+DOCUMENT = "Hailing a taxi in Rome is fairly easy. naïve café 漢字 🤖 streets"
+
+# Ranges of DOCUMENT's token ids and what decode_tokens gives for them
+EXPECTED_DECODED_RANGES: dict[str, list[tuple[tuple[int, int], str]]] = {
+    "llama-2": [
+        ((0, 0), ""),
+        # Llama 2 strips the leading space of ranges that start mid-document
+        ((3, 5), "a tax"),
+        ((12, 15), "naïve"),
+        # Splits the emoji's byte fallback tokens
+        ((20, 23), "\ufffd\ufffd"),
+        ((20, 25), "🤖"),
+        ((21, 26), "🤖 streets"),
+        ((0, 26), DOCUMENT),
+    ],
+    "dolma-2": [
+        ((0, 0), ""),
+        ((2, 4), " a taxi"),
+        ((10, 12), " naïve"),
+        # Split 漢 and the emoji across tokens
+        ((13, 14), " \ufffd"),
+        ((13, 16), " 漢"),
+        ((14, 17), "\ufffd\ufffd字"),
+        ((17, 20), " 🤖"),
+        ((18, 21), "\ufffd\ufffd streets"),
+        ((0, 21), DOCUMENT),
+    ],
+}
+
+# Where an EOS token is put in DOCUMENT's token ids, right after "easy.", and a range around it
+EOS_POSITION: dict[str, int] = {"llama-2": 12, "dolma-2": 10}
+EXPECTED_EOS_RANGE: dict[str, tuple[tuple[int, int], str]] = {
+    "llama-2": ((10, 14), "easy.</s> na"),
+    "dolma-2": ((8, 12), " easy.<|endoftext|> naï"),
+}
+
+TOKENIZER_FACTORIES: dict[str, Callable[[], Tokenizer]] = {
+    "llama-2": get_llama_2_tokenizer,
+    "dolma-2": get_dolma_2_tokenizer,
+}
+
+
+@pytest.fixture(params=list(TOKENIZER_FACTORIES))
+def tokenizer_name(request: pytest.FixtureRequest) -> str:
+    name: str = request.param
+    return name
+
+
+@pytest.fixture
+def tokenizer(tokenizer_name: str) -> Tokenizer:
+    return TOKENIZER_FACTORIES[tokenizer_name]()
+
+
+@pytest.mark.parametrize("text", TEXTS)
+def test_tokenize(tokenizer_name: str, tokenizer: Tokenizer, text: str) -> None:
+    assert tokenizer.tokenize(text) == EXPECTED_TOKEN_IDS[tokenizer_name][text]
+
+
+def test_tokenize_batch(tokenizer_name: str, tokenizer: Tokenizer) -> None:
+    assert tokenizer.tokenize_batch(TEXTS) == [
+        EXPECTED_TOKEN_IDS[tokenizer_name][text] for text in TEXTS
+    ]
+
+
+def test_tokenize_batch_matches_tokenize(tokenizer: Tokenizer) -> None:
+    assert tokenizer.tokenize_batch(TEXTS) == [
+        tokenizer.tokenize(text) for text in TEXTS
+    ]
+
+
+def test_tokenize_batch_with_offsets(tokenizer_name: str, tokenizer: Tokenizer) -> None:
+    assert tokenizer.tokenize_batch_with_offsets(TEXTS) == [
+        (
+            EXPECTED_TOKEN_IDS[tokenizer_name][text],
+            EXPECTED_OFFSETS[tokenizer_name][text],
+        )
+        for text in TEXTS
+    ]
+
+
+def test_tokenize_batch_with_offsets_matches_tokenize_with_offsets(
+    tokenizer: Tokenizer,
+) -> None:
+    assert tokenizer.tokenize_batch_with_offsets(TEXTS) == [
+        tokenizer.tokenize_with_offsets(text) for text in TEXTS
+    ]
+
+
+def test_batch_methods_accept_no_inputs(tokenizer: Tokenizer) -> None:
+    assert tokenizer.tokenize_batch([]) == []
+    assert tokenizer.tokenize_batch_with_offsets([]) == []
+
+
+def test_tokenize_attribution_delimiters(
+    tokenizer_name: str, tokenizer: Tokenizer
+) -> None:
+    for delimiters, expected_ids in EXPECTED_DELIMITER_IDS[tokenizer_name]:
+        assert tokenizer.tokenize_attribution_delimiters(delimiters) == expected_ids, (
+            delimiters
+        )
+
+
+def get_document_ids_with_eos(tokenizer_name: str, tokenizer: Tokenizer) -> list[int]:
+    document_ids = tokenizer.tokenize(DOCUMENT)
+    eos_position = EOS_POSITION[tokenizer_name]
+    eos_token_id: int = tokenizer.hf_tokenizer.eos_token_id
+
+    return [*document_ids[:eos_position], eos_token_id, *document_ids[eos_position:]]
+
+
+def test_decode_token_ranges(tokenizer_name: str, tokenizer: Tokenizer) -> None:
+    document_ids = tokenizer.tokenize(DOCUMENT)
+
+    for (start, stop), expected_text in EXPECTED_DECODED_RANGES[tokenizer_name]:
+        assert tokenizer.decode_token_ranges(document_ids, [(start, stop)]) == [
+            expected_text
+        ]
+        assert tokenizer.decode_tokens(document_ids[start:stop]) == expected_text
+
+
+def test_decode_token_ranges_decodes_several_ranges_at_once(
+    tokenizer_name: str, tokenizer: Tokenizer
+) -> None:
+    ranges, expected_texts = zip(*EXPECTED_DECODED_RANGES[tokenizer_name])
+
+    assert tokenizer.decode_token_ranges(
+        tokenizer.tokenize(DOCUMENT), list(ranges)
+    ) == list(expected_texts)
+
+
+def test_token_range_decoder_leaves_split_characters_to_hf(
+    tokenizer_name: str, tokenizer: Tokenizer
+) -> None:
+    token_range_decoder = TokenRangeDecoder.from_hf_tokenizer(tokenizer.hf_tokenizer)
+    assert token_range_decoder is not None
+
+    document_ids = tokenizer.tokenize(DOCUMENT)
+    for token_range, expected_text in EXPECTED_DECODED_RANGES[tokenizer_name]:
+        assert token_range_decoder.decode_ranges(document_ids, [token_range]) == (
+            None if "\ufffd" in expected_text else [expected_text]
+        ), token_range
+
+
+def test_decode_token_ranges_with_added_tokens(
+    tokenizer_name: str, tokenizer: Tokenizer
+) -> None:
+    document_ids = get_document_ids_with_eos(tokenizer_name, tokenizer)
+    (start, stop), expected_text = EXPECTED_EOS_RANGE[tokenizer_name]
+
+    assert tokenizer.decode_token_ranges(document_ids, [(start, stop)]) == [
+        expected_text
+    ]
+    assert tokenizer.decode_tokens(document_ids[start:stop]) == expected_text
+
+    # HF decodes added tokens outside of the decoder, so the decoder leaves them to it
+    token_range_decoder = TokenRangeDecoder.from_hf_tokenizer(tokenizer.hf_tokenizer)
+    assert token_range_decoder is not None
+    assert token_range_decoder.decode_ranges(document_ids, [(start, stop)]) is None
+
+
+@pytest.mark.parametrize("with_eos", [False, True])
+def test_decode_token_ranges_matches_decode_tokens(
+    tokenizer_name: str, tokenizer: Tokenizer, with_eos: bool
+) -> None:
+    document_ids = (
+        get_document_ids_with_eos(tokenizer_name, tokenizer)
+        if with_eos
+        else tokenizer.tokenize(DOCUMENT)
+    )
+
+    # Includes empty ranges and ones that go past the end of the document
+    for start in range(len(document_ids) + 2):
+        for stop in range(start, len(document_ids) + 2):
+            assert tokenizer.decode_token_ranges(document_ids, [(start, stop)]) == [
+                tokenizer.decode_tokens(document_ids[start:stop])
+            ], (start, stop)
+
+
+def test_decode_batch_matches_decode_tokens(
+    tokenizer_name: str, tokenizer: Tokenizer
+) -> None:
+    document_ids = tokenizer.tokenize(DOCUMENT)
+    document_ids_with_eos = get_document_ids_with_eos(tokenizer_name, tokenizer)
+    token_ids_batch = [
+        document_ids,
+        [],
+        document_ids_with_eos,
+        [tokenizer.hf_tokenizer.eos_token_id],
+        *(
+            document_ids[start:stop]
+            for (start, stop), _ in EXPECTED_DECODED_RANGES[tokenizer_name]
+        ),
+    ]
+
+    assert tokenizer.decode_batch(token_ids_batch) == [
+        tokenizer.decode_tokens(token_ids) for token_ids in token_ids_batch
+    ]
+    assert tokenizer.decode_batch([]) == []
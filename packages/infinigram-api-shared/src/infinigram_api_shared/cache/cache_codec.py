@@ -0,0 +1,118 @@
+import time
+import zlib
+from abc import ABC, abstractmethod
+from enum import StrEnum
+
+from opentelemetry import metrics
+
+meter = metrics.get_meter(__name__)
+
+cache_compression_ratio = meter.create_histogram(
+    "cache.compression_ratio",
+    description="Size of a cache value's JSON divided by the size of its encoded form",
+)
+cache_decode_duration = meter.create_histogram(
+    "cache.decode.duration",
+    unit="s",
+    description="Time taken to turn an encoded cache value back into JSON",
+)
+
+
+class CacheCodecName(StrEnum):
+    JSON = "json"
+    ZLIB = "zlib"
+
+
+class CacheCodec(ABC):
+    """
+    Turns the JSON we cache into the bytes stored in Redis and back.
+
+    Every encoded value starts with the codec's version byte so a reader can decode values written by any codec. That lets us change codecs without flushing the cache.
+    """
+
+    name: CacheCodecName
+    version: int
+
+    @abstractmethod
+    def _encode_payload(self, json_value: bytes) -> bytes: ...
+
+    @abstractmethod
+    def _decode_payload(self, payload: bytes) -> bytes: ...
+
+    def encode(self, json_value: str | bytes, cache_name: str) -> bytes:
+        json_bytes = (
+            json_value.encode("utf-8") if isinstance(json_value, str) else json_value
+        )
+        encoded_value = bytes([self.version]) + self._encode_payload(json_bytes)
+
+        cache_compression_ratio.record(
+            len(json_bytes) / len(encoded_value),
+            attributes={"cache": cache_name, "codec": self.name.value},
+        )
+
+        return encoded_value
+
+    def decode(self, encoded_value: bytes) -> bytes:
+        return self._decode_payload(encoded_value[1:])
+
+
+class JsonCacheCodec(CacheCodec):
+    name = CacheCodecName.JSON
+    version = 1
+
+    def _encode_payload(self, json_value: bytes) -> bytes:
+        return json_value
+
+    def _decode_payload(self, payload: bytes) -> bytes:
+        return payload
+
+
+class ZlibCacheCodec(CacheCodec):
+    name = CacheCodecName.ZLIB
+    version = 2
+
+    def __init__(self, compression_level: int = 6):
+        self.compression_level = compression_level
+
+    def _encode_payload(self, json_value: bytes) -> bytes:
+        return zlib.compress(json_value, level=self.compression_level)
+
+    def _decode_payload(self, payload: bytes) -> bytes:
+        return zlib.decompress(payload)
+
+
+_codecs_by_version: dict[int, CacheCodec] = {
+    codec.version: codec for codec in [JsonCacheCodec(), ZlibCacheCodec()]
+}
+
+
+def get_cache_codec(name: CacheCodecName, compression_level: int = 6) -> CacheCodec:
+    if name == CacheCodecName.JSON:
+        return JsonCacheCodec()
+    elif name == CacheCodecName.ZLIB:
+        return ZlibCacheCodec(compression_level=compression_level)
+    else:
+        raise ValueError(f"Unknown cache codec: {name}")
+
+
+def decode_cache_value(value: bytes, cache_name: str) -> bytes:
+    """
+    Decodes a value written by any cache codec back into JSON.
+
+    Values cached before we had codecs are plain JSON with no version byte, so they're returned as-is.
+    """
+    start = time.perf_counter()
+
+    codec = _codecs_by_version.get(value[0]) if len(value) > 0 else None
+    if codec is None:
+        # JSON always starts with a printable character, which never collides with a version byte
+        return value
+
+    json_value = codec.decode(value)
+
+    cache_decode_duration.record(
+        time.perf_counter() - start,
+        attributes={"cache": cache_name, "codec": codec.name.value},
+    )
+
+    return json_value
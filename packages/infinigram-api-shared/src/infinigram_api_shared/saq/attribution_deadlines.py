@@ -0,0 +1,39 @@
+from redis.asyncio import Redis
+
+# Longer than any attribution job can wait in a queue and run, so a job's deadline outlives the job
+ATTRIBUTION_JOB_DEADLINE_EXPIRATION_SECONDS = 600
+
+_DEADLINE_MEMBER = "deadline"
+
+
+def get_attribution_job_deadline_key(queue_name: str, job_key: str) -> str:
+    """
+    The Redis key holding the latest deadline of every caller waiting on an attribution job.
+
+    SAQ keeps the kwargs of whoever enqueued a job first, so callers that join it later push its deadline out here instead.
+    """
+    return f"attribution-job-deadline:{queue_name}:{job_key}"
+
+
+async def extend_attribution_job_deadline(
+    redis: Redis, queue_name: str, job_key: str, deadline: float
+) -> None:
+    """
+    Moves the job's deadline to deadline unless another caller already moved it later.
+    """
+    deadline_key = get_attribution_job_deadline_key(queue_name, job_key)
+
+    async with redis.pipeline(transaction=True) as pipeline:
+        # A sorted set lets Redis keep the later of the two deadlines atomically
+        pipeline.zadd(deadline_key, {_DEADLINE_MEMBER: deadline}, gt=True)
+        pipeline.expire(deadline_key, ATTRIBUTION_JOB_DEADLINE_EXPIRATION_SECONDS)
+        await pipeline.execute()
+
+
+async def get_attribution_job_deadline(
+    redis: Redis, queue_name: str, job_key: str
+) -> float | None:
+    deadline: float | None = await redis.zscore(
+        get_attribution_job_deadline_key(queue_name, job_key), _DEADLINE_MEMBER
+    )
+    return deadline
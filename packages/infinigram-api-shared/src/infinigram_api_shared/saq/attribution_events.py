@@ -0,0 +1,23 @@
+from enum import StrEnum
+
+# Long enough for a slow client to read every event of a job that ran up to its timeout
+ATTRIBUTION_EVENT_STREAM_EXPIRATION_SECONDS = 600
+
+ATTRIBUTION_EVENT_NAME_FIELD = "event"
+ATTRIBUTION_EVENT_DATA_FIELD = "data"
+
+
+class AttributionEvent(StrEnum):
+    SPANS = "spans"
+    DOCUMENTS = "documents"
+    DONE = "done"
+    ERROR = "error"
+
+
+def get_attribution_event_stream_key(job_key: str, queued: int) -> str:
+    """
+    The Redis stream a streaming attribution job publishes its progress to.
+
+    Job keys are reused by identical requests, so the time the job was queued keeps a new run from being mixed up with an older run's events.
+    """
+    return f"attribution-events:{job_key}:{queued}"
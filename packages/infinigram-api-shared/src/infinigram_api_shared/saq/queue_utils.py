@@ -1,22 +1,48 @@
+from enum import StrEnum
 from functools import lru_cache
 
 from infini_gram_processor.index_mappings import AvailableInfiniGramIndexId
 from saq import Queue
 
 _BASE_JOB_NAME = "attribute"
+_BASE_BATCH_JOB_NAME = "attribute_batch"
+
+
+class AttributionPriority(StrEnum):
+    INTERACTIVE = "interactive"
+    BULK = "bulk"
 
 
 def get_attribute_job_name_for_index(index_id: AvailableInfiniGramIndexId) -> str:
     return _BASE_JOB_NAME
 
 
-def get_queue_name(index_id: AvailableInfiniGramIndexId, base_queue_name: str) -> str:
-    return f"${base_queue_name}_${index_id.value}"
+def get_attribute_batch_job_name_for_index(
+    index_id: AvailableInfiniGramIndexId,
+) -> str:
+    return _BASE_BATCH_JOB_NAME
+
+
+def get_queue_name(
+    index_id: AvailableInfiniGramIndexId,
+    base_queue_name: str,
+    priority: AttributionPriority = AttributionPriority.INTERACTIVE,
+) -> str:
+    queue_name = f"${base_queue_name}_${index_id.value}"
+
+    # Interactive jobs keep using the original queue name so existing workers keep picking them up
+    if priority == AttributionPriority.INTERACTIVE:
+        return queue_name
+
+    return f"{queue_name}_{priority.value}"
 
 
 @lru_cache
 def get_queue_for_index(
-    queue_url: str, base_queue_name: str, index_id: AvailableInfiniGramIndexId
+    queue_url: str,
+    base_queue_name: str,
+    index_id: AvailableInfiniGramIndexId,
+    priority: AttributionPriority = AttributionPriority.INTERACTIVE,
 ) -> Queue:
-    queue_name = get_queue_name(index_id, base_queue_name)
+    queue_name = get_queue_name(index_id, base_queue_name, priority)
     return Queue.from_url(queue_url, name=queue_name)